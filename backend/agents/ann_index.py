@@ -0,0 +1,296 @@
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+    """Index of the nearest centroid (L2) for every row of ``data``."""
+    centroid_sq = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk):
+        block = data[start:start + chunk]
+        labels[start:start + chunk] = np.argmin(centroid_sq - 2.0 * block @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].astype(np.float32)
+    for _ in range(iterations):
+        labels = _assign(data, centroids)
+        counts = np.bincount(labels, minlength=k)
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        sums = np.add.reduceat(data[order], starts, axis=0)
+        used = sorted_labels[starts]
+        centroids[used] = sums / counts[used][:, None]
+        # Re-seed empty clusters from random points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+class _InvertedList:
+    __slots__ = ("rows", "codes", "size")
+
+    def __init__(self, m: int):
+        self.rows = np.empty(0, dtype=np.int64)
+        self.codes = np.empty((0, m), dtype=np.uint8)
+        self.size = 0
+
+    def extend(self, rows: np.ndarray, codes: np.ndarray):
+        needed = self.size + len(rows)
+        if needed > len(self.rows):
+            capacity = max(needed, 2 * len(self.rows), 16)
+            grown_rows = np.empty(capacity, dtype=np.int64)
+            grown_codes = np.empty((capacity, codes.shape[1]), dtype=np.uint8)
+            grown_rows[:self.size] = self.rows[:self.size]
+            grown_codes[:self.size] = self.codes[:self.size]
+            self.rows, self.codes = grown_rows, grown_codes
+        self.rows[self.size:needed] = rows
+        self.codes[self.size:needed] = codes
+        self.size = needed
+
+
+class IVFPQIndex:
+    """Inverted-file index with product-quantised residuals.
+
+    A k-means coarse quantizer splits the space into ``nlist`` cells; each
+    vector's residual to its cell centroid is encoded as ``m`` one-byte
+    sub-quantizer codes. For normalised vectors the inner product decomposes
+    as <q, centroid> + sum of per-subspace lookup-table entries, so a query
+    scores a probed cell with one table gather.
+    """
+
+    def __init__(self, dimension: int, nlist: int, m: int, ks: int = 256):
+        if dimension % m:
+            raise ValueError(f"dimension {dimension} is not divisible by m={m}")
+        self.dimension = dimension
+        self.nlist = nlist
+        self.m = m
+        self.ks = ks
+        self.dsub = dimension // m
+        self.centroids: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None  # (m, ks, dsub)
+        self.lists: List[_InvertedList] = []
+        self.size = 0
+
+    def train(self, sample: np.ndarray, iterations: int = 10, pq_sample: int = 16384):
+        self.centroids = kmeans(sample, self.nlist, iterations)
+        self.nlist = len(self.centroids)
+        # 64 points per codeword is plenty for the low-dimensional sub-quantizers
+        sample = sample[:pq_sample]
+        residuals = sample - self.centroids[_assign(sample, self.centroids)]
+        self.codebooks = np.stack([
+            kmeans(np.ascontiguousarray(residuals[:, j * self.dsub:(j + 1) * self.dsub]), self.ks, iterations, seed=j)
+            for j in range(self.m)
+        ])
+        self.ks = self.codebooks.shape[1]
+        self.lists = [_InvertedList(self.m) for _ in range(self.nlist)]
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(residuals), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _assign(residuals[:, j * self.dsub:(j + 1) * self.dsub], self.codebooks[j])
+        return codes
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        if not len(rows):
+            return
+        labels = _assign(vectors, self.centroids)
+        codes = self._encode(vectors - self.centroids[labels])
+        order = np.argsort(labels, kind="stable")
+        sorted_labels = labels[order]
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts, ends):
+            members = order[start:end]
+            self.lists[sorted_labels[start]].extend(rows[members], codes[members])
+        self.size += len(rows)
+
+    def search(
+        self, query: np.ndarray, nprobe: int, candidates: int, mask: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top ``candidates`` rows (and scores) from ``nprobe``
+        cells, only among rows set in ``mask`` if given."""
+        coarse = self.centroids @ query
+        nprobe = min(nprobe, self.nlist)
+        probe = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+        # lut[j, c] = <query subvector j, codebook j entry c>, flattened for one gather
+        lut = np.einsum("jcd,jd->jc", self.codebooks, query.reshape(self.m, self.dsub)).ravel()
+        offsets = np.arange(self.m, dtype=np.int64) * self.ks
+
+        rows, scores = [], []
+        for cell in probe:
+            inverted = self.lists[cell]
+            if not inverted.size:
+                continue
+            cell_rows = inverted.rows[:inverted.size]
+            codes = inverted.codes[:inverted.size]
+            if mask is not None:
+                # Rows added after the mask was taken are left out
+                keep = cell_rows < len(mask)
+                keep[keep] = mask[cell_rows[keep]]
+                cell_rows, codes = cell_rows[keep], codes[keep]
+                if not len(cell_rows):
+                    continue
+            rows.append(cell_rows)
+            scores.append(coarse[cell] + lut[codes.astype(np.int64) + offsets].sum(axis=1))
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows, scores = np.concatenate(rows), np.concatenate(scores)
+        if candidates < len(rows):
+            keep = np.argpartition(-scores, candidates - 1)[:candidates]
+            rows, scores = rows[keep], scores[keep]
+        return rows, scores
+
+
+class ANNIndex:
+    """Keeps an IVF-PQ index in step with a LocalVectorStore.
+
+    Below ``train_threshold`` vectors, or until the first build finishes,
+    ``search`` returns None and callers fall back to exact search. Inserts are
+    added to the live index incrementally. The index is rebuilt on a
+    background thread once the store has grown by ``rebuild_growth`` or too
+    many vectors were replaced, which also compacts stale entries; queries
+    keep using the old index until the new one is swapped in.
+
+    ``nprobe`` (cells scanned) and ``rerank`` (candidates re-scored exactly)
+    trade latency for recall.
+    """
+
+    def __init__(
+        self,
+        store,
+        nprobe: int = 16,
+        rerank: int = 100,
+        train_threshold: int = 50000,
+        rebuild_growth: float = 2.0,
+        m: int = 48,
+        train_sample: int = 100000,
+    ):
+        self.store = store
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.train_threshold = train_threshold
+        self.rebuild_growth = rebuild_growth
+        self.m = m
+        self.train_sample = train_sample
+        self._index: Optional[IVFPQIndex] = None
+        self._lock = threading.Lock()
+        self._building = False
+        self._pending_rows: List[np.ndarray] = []
+        self._indexed_rows = 0
+        self._stale = 0
+        self.rebuilds = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    def add(self, rows: List[int]):
+        if rows:
+            rows = np.asarray(rows, dtype=np.int64)
+            with self._lock:
+                if self._building:
+                    self._pending_rows.append(rows)
+                if self._index is not None:
+                    self._stale += int((rows < self._indexed_rows).sum())
+                    self._index.add(rows, self.store.take(rows))
+        self.refresh()
+
+    def refresh(self):
+        """Start a background rebuild if the index is missing or out of date."""
+        count = self.store.count
+        with self._lock:
+            if self._building:
+                return
+            if self._index is None:
+                due = count >= self.train_threshold
+            else:
+                due = (count >= self._indexed_rows * self.rebuild_growth
+                       or self._stale > 0.2 * self._indexed_rows)
+            if not due:
+                return
+            self._building = True
+            self._pending_rows = []
+        threading.Thread(target=self._background_rebuild, name="ann-rebuild", daemon=True).start()
+
+    def _background_rebuild(self):
+        try:
+            self.rebuild()
+        except Exception as e:
+            print(f"ANN index rebuild failed: {e}")
+            with self._lock:
+                self._building = False
+
+    def rebuild(self):
+        """Train and fill a fresh index from the current vectors, then swap it in."""
+        with self._lock:
+            self._building = True
+        vectors = self.store.vectors().copy()
+        count = len(vectors)
+        nlist = int(min(65536, max(16, 4 * np.sqrt(count))))
+        m = self.m
+        while self.store.dimension % m:
+            m -= 1
+
+        # ~40 training points per cell is enough for the coarse quantizer
+        sample_size = min(count, self.train_sample, 40 * nlist)
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(count, sample_size, replace=False)]
+        index = IVFPQIndex(self.store.dimension, nlist, m)
+        index.train(sample)
+        index.add(np.arange(count, dtype=np.int64), vectors)
+
+        with self._lock:
+            # Catch up on rows inserted or replaced while we were building
+            for rows in self._pending_rows:
+                index.add(rows, self.store.take(rows))
+            self._pending_rows = []
+            self._index = index
+            self._indexed_rows = count
+            self._stale = 0
+            self._building = False
+            self.rebuilds += 1
+
+    def search(self, query: List[float], top_k: int, session_id: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        """Approximate top ``top_k`` records, of one session if ``session_id``
+        is given; None while there is no index."""
+        index = self._index
+        if index is None:
+            return None
+        mask = None
+        if session_id is not None:
+            mask = self.store.session_mask(session_id)
+            if mask is None:
+                return []
+        query = np.asarray(query, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        with self._lock:
+            rows, scores = index.search(query, self.nprobe, max(self.rerank, top_k), mask)
+        # Replaced vectors can appear more than once until the next compaction
+        rows, first = np.unique(rows, return_index=True)
+        scores = scores[first]
+        if self.rerank:
+            scores = self.store.take(rows) @ query
+        order = np.argsort(-scores)[:top_k]
+        return self.store.records(rows[order], scores[order])
+
+    def stats(self) -> Dict[str, Any]:
+        index = self._index
+        return {
+            "ready": index is not None,
+            "indexed": index.size if index is not None else 0,
+            "nlist": index.nlist if index is not None else 0,
+            "nprobe": self.nprobe,
+            "rerank": self.rerank,
+            "building": self._building,
+            "rebuilds": self.rebuilds,
+        }
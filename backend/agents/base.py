@@ -0,0 +1,339 @@
+import os
+import time
+from typing import Dict, Any, List, AsyncIterator, Optional
+
+from agents.response_cache import response_cache, make_key, CacheKey
+from agents.resilience import provider_health, within_deadline, DeadlineExceeded
+from agents.metrics import AGENT_LATENCY, AGENT_FIRST_DELTA, AGENT_IN_FLIGHT, AGENT_CACHE_HITS
+from agents.single_flight import single_flight
+from agents.rate_limit import rate_limiter, RateLimited, UpstreamResponse, watch_upstream
+from agents.tokens import estimate_tokens
+
+# generation_config keys holding the output token cap, across providers
+_MAX_OUTPUT_KEYS = ("max_tokens", "maxOutputTokens", "max_new_tokens", "num_predict")
+
+
+class FallbackResponse(Exception):
+    """Raised from a delta stream when the provider answered with a non-200."""
+
+
+class BaseAgent:
+    """Shared plumbing for agent clients.
+
+    Subclasses set ``name``, ``personality_key``, ``provider``, ``model`` and
+    ``context_token_budget`` (how many tokens of conversation history they
+    are handed), keep their sampling parameters in ``generation_config`` and
+    implement ``_generate_response``, which takes an optional per-call
+    replacement for it; ``sampling_params`` names the provider's keys for
+    the common sampling parameters. Providers with a native streaming API
+    override ``_stream_response``; everyone else gets a one-shot stream.
+
+    The public ``generate_response`` / ``stream_response`` wrap those with the
+    shared response cache, single-flight coalescing of identical concurrent
+    calls, the provider's rate limiter and circuit breaker, and the current
+    turn deadline. ``local_kinds`` lists call kinds answered without calling
+    the provider, which bypass the limiter and the breaker.
+    """
+
+    name = "Agent"
+    personality_key = ""
+    provider = ""
+    model = ""
+    context_token_budget = 2000
+    generation_config: Dict[str, Any] = {}
+    # Common sampling parameter -> generation_config key, e.g.
+    # {"max_tokens": "maxOutputTokens"}; see sampling_config
+    sampling_params: Dict[str, str] = {}
+    local_kinds = ()
+    # Relative price of one call, for the router's per-turn cost budget
+    call_cost = 1.0
+    unavailable_message = "I'm temporarily unavailable, please try again in a moment."
+
+    @property
+    def context_tokens(self) -> int:
+        # Per-deployment override, e.g. OLLAMA_CONTEXT_TOKENS=3000
+        try:
+            return int(os.getenv(f"{self.provider.upper()}_CONTEXT_TOKENS", self.context_token_budget))
+        except ValueError:
+            return self.context_token_budget
+
+    @property
+    def turn_cost(self) -> float:
+        # Per-deployment override, e.g. OPENAI_TURN_COST=2
+        try:
+            return float(os.getenv(f"{self.provider.upper()}_TURN_COST", self.call_cost))
+        except ValueError:
+            return self.call_cost
+
+    def _result(self, response: str, status: str, **extra) -> Dict[str, Any]:
+        result = {
+            "agent": self.name,
+            "response": response,
+            "status": status,
+            "personality": self.personality_key,
+        }
+        result.update(extra)
+        return result
+
+    def cache_key(self, kind: str, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> CacheKey:
+        config = self.generation_config if config is None else config
+        return make_key(kind, self.name, self.model, config, prompt, context)
+
+    async def warm(self):
+        """Prepare clients ahead of the first request; called by AgentRegistry.warm."""
+
+    def sampling_config(self, sampling: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """generation_config with the common sampling parameters this
+        provider understands (temperature, top_p, max_tokens, ...) applied,
+        or None if none apply."""
+        overrides = {self.sampling_params[name]: value for name, value in sampling.items() if name in self.sampling_params}
+        return {**self.generation_config, **overrides} if overrides else None
+
+    async def generate_response(self, prompt: str, context: str = "", config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """``config`` replaces generation_config for this call; see sampling_config."""
+        if config is None:
+            return await self._run("text", prompt, context, self._generate_response)
+        return await self._run(
+            "text", prompt, context, lambda p, c: self._generate_response(p, c, config), config
+        )
+
+    async def _run(self, kind: str, prompt: str, context: str, call, config=None) -> Dict[str, Any]:
+        # Single entry point for one-shot upstream calls; ``config`` is a
+        # per-call override of generation_config that ``call`` already applies
+        key = self.cache_key(kind, prompt, context, config)
+        cached = await response_cache.get(key)
+        if cached is not None and self._cache_valid(cached):
+            AGENT_CACHE_HITS.labels(self.name).inc()
+            return cached
+        # Identical concurrent calls share one upstream request
+        return await single_flight.call(
+            self.name, key.digest, lambda: self._call_upstream(kind, key, prompt, context, call, config)
+        )
+
+    async def _call_upstream(self, kind: str, key: CacheKey, prompt: str, context: str, call, config=None) -> Dict[str, Any]:
+        in_flight = AGENT_IN_FLIGHT.labels(self.name)
+        in_flight.inc()
+        started = time.monotonic()
+        try:
+            if kind in self.local_kinds:
+                result = await call(prompt, context)
+            else:
+                result = await self._guarded(call, prompt, context, config)
+        finally:
+            in_flight.dec()
+        AGENT_LATENCY.labels(self.name, kind, result["status"]).observe(time.monotonic() - started)
+        await response_cache.put(key, result)
+        return result
+
+    def _cache_valid(self, result: Dict[str, Any]) -> bool:
+        """Whether a cached result can still be served; see StabilityAgent."""
+        return True
+
+    def _unavailable(self, reason: str) -> Dict[str, Any]:
+        return self._result(self.unavailable_message, "unavailable", reason=reason)
+
+    def request_tokens(self, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> int:
+        """Tokens a call is charged against the provider's tokens/min budget:
+        the input estimate plus the configured output cap."""
+        config = self.generation_config if config is None else config
+        tokens = estimate_tokens(prompt) + estimate_tokens(context)
+        for key in _MAX_OUTPUT_KEYS:
+            if key in config:
+                return tokens + int(config[key])
+        return tokens
+
+    def _rate_limited(self, error: RateLimited) -> Dict[str, Any]:
+        return dict(self._unavailable("rate_limited"), retry_after=round(error.retry_after, 1))
+
+    def _upstream_throttled(self, upstream: UpstreamResponse) -> Dict[str, Any]:
+        paused_for = rate_limiter.limiter(self.provider).blocked_until - time.monotonic()
+        retry_after = upstream.retry_after or max(paused_for, 1.0)
+        return self._rate_limited(RateLimited(self.provider, retry_after))
+
+    def _record_outcome(self, breaker, status: str, elapsed: float, upstream: UpstreamResponse):
+        if status == "success":
+            breaker.record_success()
+            provider_health.latency(self.provider).record(elapsed)
+        elif upstream.throttled:
+            # Still throttled after http_pool's retries: the limiter already
+            # backed off, and a busy provider is not a broken one
+            breaker.release()
+        else:
+            breaker.record_failure()
+
+    async def _guarded(self, call, prompt: str, context: str, config=None) -> Dict[str, Any]:
+        breaker = provider_health.breaker(self.provider)
+        if not breaker.allow():
+            return self._unavailable("circuit_open")
+        settled = False
+        upstream = UpstreamResponse()
+        tokens = self.request_tokens(prompt, context, config)
+
+        async def hedge():
+            # A second paid request: it passes admission like any other
+            try:
+                async with rate_limiter.admit(self.provider, tokens):
+                    return await call(prompt, context)
+            except RateLimited as e:
+                return self._rate_limited(e)
+
+        try:
+            async with rate_limiter.admit(self.provider, tokens):
+                started = time.monotonic()
+                delay = provider_health.hedge_delay(self.provider)
+                if delay is None:
+                    calling = call(prompt, context)
+                else:
+                    calling = provider_health.hedged(
+                        lambda: call(prompt, context), delay, hedge,
+                        lambda: rate_limiter.limiter(self.provider).has_capacity(tokens),
+                    )
+                result = await within_deadline(watch_upstream(calling, upstream))
+            self._record_outcome(breaker, result["status"], time.monotonic() - started, upstream)
+            settled = True
+            if result["status"] != "success" and upstream.throttled:
+                return self._upstream_throttled(upstream)
+            return result
+        except RateLimited as e:
+            # Shed locally before reaching the provider: not a provider failure
+            return self._rate_limited(e)
+        except DeadlineExceeded:
+            breaker.record_failure()
+            settled = True
+            return self._unavailable("deadline")
+        finally:
+            if not settled:
+                # Cancelled by the caller: not the provider's fault
+                breaker.release()
+
+    async def stream_response(self, prompt: str, context: str = "") -> AsyncIterator[Dict[str, Any]]:
+        """Yield ``{"delta": str}`` chunks, then the final result with ``done=True``."""
+        key = self.cache_key("text", prompt, context)
+        cached = await response_cache.get(key)
+        if cached is not None:
+            AGENT_CACHE_HITS.labels(self.name).inc()
+            for frame in self._one_shot_frames(cached):
+                yield frame
+            return
+        async for frame in single_flight.stream(
+            self.name, key.digest, lambda: self._stream_upstream(key, prompt, context)
+        ):
+            yield frame
+
+    async def _stream_upstream(self, key: CacheKey, prompt: str, context: str) -> AsyncIterator[Dict[str, Any]]:
+        if "text" in self.local_kinds:
+            frames = self._stream_response(prompt, context)
+        else:
+            frames = self._guarded_stream(prompt, context)
+        in_flight = AGENT_IN_FLIGHT.labels(self.name)
+        in_flight.inc()
+        started = time.monotonic()
+        first_delta = True
+        try:
+            async for frame in frames:
+                if frame.get("done"):
+                    AGENT_LATENCY.labels(self.name, "stream", frame.get("status")).observe(time.monotonic() - started)
+                    await response_cache.put(key, frame)
+                elif first_delta:
+                    AGENT_FIRST_DELTA.labels(self.name).observe(time.monotonic() - started)
+                    first_delta = False
+                yield frame
+        finally:
+            in_flight.dec()
+
+    async def _guarded_stream(self, prompt: str, context: str) -> AsyncIterator[Dict[str, Any]]:
+        # Streaming counterpart of _guarded; the deadline applies to each wait
+        # for the next frame, and a stream cut short keeps its partial text.
+        breaker = provider_health.breaker(self.provider)
+        if not breaker.allow():
+            for frame in self._one_shot_frames(self._unavailable("circuit_open")):
+                yield frame
+            return
+        settled = False
+        parts = []
+        admission = rate_limiter.admit(self.provider, self.request_tokens(prompt, context))
+        try:
+            await admission.__aenter__()
+        except RateLimited as e:
+            breaker.release()
+            for frame in self._one_shot_frames(self._rate_limited(e)):
+                yield frame
+            return
+        except BaseException:
+            breaker.release()
+            raise
+        started = time.monotonic()
+        stream = self._stream_response(prompt, context)
+        upstream = UpstreamResponse()
+        try:
+            while True:
+                try:
+                    frame = await within_deadline(watch_upstream(stream.__anext__(), upstream))
+                except StopAsyncIteration:
+                    break
+                except DeadlineExceeded:
+                    breaker.record_failure()
+                    settled = True
+                    result = self._unavailable("deadline")
+                    if parts:
+                        result["response"] = "".join(parts)
+                        yield dict(result, done=True)
+                    else:
+                        for frame in self._one_shot_frames(result):
+                            yield frame
+                    return
+                if frame.get("done"):
+                    self._record_outcome(breaker, frame.get("status"), time.monotonic() - started, upstream)
+                    settled = True
+                    if frame.get("status") != "success" and upstream.throttled:
+                        # Keep the text already streamed, but report the throttle
+                        throttled = self._upstream_throttled(upstream)
+                        frame = dict(frame, status=throttled["status"], reason="rate_limited", retry_after=throttled["retry_after"])
+                elif frame.get("delta"):
+                    parts.append(frame["delta"])
+                yield frame
+        finally:
+            if not settled:
+                breaker.release()
+            try:
+                await stream.aclose()
+            finally:
+                await admission.__aexit__(None, None, None)
+
+    async def _generate_response(self, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def _stream_response(self, prompt: str, context: str) -> AsyncIterator[Dict[str, Any]]:
+        result = await self._generate_response(prompt, context)
+        for frame in self._one_shot_frames(result):
+            yield frame
+
+    def _one_shot_frames(self, result: Dict[str, Any]) -> List[Dict[str, Any]]:
+        frames = [{"delta": result["response"]}] if result.get("response") else []
+        frames.append(dict(result, done=True))
+        return frames
+
+    async def _stream_frames(
+        self, deltas: AsyncIterator[str], error_message: str, fallback_message: str = ""
+    ) -> AsyncIterator[Dict[str, Any]]:
+        # Wrap a provider's raw text deltas into stream frames, accumulating the
+        # full text so the final frame carries the committed response.
+        parts = []
+        try:
+            async for delta in deltas:
+                if delta:
+                    parts.append(delta)
+                    yield {"delta": delta}
+        except FallbackResponse:
+            result = self._result(fallback_message, "fallback")
+        except Exception as e:
+            result = self._result(f"{error_message}: {str(e)}", "error")
+        else:
+            result = self._result("".join(parts), "success")
+        if parts:
+            # Keep whatever already reached the client as the committed text
+            result["response"] = "".join(parts)
+            yield dict(result, done=True)
+        else:
+            for frame in self._one_shot_frames(result):
+                yield frame
@@ -0,0 +1,364 @@
+import os
+import re
+import json
+import time
+import asyncio
+import contextvars
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+from agents.metrics import registry
+from agents.resilience import deadline
+
+# Sampling parameters a batch may set; each agent maps them to its own
+# generation_config keys (see BaseAgent.sampling_params)
+SAMPLING_PARAMS = ("temperature", "top_p", "top_k", "max_tokens", "seed", "stop")
+# Results meaning "not now" rather than "failed": retried after a pause
+RETRY_REASONS = ("rate_limited", "circuit_open")
+BATCH_ID = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+
+BATCH_ITEMS = registry.counter("batch_items", "Batch prompt/agent pairs answered", ("agent", "status"))
+BATCH_RETRIES = registry.counter("batch_retries", "Batch calls retried after being shed", ("agent", "reason"))
+
+# Batches being answered on this worker
+_runs: Set["BatchRun"] = set()
+registry.gauge("batches_running", "Batches being answered", collect=lambda: len(_runs))
+
+
+class RequestBody:
+    """Sole reader of an ASGI request's ``receive``.
+
+    Body chunks are queued for ``chunks``, at most ``max_chunks`` ahead, so
+    the upload slows to the pace prompts are taken. Once the body is in, it
+    keeps listening and sets ``disconnected`` when the client goes away.
+    Nothing else may call ``receive`` meanwhile: Starlette's
+    StreamingResponse would, to watch for a disconnect, and take body
+    chunks from under the reader.
+    """
+
+    def __init__(self, receive, max_chunks: int = 64):
+        self.receive = receive
+        self.disconnected = asyncio.Event()
+        self._chunks: asyncio.Queue = asyncio.Queue(max_chunks)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> "RequestBody":
+        self._task = asyncio.create_task(self._read())
+        return self
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _read(self):
+        try:
+            while True:
+                message = await self.receive()
+                if message["type"] == "http.disconnect":
+                    return
+                if message.get("body"):
+                    await self._chunks.put(message["body"])
+                if not message.get("more_body", False):
+                    await self._chunks.put(None)
+                    break
+            while (await self.receive())["type"] != "http.disconnect":
+                pass
+        finally:
+            self.disconnected.set()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        while True:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """Numbered non-blank lines of an NDJSON byte stream, as they arrive."""
+    buffer = b""
+    number = 0
+    async for chunk in chunks:
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            number += 1
+            if line.strip():
+                yield number, line.decode("utf-8", "replace")
+    if buffer.strip():
+        yield number + 1, buffer.decode("utf-8", "replace")
+
+
+async def split_header(lines: AsyncIterator[Tuple[int, str]]) -> Tuple[Dict[str, Any], AsyncIterator[Tuple[int, str]]]:
+    """The batch header and the prompt lines after it. The header is an
+    optional first line without a ``prompt``; ``{}`` if there is none."""
+    try:
+        first = await lines.__anext__()
+    except StopAsyncIteration:
+        return {}, lines
+    try:
+        header = json.loads(first[1])
+    except ValueError:
+        header = None
+    if isinstance(header, dict) and "prompt" not in header:
+        return header, lines
+
+    async def prompts():
+        yield first
+        async for line in lines:
+            yield line
+
+    return {}, prompts()
+
+
+class BatchCheckpoint:
+    """Successful results of one batch, a JSON line each, in
+    ``<BATCH_CHECKPOINT_DIR>/<batch_id>.jsonl``.
+
+    Running the batch again skips every (id, agent) pair found here. Results
+    are buffered and appended in groups once they have been sent, so an
+    interruption loses at most the last group, whose prompts are then asked
+    again.
+    """
+
+    def __init__(self, path: str, flush_every: int = 100, flush_interval: float = 1.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending: List[str] = []
+        self._flushed_at = time.monotonic()
+
+    @classmethod
+    def for_batch(cls, batch_id: str, directory: Optional[str] = None) -> "BatchCheckpoint":
+        directory = directory or os.getenv("BATCH_CHECKPOINT_DIR", "batches")
+        return cls(os.path.join(directory, f"{batch_id}.jsonl"))
+
+    def load(self) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        """(id, agent) -> result; a torn last line is ignored."""
+        done = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    done[(record["id"], record["agent"])] = record
+        except FileNotFoundError:
+            pass
+        return done
+
+    def add(self, record: Dict[str, Any]):
+        self._pending.append(json.dumps(record) + "\n")
+
+    @property
+    def due(self) -> bool:
+        return bool(self._pending) and (
+            len(self._pending) >= self.flush_every or time.monotonic() - self._flushed_at >= self.flush_interval
+        )
+
+    def flush(self):
+        """Append buffered results (blocking)."""
+        pending, self._pending = self._pending, []
+        self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(pending))
+
+
+class BatchRun:
+    """Answers a stream of prompts with a set of agents.
+
+    Each agent gets ``concurrency`` workers fed from its own bounded queue,
+    so a slow provider doesn't hold back the others, and reading the input
+    pauses while the queues are full. Calls take the agents' usual path
+    (response cache, rate limiter, circuit breaker) with ``item_deadline``
+    seconds each; a call shed by the limiter or an open breaker is retried
+    after a pause, up to ``max_attempts`` times, so the batch settles at the
+    rate each provider allows. Results are yielded in completion order.
+
+    With a ``batch_id`` successful results are checkpointed, and running the
+    same batch again only asks for the rest (``replay`` streams the
+    checkpointed results first).
+    """
+
+    def __init__(
+        self,
+        agents: Dict[str, Any],
+        sampling: Optional[Dict[str, Any]] = None,
+        concurrency: Optional[int] = None,
+        batch_id: Optional[str] = None,
+        replay: bool = False,
+        max_attempts: Optional[int] = None,
+        item_deadline: Optional[float] = None,
+    ):
+        """Raises ValueError for bad settings."""
+        if not agents:
+            raise ValueError("No agents to answer the batch")
+        sampling = sampling or {}
+        if not isinstance(sampling, dict):
+            raise ValueError("sampling must be an object")
+        unknown = [name for name in sampling if name not in SAMPLING_PARAMS]
+        if unknown:
+            raise ValueError(f"Unknown sampling parameters: {', '.join(unknown)}")
+        limit = int(os.getenv("BATCH_MAX_CONCURRENCY", 32))
+        if concurrency is None:
+            concurrency = int(os.getenv("BATCH_CONCURRENCY", 4))
+        if isinstance(concurrency, bool) or not isinstance(concurrency, int) or not 1 <= concurrency <= limit:
+            raise ValueError(f"concurrency must be between 1 and {limit}")
+        if batch_id is not None and (not isinstance(batch_id, str) or not BATCH_ID.match(batch_id)):
+            raise ValueError("batch_id must be 1-128 letters, digits, '_', '-' or '.'")
+
+        self.agents = agents
+        self.sampling = sampling
+        self.configs = {name: agent.sampling_config(sampling) for name, agent in agents.items()}
+        self.concurrency = concurrency
+        self.batch_id = batch_id
+        self.replay = bool(replay)
+        self.checkpoint = BatchCheckpoint.for_batch(batch_id) if batch_id else None
+        self.max_attempts = max_attempts or int(os.getenv("BATCH_MAX_ATTEMPTS", 5))
+        self.item_deadline = item_deadline or float(os.getenv("BATCH_ITEM_DEADLINE", 120))
+        self.counts = {"prompts": 0, "skipped": 0, "invalid": 0, "results": 0, "succeeded": 0}
+
+    def ignored(self) -> Dict[str, List[str]]:
+        """Sampling parameters each agent has no equivalent for."""
+        ignored = {}
+        for name, agent in self.agents.items():
+            missing = [param for param in self.sampling if param not in agent.sampling_params]
+            if missing:
+                ignored[name] = missing
+        return ignored
+
+    async def run(self, lines: AsyncIterator[Tuple[int, str]]) -> AsyncIterator[Dict[str, Any]]:
+        """Result records, framed by a ``batch`` record and a ``summary`` one."""
+        if self.batch_id and any(run.batch_id == self.batch_id for run in _runs):
+            yield {"type": "error", "error": f"Batch {self.batch_id} is already running"}
+            return
+        _runs.add(self)
+        started = time.monotonic()
+        tasks = []
+        try:
+            done = await asyncio.to_thread(self.checkpoint.load) if self.checkpoint else {}
+            header = {"type": "batch", "batch_id": self.batch_id, "agents": list(self.agents), "checkpointed": len(done)}
+            ignored = self.ignored()
+            if ignored:
+                header["ignored"] = ignored
+            yield header
+            if self.replay:
+                for record in done.values():
+                    yield dict(record, replayed=True)
+
+            queues = {name: asyncio.Queue(self.concurrency) for name in self.agents}
+            results = asyncio.Queue(self.concurrency * len(self.agents))
+            loop = asyncio.get_running_loop()
+            tasks.append(loop.create_task(self._feed(lines, queues, results, done)))
+            for name, agent in self.agents.items():
+                for _ in range(self.concurrency):
+                    # Fresh context: calls get their own deadline, not the request's
+                    tasks.append(contextvars.Context().run(loop.create_task, self._worker(name, agent, queues[name], results)))
+
+            workers = len(tasks) - 1
+            while workers:
+                record = await results.get()
+                if record is None:
+                    workers -= 1
+                    continue
+                yield record
+                # Sent: from here on a rerun may skip it
+                if self.checkpoint is not None and record.get("status") == "success":
+                    self.checkpoint.add(record)
+                    if self.checkpoint.due:
+                        await asyncio.to_thread(self.checkpoint.flush)
+            yield dict(self.counts, type="summary", batch_id=self.batch_id, elapsed_s=round(time.monotonic() - started, 3))
+        finally:
+            # Synchronous: this also runs when the client disconnects
+            for task in tasks:
+                task.cancel()
+            if self.checkpoint is not None:
+                self.checkpoint.flush()
+            _runs.discard(self)
+
+    async def _feed(self, lines, queues: Dict[str, asyncio.Queue], results: asyncio.Queue, done):
+        seen = set()
+        try:
+            async for number, line in lines:
+                try:
+                    item_id, prompt, context = self._parse(number, line)
+                    if item_id in seen:
+                        raise ValueError(f"Duplicate id {item_id!r}")
+                except ValueError as e:
+                    self.counts["invalid"] += 1
+                    await results.put({"type": "error", "line": number, "error": str(e)})
+                    continue
+                seen.add(item_id)
+                self.counts["prompts"] += 1
+                for name, queue in queues.items():
+                    if (item_id, name) in done:
+                        self.counts["skipped"] += 1
+                    else:
+                        await queue.put((item_id, prompt, context))
+        except Exception as e:
+            await results.put({"type": "error", "error": f"Reading prompts failed: {str(e)}"})
+        # Only once the input has ended: a cancelled run's workers are gone
+        # and would never make room for these
+        for queue in queues.values():
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+    @staticmethod
+    def _parse(number: int, line: str) -> Tuple[str, str, str]:
+        try:
+            item = json.loads(line)
+        except ValueError:
+            raise ValueError("Not valid JSON")
+        if not isinstance(item, dict):
+            raise ValueError("Expected a JSON object")
+        prompt = item.get("prompt")
+        context = item.get("context", "")
+        if not isinstance(prompt, str) or not prompt:
+            raise ValueError("No prompt provided")
+        if not isinstance(context, str):
+            raise ValueError("context must be a string")
+        # Lines without an id are numbered, which is stable for the same input
+        return str(item.get("id", number)), prompt, context
+
+    async def _worker(self, name: str, agent, queue: asyncio.Queue, results: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            if item is None:
+                await results.put(None)
+                return
+            item_id, prompt, context = item
+            started = time.monotonic()
+            result, attempts = await self._answer(agent, self.configs[name], prompt, context)
+            record = {
+                "type": "result",
+                "id": item_id,
+                "agent": name,
+                "status": result.get("status"),
+                "response": result.get("response"),
+                "attempts": attempts,
+                "latency_ms": round((time.monotonic() - started) * 1000, 1),
+            }
+            if result.get("reason"):
+                record["reason"] = result["reason"]
+            BATCH_ITEMS.labels(name, record["status"]).inc()
+            self.counts["results"] += 1
+            self.counts["succeeded"] += record["status"] == "success"
+            await results.put(record)
+
+    async def _answer(self, agent, config, prompt: str, context: str) -> Tuple[Dict[str, Any], int]:
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                with deadline(self.item_deadline):
+                    result = await agent.generate_response(prompt, context, config)
+            except Exception as e:
+                result = {"status": "error", "response": str(e)}
+            reason = result.get("reason")
+            if reason not in RETRY_REASONS or attempt >= self.max_attempts:
+                return result, attempt
+            BATCH_RETRIES.labels(agent.name, reason).inc()
+            await asyncio.sleep(result.get("retry_after") or min(2 ** attempt, 30))
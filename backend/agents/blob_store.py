@@ -0,0 +1,186 @@
+import os
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class Blob:
+    __slots__ = ("id", "data", "content_type", "path")
+
+    def __init__(self, blob_id: str, data: Optional[bytes], content_type: str, path: Optional[str] = None):
+        self.id = blob_id
+        self.data = data
+        self.content_type = content_type
+        self.path = path
+
+    @property
+    def etag(self) -> str:
+        # Content-addressed, so the id is a strong validator
+        return f'"{self.id}"'
+
+    @property
+    def size(self) -> int:
+        return len(self.data) if self.data is not None else os.path.getsize(self.path)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single ``bytes=`` range, or None to send
+    the whole body. Raises ValueError when the range cannot be satisfied."""
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start, end = size - int(last), size - 1
+    except ValueError:
+        return None
+    start, end = max(0, start), min(end, size - 1)
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class BlobStore:
+    """Content-addressed image store: an in-memory LRU bounded by
+    ``max_bytes`` over an optional directory tier bounded by
+    ``disk_max_bytes``.
+
+    Blobs are keyed by a truncated SHA-256 of their bytes, so storing the
+    same image twice is free and ids are safe to cache forever. With a disk
+    tier, blobs are written through and stay fetchable after they fall out
+    of memory; disk files are evicted least-recently-used.
+    """
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        path: Optional[str] = None,
+        disk_max_bytes: Optional[int] = None,
+    ):
+        self.max_bytes = max_bytes or int(os.getenv("IMAGE_STORE_MAX_BYTES", 256 * 1024 * 1024))
+        self.path = path or os.getenv("IMAGE_STORE_PATH") or None
+        self.disk_max_bytes = disk_max_bytes or int(os.getenv("IMAGE_STORE_DISK_MAX_BYTES", 4 * 1024 ** 3))
+        self._memory: "OrderedDict[str, Blob]" = OrderedDict()
+        self.bytes = 0
+        # blob id -> (size, content type), least- to most-recently used
+        self._disk: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self.disk_bytes = 0
+        self.counters = {"stores": 0, "dedup": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            self._scan()
+
+    @staticmethod
+    def blob_id(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    def _file(self, blob_id: str, content_type: str) -> str:
+        extension = content_type.rsplit("/", 1)[-1]
+        return os.path.join(self.path, f"{blob_id}.{extension}")
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.path):
+            blob_id, _, extension = name.partition(".")
+            if len(blob_id) != 32 or not extension or extension.endswith("tmp"):
+                continue
+            stat = os.stat(os.path.join(self.path, name))
+            entries.append((stat.st_mtime, blob_id, stat.st_size, f"image/{extension}"))
+        for _, blob_id, size, content_type in sorted(entries):
+            self._disk[blob_id] = (size, content_type)
+            self.disk_bytes += size
+
+    def __contains__(self, blob_id: str) -> bool:
+        return blob_id in self._memory or blob_id in self._disk
+
+    async def put(self, data: bytes, content_type: str = "image/png") -> str:
+        blob_id = self.blob_id(data)
+        if blob_id in self:
+            self.counters["dedup"] += 1
+            if blob_id in self._memory:
+                self._memory.move_to_end(blob_id)
+            return blob_id
+        self.counters["stores"] += 1
+        self._remember(Blob(blob_id, data, content_type))
+        if self.path:
+            await asyncio.to_thread(self._write, self._file(blob_id, content_type), data)
+            if blob_id not in self._disk:
+                self._disk[blob_id] = (len(data), content_type)
+                self.disk_bytes += len(data)
+            evicted = self._trim_disk()
+            if evicted:
+                await asyncio.to_thread(self._remove, evicted)
+        return blob_id
+
+    def _remember(self, blob: Blob):
+        if len(blob.data) > self.max_bytes:
+            return
+        self._memory[blob.id] = blob
+        self.bytes += len(blob.data)
+        while self.bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.bytes -= len(evicted.data)
+            self.counters["evictions"] += 1
+
+    def _trim_disk(self):
+        evicted = []
+        while self.disk_bytes > self.disk_max_bytes and len(self._disk) > 1:
+            blob_id, (size, content_type) = self._disk.popitem(last=False)
+            self.disk_bytes -= size
+            evicted.append(self._file(blob_id, content_type))
+        return evicted
+
+    @staticmethod
+    def _write(target: str, data: bytes):
+        # File I/O only; the index is updated on the event loop
+        temporary = f"{target}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, target)
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get(self, blob_id: str) -> Optional[Blob]:
+        """The blob with bytes in memory, or a disk-backed blob (``data`` None)
+        to be streamed from ``path``."""
+        blob = self._memory.get(blob_id)
+        if blob is not None:
+            self._memory.move_to_end(blob_id)
+            if blob_id in self._disk:
+                self._disk.move_to_end(blob_id)
+            self.counters["memory_hits"] += 1
+            return blob
+        entry = self._disk.get(blob_id)
+        if entry is not None:
+            path = self._file(blob_id, entry[1])
+            if os.path.exists(path):
+                self._disk.move_to_end(blob_id)
+                self.counters["disk_hits"] += 1
+                return Blob(blob_id, None, entry[1], path)
+            del self._disk[blob_id]
+            self.disk_bytes -= entry[0]
+        self.counters["misses"] += 1
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            self.counters,
+            memory_blobs=len(self._memory),
+            memory_bytes=self.bytes,
+            disk_blobs=len(self._disk),
+            disk_bytes=self.disk_bytes,
+        )
+
+
+image_store = BlobStore()
@@ -0,0 +1,353 @@
+"""Durable, append-only conversation log.
+
+Usage (from backend/), for offline analysis:
+    python -m agents.conversation_log export --format jsonl --out conversations.jsonl
+    python -m agents.conversation_log export --format parquet --out conversations.parquet --session <id>
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+
+SEGMENT_SUFFIX = ".log"
+INDEX_SUFFIX = ".idx"
+
+
+class _SessionIndex:
+    """Message count of one session and the positions of its latest messages."""
+
+    __slots__ = ("count", "positions")
+
+    def __init__(self, keep: int):
+        self.count = 0
+        # (segment name, byte offset), oldest first
+        self.positions: "deque[Tuple[str, int]]" = deque(maxlen=keep)
+
+
+class ConversationLog:
+    """Append-only log of every conversation message, in segment files.
+
+    Each process writes its own segments, named ``<created ns>-<writer>.log``,
+    one JSON record per line, and rolls to a new one after
+    ``segment_bytes``. Appends are queued and group-committed by a
+    background task: one write and one fsync per batch, on a worker thread.
+
+    A per-session offset index points at each session's latest ``keep``
+    messages, so resuming a session reads only those lines. When a segment
+    is sealed its part of the index is saved next to it (``.idx``). On
+    startup the index is rebuilt from those files, and only unsealed
+    segments (e.g. after a crash) are scanned.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        segment_bytes: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        fsync: Optional[bool] = None,
+        keep: int = 100,
+    ):
+        self.path = path
+        self.segment_bytes = segment_bytes or int(os.getenv("CONVERSATION_LOG_SEGMENT_BYTES", 64 * 1024 * 1024))
+        self.flush_interval = (
+            flush_interval if flush_interval is not None else float(os.getenv("CONVERSATION_LOG_FLUSH_INTERVAL", 0.01))
+        )
+        self.fsync = fsync if fsync is not None else os.getenv("CONVERSATION_LOG_FSYNC", "1") != "0"
+        self.keep = keep
+        self.writer_id = uuid.uuid4().hex[:8]
+        self.sessions: Dict[str, _SessionIndex] = {}
+        self._lock = threading.Lock()
+        self._pending: List[Dict[str, Any]] = []
+        self._segment: Optional[str] = None
+        self._file = None
+        self._segment_size = 0
+        # Index entries for the active segment, saved when it is sealed
+        self._segment_index: Dict[str, _SessionIndex] = {}
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {"appended": 0, "batches": 0, "segments": 0, "write_errors": 0, "loads": 0}
+
+    # -- startup ----------------------------------------------------------
+
+    def open(self):
+        """Rebuild the index from disk. Blocking; call off the event loop."""
+        os.makedirs(self.path, exist_ok=True)
+        for name in self.segments():
+            entries = self._read_index(name)
+            if entries is None:
+                entries = self._scan(name)
+            with self._lock:
+                for session_id, (count, offsets) in entries.items():
+                    index = self._index(self.sessions, session_id)
+                    index.count += count
+                    index.positions.extend((name, offset) for offset in offsets)
+
+    def segments(self) -> List[str]:
+        """Segment names, oldest first."""
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name for name in os.listdir(self.path) if name.endswith(SEGMENT_SUFFIX))
+
+    def _read_index(self, name: str) -> Optional[Dict[str, Tuple[int, List[int]]]]:
+        index_path = os.path.join(self.path, name[: -len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved["size"] != os.path.getsize(os.path.join(self.path, name)):
+                return None
+            return {session_id: (count, offsets) for session_id, (count, offsets) in saved["sessions"].items()}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _scan(self, name: str) -> Dict[str, Tuple[int, List[int]]]:
+        entries: Dict[str, _SessionIndex] = {}
+        for offset, record in self._records(name):
+            index = self._index(entries, record["session_id"])
+            index.count += 1
+            index.positions.append((name, offset))
+        return {session_id: (index.count, [offset for _, offset in index.positions]) for session_id, index in entries.items()}
+
+    def _records(self, name: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        with open(os.path.join(self.path, name), "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Torn write at the tail of a crashed segment
+                    break
+                try:
+                    yield offset, json.loads(line)
+                except ValueError:
+                    pass
+                offset += len(line)
+
+    def _index(self, indexes: Dict[str, _SessionIndex], session_id: str) -> _SessionIndex:
+        index = indexes.get(session_id)
+        if index is None:
+            index = _SessionIndex(self.keep)
+            indexes[session_id] = index
+        return index
+
+    # -- writing ----------------------------------------------------------
+
+    async def start(self):
+        """Rebuild the index, then start the background writer."""
+        if self._task is None:
+            await asyncio.to_thread(self.open)
+            self._write_lock = asyncio.Lock()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._writer())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        await asyncio.to_thread(self._seal)
+
+    def append(self, session_id: str, sender: str, text: str):
+        """Queue a message; it is durable once the next batch is committed."""
+        self._pending.append({"session_id": session_id, "ts": time.time(), "sender": sender, "text": text})
+        self.counters["appended"] += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Commit everything appended so far; batches are committed in order."""
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                await asyncio.to_thread(self._commit, batch)
+                self.counters["batches"] += 1
+            except Exception as e:
+                self.counters["write_errors"] += 1
+                print(f"Failed to write conversation log: {e}")
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+            # Let the next batch gather instead of paying an fsync per message
+            await asyncio.sleep(self.flush_interval)
+
+    def _commit(self, batch: List[Dict[str, Any]]):
+        lines = [(record["session_id"], (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")) for record in batch]
+        if self._file is None or self._segment_size >= self.segment_bytes:
+            self._roll()
+        positions = []
+        offset = self._segment_size
+        for session_id, line in lines:
+            positions.append((session_id, offset))
+            offset += len(line)
+        self._file.write(b"".join(line for _, line in lines))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._segment_size = offset
+        with self._lock:
+            for session_id, position in positions:
+                for indexes in (self.sessions, self._segment_index):
+                    index = self._index(indexes, session_id)
+                    index.count += 1
+                    index.positions.append((self._segment, position))
+
+    def _roll(self):
+        self._seal()
+        self._segment = f"{time.time_ns():020d}-{self.writer_id}{SEGMENT_SUFFIX}"
+        self._file = open(os.path.join(self.path, self._segment), "ab")
+        self._segment_size = 0
+        self.counters["segments"] += 1
+
+    def _seal(self):
+        """Close the active segment and save its index next to it."""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        saved = {
+            "size": self._segment_size,
+            "sessions": {
+                session_id: [index.count, [offset for _, offset in index.positions]]
+                for session_id, index in self._segment_index.items()
+            },
+        }
+        index_path = os.path.join(self.path, self._segment[: -len(SEGMENT_SUFFIX)] + INDEX_SUFFIX)
+        with open(f"{index_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(saved, f, separators=(",", ":"))
+        os.replace(f"{index_path}.tmp", index_path)
+        self._segment_index = {}
+
+    # -- reading ----------------------------------------------------------
+
+    def message_count(self, session_id: str) -> int:
+        index = self.sessions.get(session_id)
+        return index.count if index is not None else 0
+
+    async def load(self, session_id: str, limit: int) -> Optional[Tuple[int, List[Dict[str, str]]]]:
+        """``(messages ever logged, last ``limit`` messages)``, or None if the
+        session was never logged. Pending appends are committed first."""
+        await self.flush()
+        with self._lock:
+            index = self.sessions.get(session_id)
+            if index is None:
+                return None
+            count = index.count
+            positions = list(index.positions)[-limit:] if limit else []
+        self.counters["loads"] += 1
+        records = await asyncio.to_thread(self._read_positions, positions)
+        return count, [{"sender": record["sender"], "text": record["text"]} for record in records]
+
+    def _read_positions(self, positions: List[Tuple[str, int]]) -> List[Dict[str, Any]]:
+        records = []
+        handles = {}
+        try:
+            for segment, offset in positions:
+                f = handles.get(segment)
+                if f is None:
+                    f = handles[segment] = open(os.path.join(self.path, segment), "rb")
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        finally:
+            for f in handles.values():
+                f.close()
+        return records
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters, sessions=len(self.sessions), pending=len(self._pending))
+
+
+def create_conversation_log(keep: int) -> Optional[ConversationLog]:
+    """The log configured by CONVERSATION_LOG_PATH, or None when unset."""
+    path = os.getenv("CONVERSATION_LOG_PATH")
+    return ConversationLog(path, keep=keep) if path else None
+
+
+# -- export ---------------------------------------------------------------
+
+def iter_records(path: str, session_id: Optional[str] = None, since: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+    """Every logged message in segment order, one segment at a time; usable
+    directly from a notebook."""
+    log = ConversationLog(path)
+    for name in log.segments():
+        for _, record in log._records(name):
+            if session_id is not None and record["session_id"] != session_id:
+                continue
+            if since is not None and record["ts"] < since:
+                continue
+            yield record
+
+
+def export_jsonl(records: Iterator[Dict[str, Any]], out) -> int:
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def export_parquet(records: Iterator[Dict[str, Any]], out_path: str, batch_rows: int = 50000) -> int:
+    """Write row groups of ``batch_rows`` as they fill, so memory stays flat.
+    Needs pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    schema = pa.schema([
+        ("session_id", pa.string()), ("ts", pa.float64()), ("sender", pa.string()), ("text", pa.string()),
+    ])
+    count = 0
+    with pq.ParquetWriter(out_path, schema) as writer:
+        batch = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_rows:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                count += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("--path", default=os.getenv("CONVERSATION_LOG_PATH"), help="log directory (CONVERSATION_LOG_PATH)")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    parser.add_argument("--out", help="output file (default: stdout for jsonl)")
+    parser.add_argument("--session", help="only this session")
+    parser.add_argument("--since", type=float, help="only messages at or after this Unix time")
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("--path or CONVERSATION_LOG_PATH is required")
+
+    records = iter_records(args.path, args.session, args.since)
+    if args.format == "parquet":
+        if not args.out:
+            parser.error("--out is required for parquet")
+        count = export_parquet(records, args.out)
+    elif args.out:
+        with open(args.out, "w", encoding="utf-8") as out:
+            count = export_jsonl(records, out)
+    else:
+        count = export_jsonl(records, sys.stdout)
+    print(f"Exported {count} messages", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from agents.tokens import estimate_tokens
+
+
+class Message:
+    """Compact conversation record; the context line and token count are computed once."""
+
+    __slots__ = ("sender", "text", "line", "nbytes", "tokens")
+
+    def __init__(self, sender: str, text: str):
+        self.sender = sender
+        self.text = text
+        self.line = f"{sender}: {text}"
+        self.nbytes = len(self.line.encode("utf-8"))
+        self.tokens = estimate_tokens(self.line)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"sender": self.sender, "text": self.text}
+
+
+# Per-object overheads for ConversationManager.memory_footprint: a Message and
+# its two str headers, and a SessionBuffer with its ring list and dicts
+_MESSAGE_OVERHEAD = sys.getsizeof(Message("", "")) + 2 * sys.getsizeof("")
+_SESSION_OVERHEAD = 512
+
+
+class SessionBuffer:
+    """Fixed-capacity ring buffer of messages for one session.
+
+    Messages are addressed by absolute sequence number; the ring keeps the
+    last ``capacity`` of them. Context strings for each requested window
+    (by message count or by token budget) are cached and updated
+    incrementally as messages are appended or fall out of the window.
+    """
+
+    __slots__ = (
+        "capacity", "slots", "total", "base", "nbytes", "last_access",
+        "contexts", "token_windows", "summary",
+    )
+
+    # Distinct token budgets cached per session before the cache is reset
+    MAX_TOKEN_WINDOWS = 16
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.slots: List[Optional[Message]] = [None] * capacity
+        self.total = 0
+        # Messages before the first one held here, for sessions restored from a store
+        self.base = 0
+        self.nbytes = 0
+        self.last_access = time.monotonic()
+        self.contexts: Dict[int, str] = {}
+        # budget -> [first absolute index, token count, context string]
+        self.token_windows: Dict[int, list] = {}
+        self.summary: Optional[Message] = None
+
+    @property
+    def count(self) -> int:
+        return min(self.total, self.capacity)
+
+    def _abs(self, index: int) -> Message:
+        return self.slots[index % self.capacity]
+
+    def _at(self, index: int) -> Message:
+        return self._abs(self.total - self.count + index)
+
+    def append(self, message: Message) -> Optional[Message]:
+        """Append a message, returning the one that fell off the ring (if any)."""
+        for window, context in self.contexts.items():
+            if self.count >= window:
+                leaving = self._at(self.count - window)
+                context = context[len(leaving.line) + 1:] if window > 1 else ""
+            self.contexts[window] = f"{context}\n{message.line}" if context else message.line
+
+        for budget, window in self.token_windows.items():
+            self._slide(window, budget, message)
+
+        evicted = None
+        slot = self.total % self.capacity
+        if self.total >= self.capacity:
+            evicted = self.slots[slot]
+            self.nbytes -= evicted.nbytes
+        self.slots[slot] = message
+        self.total += 1
+        self.nbytes += message.nbytes
+        return evicted
+
+    def _slide(self, window: list, budget: int, message: Message):
+        start, tokens, context = window
+        context = f"{context}\n{message.line}" if context else message.line
+        tokens += message.tokens
+        # Oldest absolute index still in the ring once ``message`` is stored
+        oldest = self.total + 1 - self.capacity
+        while start <= self.total and (tokens > budget or start < oldest):
+            leaving = message if start == self.total else self._abs(start)
+            context = context[len(leaving.line) + 1:]
+            tokens -= leaving.tokens
+            start += 1
+        window[:] = [start, tokens, context]
+
+    def recent(self, n: int) -> List[Message]:
+        n = min(n, self.count)
+        return [self._at(i) for i in range(self.count - n, self.count)]
+
+    def context(self, window: int) -> str:
+        window = max(1, min(window, self.capacity))
+        context = self.contexts.get(window)
+        if context is None:
+            context = "\n".join(message.line for message in self.recent(window))
+            self.contexts[window] = context
+        return context
+
+    def token_context(self, budget: int) -> Tuple[str, bool]:
+        """Most recent messages fitting ``budget`` tokens, and whether any were left out."""
+        window = self.token_windows.get(budget)
+        if window is None:
+            start, tokens = self.total, 0
+            oldest = self.total - self.count
+            while start > oldest and tokens + self._abs(start - 1).tokens <= budget:
+                start -= 1
+                tokens += self._abs(start).tokens
+            context = "\n".join(self._abs(i).line for i in range(start, self.total))
+            if len(self.token_windows) >= self.MAX_TOKEN_WINDOWS:
+                self.token_windows.clear()
+            window = [start, tokens, context]
+            self.token_windows[budget] = window
+        return window[2], window[0] > 0
+
+
+class ConversationManager:
+    """Bounded in-memory conversation store.
+
+    Each session keeps at most ``max_messages`` messages. Whole sessions are
+    evicted once idle for ``idle_ttl`` seconds, or least-recently-used first
+    when ``max_sessions`` or the global ``max_bytes`` budget is exceeded.
+    """
+
+    def __init__(
+        self,
+        max_messages: Optional[int] = None,
+        max_sessions: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        idle_ttl: Optional[float] = None,
+    ):
+        self.max_messages = max_messages or int(os.getenv("CONVERSATION_MAX_MESSAGES", 100))
+        self.max_sessions = max_sessions or int(os.getenv("CONVERSATION_MAX_SESSIONS", 10000))
+        self.max_bytes = max_bytes or int(os.getenv("CONVERSATION_MAX_BYTES", 64 * 1024 * 1024))
+        self.idle_ttl = idle_ttl or float(os.getenv("CONVERSATION_IDLE_TTL", 3600))
+        # Ordered least- to most-recently used
+        self.sessions: "OrderedDict[str, SessionBuffer]" = OrderedDict()
+        self.total_messages = 0
+        self.total_bytes = 0
+        self.evicted_sessions = 0
+
+    def _touch(self, session_id: str) -> Optional[SessionBuffer]:
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_access = time.monotonic()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def add_message(self, session_id: str, message: dict):
+        session = self._touch(session_id)
+        if session is None:
+            session = SessionBuffer(self.max_messages)
+            self.sessions[session_id] = session
+
+        record = Message(message["sender"], message["text"])
+        evicted = session.append(record)
+        self.total_bytes += record.nbytes
+        if evicted is None:
+            self.total_messages += 1
+        else:
+            self.total_bytes -= evicted.nbytes
+
+        self.evict_idle()
+        self._enforce_budget(keep=session_id)
+
+    def get_context(self, session_id: str, max_messages: int = 10, max_tokens: Optional[int] = None) -> str:
+        """Render recent history as context.
+
+        With ``max_tokens`` the most recent messages that fit the token budget
+        are packed instead of a fixed message count; if older history had to
+        be dropped, the pinned summary (if any) is placed in front of it.
+        """
+        session = self._touch(session_id)
+        if session is None:
+            return ""
+        if max_tokens is None:
+            return session.context(max_messages)
+
+        summary = session.summary
+        if summary is not None and summary.tokens < max_tokens:
+            context, truncated = session.token_context(max_tokens - summary.tokens)
+            if truncated:
+                return f"{summary.line}\n{context}" if context else summary.line
+        return session.token_context(max_tokens)[0]
+
+    def pin_summary(self, session_id: str, text: Optional[str]):
+        """Pin a summary of older history, used when it no longer fits the budget."""
+        session = self._touch(session_id)
+        if session is None:
+            return
+        if session.summary is not None:
+            session.nbytes -= session.summary.nbytes
+            self.total_bytes -= session.summary.nbytes
+        session.summary = Message("Summary", text) if text else None
+        if session.summary is not None:
+            session.nbytes += session.summary.nbytes
+            self.total_bytes += session.summary.nbytes
+
+    def get_messages(self, session_id: str, max_messages: Optional[int] = None) -> List[Dict[str, Any]]:
+        session = self._touch(session_id)
+        if session is None:
+            return []
+        return [message.to_dict() for message in session.recent(max_messages or session.count)]
+
+    def message_count(self, session_id: str) -> int:
+        """Messages ever added to the session, including ones that fell off the ring."""
+        session = self.sessions.get(session_id)
+        return session.base + session.total if session is not None else 0
+
+    def summary(self, session_id: str) -> Optional[str]:
+        session = self.sessions.get(session_id)
+        return session.summary.text if session is not None and session.summary is not None else None
+
+    def restore(self, session_id: str, messages: List[Dict[str, Any]], total: int, summary: Optional[str] = None):
+        """Replace a session with history loaded from a shared store: its most
+        recent ``messages`` out of ``total`` ever added, and its summary."""
+        self.remove_session(session_id)
+        session = SessionBuffer(self.max_messages)
+        self.sessions[session_id] = session
+        for message in messages[-self.max_messages:]:
+            record = Message(message["sender"], message["text"])
+            session.append(record)
+            self.total_messages += 1
+            self.total_bytes += record.nbytes
+        session.base = max(0, total - session.total)
+        self.pin_summary(session_id, summary)
+        self._enforce_budget(keep=session_id)
+
+    def remove_session(self, session_id: str) -> bool:
+        session = self.sessions.pop(session_id, None)
+        if session is None:
+            return False
+        self.total_messages -= session.count
+        self.total_bytes -= session.nbytes
+        return True
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        # Sessions are kept in LRU order, so idle ones are always at the front
+        now = time.monotonic() if now is None else now
+        evicted = 0
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if now - session.last_access < self.idle_ttl:
+                break
+            self.remove_session(session_id)
+            evicted += 1
+        self.evicted_sessions += evicted
+        return evicted
+
+    def _enforce_budget(self, keep: str):
+        while self.sessions and (len(self.sessions) > self.max_sessions or self.total_bytes > self.max_bytes):
+            session_id = next(iter(self.sessions))
+            if session_id == keep:
+                break
+            self.remove_session(session_id)
+            self.evicted_sessions += 1
+
+    def memory_footprint(self) -> int:
+        """Approximate resident bytes: message objects, their text and line
+        strings, ring slots, and every cached context string."""
+        footprint = self.total_messages * _MESSAGE_OVERHEAD + 2 * self.total_bytes
+        for session in self.sessions.values():
+            footprint += _SESSION_OVERHEAD + 8 * session.capacity
+            footprint += sum(len(context) for context in session.contexts.values())
+            footprint += sum(len(window[2]) for window in session.token_windows.values())
+        return footprint
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.sessions),
+            "messages": self.total_messages,
+            "bytes": self.total_bytes,
+            "evicted_sessions": self.evicted_sessions,
+        }
@@ -0,0 +1,177 @@
+import os
+import re
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DIMENSION = 384
+_WORD_RE = re.compile(r"\w+")
+
+
+class HashingEncoder:
+    """Dependency-free 384-dim encoder (signed feature hashing of word
+    unigrams and bigrams). Used when sentence-transformers is unavailable."""
+
+    dimension = DIMENSION
+
+    def encode(self, texts: List[str]) -> "np.ndarray":
+        import numpy as np
+
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = _WORD_RE.findall(text.lower())
+            features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+            for feature in features:
+                h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+                vectors[row, h % self.dimension] += 1.0 if h >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name)
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str]) -> "np.ndarray":
+        return self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True, convert_to_numpy=True)
+
+
+def create_encoder():
+    """Encoder named by EMBEDDING_MODEL; ``hashing`` or a missing
+    sentence-transformers install selects the built-in hashing encoder."""
+    model_name = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    if model_name == "hashing":
+        return HashingEncoder()
+    try:
+        return SentenceTransformerEncoder(model_name)
+    except Exception as e:
+        print(f"Falling back to hashing embeddings: {e}")
+        return HashingEncoder()
+
+
+class EmbeddingPipeline:
+    """Micro-batching embedding stage shared by all sessions.
+
+    ``embed`` calls are collected into batches that flush when ``batch_size``
+    texts are pending or ``max_delay`` seconds after the first one arrived.
+    Batches are encoded on a worker pool off the event loop, and results are
+    memoised by content hash in an LRU.
+    """
+
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        max_delay: Optional[float] = None,
+        cache_size: Optional[int] = None,
+        workers: Optional[int] = None,
+        encoder=None,
+    ):
+        self.batch_size = batch_size or int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+        self.max_delay = max_delay or float(os.getenv("EMBEDDING_MAX_DELAY", 0.01))
+        self.cache_size = cache_size or int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))
+        self.workers = workers or int(os.getenv("EMBEDDING_WORKERS", 1))
+        self._encoder = encoder
+        self._encoder_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        # digest -> future for every text queued or being encoded
+        self._inflight: Dict[str, "asyncio.Future"] = {}
+        # digest -> text for the batch currently being collected
+        self._batch: Dict[str, str] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches = set()
+        self.counters = {"cache_hits": 0, "cache_misses": 0, "batches": 0, "encoded": 0}
+
+    @property
+    def encoder(self):
+        # Loaded on a worker thread the first time a batch is encoded
+        with self._encoder_lock:
+            if self._encoder is None:
+                self._encoder = create_encoder()
+        return self._encoder
+
+    def _encode(self, texts: List[str]) -> "np.ndarray":
+        return self.encoder.encode(texts)
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    async def embed(self, text: str) -> List[float]:
+        digest = self._digest(text)
+        cached = self._cache.get(digest)
+        if cached is not None:
+            self._cache.move_to_end(digest)
+            self.counters["cache_hits"] += 1
+            return cached
+        self.counters["cache_misses"] += 1
+
+        # Identical texts already queued or being encoded share one result
+        future = self._inflight.get(digest)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._inflight[digest] = future
+            self._batch[digest] = text
+            if len(self._batch) >= self.batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_delay, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, {}
+        task = asyncio.get_running_loop().create_task(self._encode_batch(batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _encode_batch(self, batch: Dict[str, str]):
+        digests = list(batch)
+        try:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embed")
+            loop = asyncio.get_running_loop()
+            vectors = await loop.run_in_executor(self._executor, self._encode, list(batch.values()))
+        except Exception as e:
+            for digest in digests:
+                future = self._inflight.pop(digest)
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.counters["batches"] += 1
+        self.counters["encoded"] += len(digests)
+        for digest, vector in zip(digests, vectors):
+            embedding = vector.tolist()
+            self._cache[digest] = embedding
+            future = self._inflight.pop(digest)
+            if not future.done():
+                future.set_result(embedding)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.counters, cached=len(self._cache), pending=len(self._inflight))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+embedding_pipeline = EmbeddingPipeline()
@@ -1,56 +1,78 @@
 import os
-import requests
-from typing import Dict, Any
+import json
+from typing import Dict, Any, Optional, AsyncIterator
+
+from agents.base import BaseAgent, FallbackResponse
+from agents.http_pool import http_pool
+
+class GeminiAgent(BaseAgent):
+    name = "Gemini"
+    personality_key = "versatile_balanced"
+    provider = "gemini"
+    context_token_budget = 3000
+    model = "gemini-1.5-flash"
+    fallback_message = "I'm accessing my multimodal capabilities to provide you with a comprehensive response."
+    error_message = "My neural pathways are recalibrating"
+    sampling_params = {
+        "temperature": "temperature",
+        "top_p": "topP",
+        "top_k": "topK",
+        "max_tokens": "maxOutputTokens",
+        "stop": "stopSequences"
+    }
 
-class GeminiAgent:
     def __init__(self):
         self.api_key = os.getenv("GEMINI_API_KEY")
-        self.base_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+        base_url = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+        self.base_url = f"{base_url}/models/{self.model}"
         self.personality = "I am a versatile and intuitive AI with multimodal capabilities. I excel at understanding context, providing balanced perspectives, and generating both text and visual insights."
-    
-    async def generate_response(self, prompt: str, context: str = "") -> Dict[str, Any]:
+        self.generation_config = {
+            "temperature": 0.7,
+            "topK": 40,
+            "topP": 0.95,
+            "maxOutputTokens": 500
+        }
+
+    def _payload(self, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {
+            "contents": [{
+                "parts": [{
+                    "text": f"{self.personality}\n\nContext: {context}\n\nUser: {prompt}\n\nPlease provide a balanced and insightful response:"
+                }]
+            }],
+            "generationConfig": self.generation_config if config is None else config
+        }
+
+    @staticmethod
+    def _candidate_text(result: Dict[str, Any]) -> str:
+        return result["candidates"][0]["content"]["parts"][0]["text"]
+
+    async def _generate_response(self, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         try:
             headers = {"Content-Type": "application/json"}
-            
-            payload = {
-                "contents": [{
-                    "parts": [{
-                        "text": f"{self.personality}\n\nContext: {context}\n\nUser: {prompt}\n\nPlease provide a balanced and insightful response:"
-                    }]
-                }],
-                "generationConfig": {
-                    "temperature": 0.7,
-                    "topK": 40,
-                    "topP": 0.95,
-                    "maxOutputTokens": 500
-                }
-            }
-            
-            url = f"{self.base_url}?key={self.api_key}"
-            response = requests.post(url, headers=headers, json=payload)
-            
+
+            url = f"{self.base_url}:generateContent?key={self.api_key}"
+            response = await http_pool.post("gemini", url, headers=headers, json=self._payload(prompt, context, config))
+
             if response.status_code == 200:
-                result = response.json()
-                generated_text = result["candidates"][0]["content"]["parts"][0]["text"]
-                
-                return {
-                    "agent": "Gemini",
-                    "response": generated_text,
-                    "status": "success",
-                    "personality": "versatile_balanced"
-                }
+                return self._result(self._candidate_text(response.json()), "success")
             else:
-                return {
-                    "agent": "Gemini",
-                    "response": "I'm accessing my multimodal capabilities to provide you with a comprehensive response.",
-                    "status": "fallback",
-                    "personality": "versatile_balanced"
-                }
-                
+                return self._result(self.fallback_message, "fallback")
+
         except Exception as e:
-            return {
-                "agent": "Gemini",
-                "response": f"My neural pathways are recalibrating: {str(e)}",
-                "status": "error",
-                "personality": "versatile_balanced"
-            }
+            return self._result(f"{self.error_message}: {str(e)}", "error")
+
+    async def _stream_response(self, prompt: str, context: str) -> AsyncIterator[Dict[str, Any]]:
+        async def deltas():
+            headers = {"Content-Type": "application/json"}
+            url = f"{self.base_url}:streamGenerateContent?alt=sse&key={self.api_key}"
+            async with http_pool.stream("gemini", "POST", url, headers=headers, json=self._payload(prompt, context)) as response:
+                if response.status_code != 200:
+                    raise FallbackResponse()
+                # Server-sent events: one "data: {json}" line per chunk
+                async for line in response.aiter_lines():
+                    if line.startswith("data:"):
+                        yield self._candidate_text(json.loads(line[5:]))
+
+        async for frame in self._stream_frames(deltas(), self.error_message, self.fallback_message):
+            yield frame
@@ -0,0 +1,170 @@
+import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Callable, Optional, AsyncIterator
+
+import httpx
+
+from agents.resilience import remaining
+
+# Default number of concurrent upstream requests per provider. Override with
+# e.g. OPENAI_MAX_CONCURRENCY=32 in the environment.
+DEFAULT_CONCURRENCY = {
+    "openai": 16,
+    "huggingface": 8,
+    "gemini": 16,
+    "ollama": 2,
+    "stability": 4,
+}
+
+# Upstream statuses worth retrying after a short wait
+RETRY_STATUSES = {429, 503}
+
+# Per-provider read timeouts (seconds). Override with e.g. OLLAMA_READ_TIMEOUT.
+DEFAULT_READ_TIMEOUT = {
+    "ollama": 30.0,
+    "stability": 90.0,
+}
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP-date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HTTPClientPool:
+    """App-lifetime async HTTP transport shared by all agents.
+
+    Each provider gets its own keep-alive connection pool and a concurrency
+    limit, so a slow provider cannot starve the others. ``post`` and
+    ``stream`` retry 429/503 responses while the Retry-After (or backoff)
+    delay fits in the current deadline. Every response is passed to the
+    ``response_hooks`` as ``hook(provider, response)``.
+    """
+
+    def __init__(self):
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.response_hooks: List[Callable[[str, httpx.Response], None]] = []
+
+    def concurrency(self, provider: str) -> int:
+        default = DEFAULT_CONCURRENCY.get(provider, 8)
+        return max(1, int(_env_float(f"{provider.upper()}_MAX_CONCURRENCY", default)))
+
+    def timeout(self, provider: str) -> httpx.Timeout:
+        default = DEFAULT_READ_TIMEOUT.get(provider, _env_float("HTTP_READ_TIMEOUT", 60.0))
+        read = _env_float(f"{provider.upper()}_READ_TIMEOUT", default)
+        return httpx.Timeout(read, connect=_env_float("HTTP_CONNECT_TIMEOUT", 5.0))
+
+    def request_timeout(self, provider: str) -> httpx.Timeout:
+        """``timeout`` capped so no socket wait outlives the current turn deadline."""
+        timeout = self.timeout(provider)
+        left = remaining()
+        if left is None:
+            return timeout
+        return httpx.Timeout(min(timeout.read, left), connect=min(timeout.connect, left))
+
+    def client(self, provider: str) -> httpx.AsyncClient:
+        client = self._clients.get(provider)
+        if client is None or client.is_closed:
+            max_connections = self.concurrency(provider)
+            max_keepalive = int(_env_float("HTTP_MAX_KEEPALIVE", 20))
+            limits = httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=min(max_keepalive, max_connections),
+            )
+            client = httpx.AsyncClient(
+                timeout=self.timeout(provider),
+                limits=limits,
+                event_hooks={"response": [self._response_hook(provider)]},
+            )
+            self._clients[provider] = client
+        return client
+
+    def _response_hook(self, provider: str):
+        async def hook(response: httpx.Response):
+            for callback in self.response_hooks:
+                callback(provider, response)
+        return hook
+
+    def retry_delay(self, response: httpx.Response, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying ``response``, or None to give up."""
+        if response.status_code not in RETRY_STATUSES or attempt >= int(_env_float("HTTP_MAX_RETRIES", 2)):
+            return None
+        delay = parse_retry_after(response.headers.get("retry-after"))
+        if delay is None:
+            delay = 0.5 * 2 ** attempt
+        left = remaining()
+        if delay > _env_float("HTTP_MAX_RETRY_DELAY", 10.0) or (left is not None and delay >= left):
+            return None
+        return delay
+
+    @asynccontextmanager
+    async def slot(self, provider: str) -> AsyncIterator[None]:
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.concurrency(provider))
+            self._semaphores[provider] = semaphore
+        async with semaphore:
+            yield
+
+    async def post(self, provider: str, url: str, **kwargs) -> httpx.Response:
+        timeout = kwargs.pop("timeout", None)
+        attempt = 0
+        while True:
+            async with self.slot(provider):
+                response = await self.client(provider).post(
+                    url, timeout=timeout or self.request_timeout(provider), **kwargs
+                )
+            delay = self.retry_delay(response, attempt)
+            if delay is None:
+                return response
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(self, provider: str, method: str, url: str, **kwargs) -> AsyncIterator[httpx.Response]:
+        timeout = kwargs.pop("timeout", None)
+        attempt = 0
+        while True:
+            async with self.slot(provider):
+                client = self.client(provider)
+                request = client.build_request(method, url, timeout=timeout or self.request_timeout(provider), **kwargs)
+                response = await client.send(request, stream=True)
+                delay = self.retry_delay(response, attempt)
+                if delay is None:
+                    try:
+                        yield response
+                    finally:
+                        await response.aclose()
+                    return
+                await response.aclose()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._semaphores.clear()
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+
+http_pool = HTTPClientPool()
@@ -1,30 +1,41 @@
 import os
-import requests
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+
+from agents.base import BaseAgent
+from agents.http_pool import http_pool
+
+class HuggingFaceAgent(BaseAgent):
+    name = "HuggingFace"
+    personality_key = "creative_innovative"
+    provider = "huggingface"
+    # DialoGPT has a 1024-token window shared with the reply
+    context_token_budget = 400
+    model = "microsoft/DialoGPT-large"
+    sampling_params = {"temperature": "temperature", "top_p": "top_p", "top_k": "top_k", "max_tokens": "max_new_tokens"}
 
-class HuggingFaceAgent:
     def __init__(self):
         self.api_key = os.getenv("HUGGINGFACE_API_KEY")
-        self.base_url = "https://api-inference.huggingface.co/models"
+        self.base_url = os.getenv("HUGGINGFACE_BASE_URL", "https://api-inference.huggingface.co/models").rstrip("/")
         self.personality = "I am a creative and diverse AI that draws from a vast community of models. I bring innovative perspectives and love exploring unconventional solutions."
+        self.generation_config = {
+            "max_new_tokens": 300,
+            "temperature": 0.8,
+            "return_full_text": False
+        }
     
-    async def generate_response(self, prompt: str, context: str = "") -> Dict[str, Any]:
+    async def _generate_response(self, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         try:
             headers = {"Authorization": f"Bearer {self.api_key}"}
             
             # Use a conversational model
-            model_url = f"{self.base_url}/microsoft/DialoGPT-large"
+            model_url = f"{self.base_url}/{self.model}"
             
             payload = {
                 "inputs": f"{self.personality}\n\nContext: {context}\n\nUser: {prompt}",
-                "parameters": {
-                    "max_new_tokens": 300,
-                    "temperature": 0.8,
-                    "return_full_text": False
-                }
+                "parameters": self.generation_config if config is None else config
             }
             
-            response = requests.post(model_url, headers=headers, json=payload)
+            response = await http_pool.post("huggingface", model_url, headers=headers, json=payload)
             
             if response.status_code == 200:
                 result = response.json()
@@ -33,24 +44,9 @@ class HuggingFaceAgent:
                 else:
                     generated_text = "I'm ready to help with creative solutions!"
                     
-                return {
-                    "agent": "HuggingFace",
-                    "response": generated_text,
-                    "status": "success",
-                    "personality": "creative_innovative"
-                }
+                return self._result(generated_text, "success")
             else:
-                return {
-                    "agent": "HuggingFace", 
-                    "response": "I'm currently warming up my models. Let me provide a creative perspective on your query shortly!",
-                    "status": "fallback",
-                    "personality": "creative_innovative"
-                }
+                return self._result("I'm currently warming up my models. Let me provide a creative perspective on your query shortly!", "fallback")
                 
         except Exception as e:
-            return {
-                "agent": "HuggingFace",
-                "response": f"My creative circuits are experiencing a hiccup: {str(e)}",
-                "status": "error",
-                "personality": "creative_innovative"
-            }
+            return self._result(f"My creative circuits are experiencing a hiccup: {str(e)}", "error")
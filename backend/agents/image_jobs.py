@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import itertools
+import contextvars
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+# Generation parameters a job may set, with their allowed ranges
+PARAMETER_LIMITS = {
+    "samples": (1, 10),
+    "steps": (10, 50),
+    "cfg_scale": (0, 35),
+    "height": (128, 1536),
+    "width": (128, 1536),
+    "seed": (0, 4294967295),
+}
+MAX_VARIANTS = 16
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _check_parameter(name: str, value: Any) -> Any:
+    if name == "style_preset":
+        return str(value)
+    if name not in PARAMETER_LIMITS:
+        raise ValueError(f"Unknown image parameter: {name}")
+    low, high = PARAMETER_LIMITS[name]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+        raise ValueError(f"{name} must be a number between {low} and {high}")
+    if name in ("height", "width") and value % 64:
+        raise ValueError(f"{name} must be a multiple of 64")
+    return value if name == "cfg_scale" else int(value)
+
+
+def expand_variants(params: Dict[str, Any], sweep: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Cartesian product of ``sweep`` values on top of the fixed ``params``.
+    Raises ValueError for anything that isn't a valid parameter set."""
+    if params is not None and not isinstance(params, dict):
+        raise ValueError("params must be an object")
+    if sweep is not None and not isinstance(sweep, dict):
+        raise ValueError("sweep must be an object")
+    base = {name: _check_parameter(name, value) for name, value in (params or {}).items()}
+    sweep = sweep or {}
+    for name, values in sweep.items():
+        if not isinstance(values, list) or not values:
+            raise ValueError(f"sweep.{name} must be a non-empty list")
+    names = list(sweep)
+    combinations = list(itertools.product(*(sweep[name] for name in names)))
+    if len(combinations) > MAX_VARIANTS:
+        raise ValueError(f"A sweep may produce at most {MAX_VARIANTS} variants")
+    return [
+        dict(base, **{name: _check_parameter(name, value) for name, value in zip(names, values)})
+        for values in combinations
+    ]
+
+
+class ImageJob:
+    """One submitted prompt and the variants (parameter sets) it expands to."""
+
+    def __init__(self, prompt: str, context: str, variants: List[Dict[str, Any]], priority: int, key: str):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.context = context
+        self.variants = variants
+        self.priority = priority
+        self.key = key
+        self.status = "queued"
+        self.results: List[Optional[Dict[str, Any]]] = [None] * len(variants)
+        self.completed = 0
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.subscribers: List[Callable[[Dict[str, Any]], None]] = []
+        self.running: Dict[int, asyncio.Task] = {}
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+    def snapshot(self) -> Dict[str, Any]:
+        images = [image for result in self.results if result for image in result.get("images", [])]
+        return {
+            "type": "image_job",
+            "job_id": self.id,
+            "status": self.status,
+            "completed": self.completed,
+            "total": len(self.variants),
+            "priority": self.priority,
+            "variants": [
+                {
+                    "params": variant,
+                    "status": result["status"] if result else "pending",
+                    "images": result.get("images", []) if result else [],
+                }
+                for variant, result in zip(self.variants, self.results)
+            ],
+            "images": images,
+        }
+
+    def notify(self):
+        event = self.snapshot()
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber(event)
+            except Exception:
+                self.subscribers.remove(subscriber)
+
+
+class ImageJobQueue:
+    """Background image generation.
+
+    Jobs expand into one work item per variant; a fixed pool of workers
+    drains a priority queue of items (lower ``priority`` first, FIFO within a
+    priority). Submitting a job identical to one still queued or running
+    returns the existing job. Finished jobs are kept for ``ttl`` seconds so
+    their results can be polled. ``get_agent`` returns the image agent, or
+    None while it is disabled.
+    """
+
+    def __init__(self, get_agent: Callable[[], Any], workers: Optional[int] = None, max_pending: Optional[int] = None, ttl: Optional[float] = None):
+        self.get_agent = get_agent
+        self.workers = workers or int(os.getenv("IMAGE_JOB_WORKERS", 4))
+        self.max_pending = max_pending or int(os.getenv("IMAGE_JOB_MAX_PENDING", 256))
+        self.ttl = ttl or float(os.getenv("IMAGE_JOB_TTL", 3600))
+        self.jobs: Dict[str, ImageJob] = {}
+        self._active: Dict[str, ImageJob] = {}
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._sequence = itertools.count()
+        self.counters = {"submitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        loop = asyncio.get_running_loop()
+        for _ in range(self.workers):
+            # Fresh context: workers must not inherit the submitting request's deadline
+            self._tasks.append(contextvars.Context().run(loop.create_task, self._worker()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @staticmethod
+    def job_key(prompt: str, context: str, variants: List[Dict[str, Any]]) -> str:
+        payload = json.dumps([prompt, context, variants], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def submit(
+        self,
+        prompt: str,
+        context: str = "",
+        params: Optional[Dict[str, Any]] = None,
+        sweep: Optional[Dict[str, List[Any]]] = None,
+        priority: int = 0,
+    ) -> Tuple[ImageJob, bool]:
+        """Queue a job; returns ``(job, coalesced)``. Raises ValueError for bad
+        parameters and JobQueueFull when too many items are pending."""
+        context = "" if context is None else context
+        if not isinstance(prompt, str) or not isinstance(context, str):
+            raise ValueError("prompt and context must be strings")
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            raise ValueError("priority must be an integer")
+        variants = expand_variants(params, sweep)
+        key = self.job_key(prompt, context, variants)
+        existing = self._active.get(key)
+        if existing is not None:
+            self.counters["coalesced"] += 1
+            return existing, True
+        self.start()
+        if self._queue.qsize() + len(variants) > self.max_pending:
+            self.counters["rejected"] += 1
+            raise JobQueueFull()
+
+        self._prune()
+        job = ImageJob(prompt, context, variants, priority, key)
+        self.jobs[job.id] = job
+        self._active[key] = job
+        for index in range(len(variants)):
+            self._queue.put_nowait((job.priority, next(self._sequence), job, index))
+        self.counters["submitted"] += 1
+        return job, False
+
+    def get(self, job_id: str) -> Optional[ImageJob]:
+        """The job, or None if it is unknown or expired. Raises ValueError if
+        ``job_id`` isn't a string."""
+        if not isinstance(job_id, str):
+            raise ValueError("job_id must be a string")
+        return self.jobs.get(job_id)
+
+    def subscribe(self, job: ImageJob, callback: Callable[[Dict[str, Any]], None]):
+        """Call ``callback`` with the job's current state and every update after it."""
+        if not job.finished:
+            job.subscribers.append(callback)
+        callback(job.snapshot())
+
+    def cancel(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        for task in job.running.values():
+            task.cancel()
+        self._finish(job, "cancelled")
+        return True
+
+    def _finish(self, job: ImageJob, status: str):
+        job.status = status
+        job.finished_at = time.time()
+        self.counters[{"done": "completed"}.get(status, status)] += 1
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+        job.notify()
+        job.subscribers.clear()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished and job.finished_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            _, _, job, index = await self._queue.get()
+            if job.finished:
+                continue
+            job.status = "running"
+            agent = self.get_agent()
+            if agent is None:
+                task = asyncio.ensure_future(self._disabled())
+            else:
+                task = asyncio.ensure_future(agent.generate_image(job.prompt, job.context, **job.variants[index]))
+            job.running[index] = task
+            try:
+                result = await task
+            except asyncio.CancelledError:
+                if job.finished:
+                    # The job was cancelled, not this worker
+                    continue
+                raise
+            except Exception as e:
+                result = {"status": "error", "response": str(e)}
+            finally:
+                job.running.pop(index, None)
+            if job.finished:
+                continue
+            job.results[index] = result
+            job.completed += 1
+            if job.completed == len(job.variants):
+                ok = any(r.get("status") == "success" for r in job.results)
+                self._finish(job, "done" if ok else "failed")
+            else:
+                job.notify()
+
+    @staticmethod
+    async def _disabled() -> Dict[str, Any]:
+        return {"status": "error", "response": "Image generation is disabled."}
+
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            self.counters,
+            pending=self._queue.qsize() if self._queue is not None else 0,
+            active=len(self._active),
+            retained=len(self.jobs),
+        )
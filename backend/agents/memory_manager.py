@@ -1,63 +1,194 @@
 import os
-from pinecone import Pinecone
-from typing import Dict, Any, List
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional
 import json
-import pandas as pd
+from datetime import datetime
+
+DIMENSION = 384  # Sentence transformer dimension
+MAX_METADATA_TEXT = 1000  # characters of turn text kept with each vector
+
+
+class MemoryBackend:
+    """Vector storage behind MemoryManager. Methods are blocking; the manager
+    runs them off the event loop."""
+
+    def upsert(self, vector_id: str, embedding: List[float], metadata: Dict[str, Any]):
+        raise NotImplementedError
+
+    def query(self, embedding: List[float], top_k: int, session_id: Optional[str] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PineconeBackend(MemoryBackend):
+    def __init__(self, api_key: Optional[str], index_name: str = "ai-agent-memory"):
+        self.api_key = api_key
+        self.index_name = index_name
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        # Connect on first use so importing the app never touches the network
+        with self._lock:
+            if self._index is None:
+                from pinecone import Pinecone
+
+                pc = Pinecone(api_key=self.api_key)
+
+                # Check if index exists, create if not
+                existing_indexes = [index.name for index in pc.list_indexes()]
+                if self.index_name not in existing_indexes:
+                    pc.create_index(
+                        name=self.index_name,
+                        dimension=DIMENSION,
+                        metric="cosine",
+                        spec={"serverless": {"cloud": "aws", "region": "us-east-1"}}
+                    )
+
+                self._index = pc.Index(self.index_name)
+        return self._index
+
+    def upsert(self, vector_id: str, embedding: List[float], metadata: Dict[str, Any]):
+        self.index.upsert([(vector_id, embedding, metadata)])
+
+    def query(self, embedding: List[float], top_k: int, session_id: Optional[str] = None) -> List[Dict]:
+        results = self.index.query(
+            vector=embedding,
+            top_k=top_k,
+            include_metadata=True,
+            filter={"session_id": {"$eq": session_id}} if session_id else None
+        )
+        return [match.metadata for match in results.matches]
+
+
+class LocalBackend(MemoryBackend):
+    """In-process NumPy store; works offline and in tests.
+
+    With an ANN index, queries go through IVF-PQ once enough vectors exist.
+    A session-filtered query uses it too, keeping only that session's
+    candidates, once the session has ``min_session_rows`` vectors; smaller
+    sessions are cheaper to score exactly.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        snapshot_every: int = 1000,
+        ann: Optional[Dict[str, Any]] = None,
+        min_session_rows: int = 5000,
+    ):
+        from agents.vector_store import LocalVectorStore
+
+        self.store = LocalVectorStore(dimension=DIMENSION, path=path)
+        self.snapshot_every = snapshot_every
+        self._since_snapshot = 0
+        self.min_session_rows = min_session_rows
+        self.index = None
+        if ann is not None:
+            from agents.ann_index import ANNIndex
+
+            self.index = ANNIndex(self.store, **ann)
+            self.index.refresh()
+
+    def upsert(self, vector_id: str, embedding: List[float], metadata: Dict[str, Any]):
+        rows = self.store.upsert([(vector_id, embedding, metadata)])
+        if self.index is not None:
+            self.index.add(rows)
+        self._since_snapshot += 1
+        if self.store.path and self._since_snapshot >= self.snapshot_every:
+            self._since_snapshot = 0
+            self.store.save()
+
+    def query(self, embedding: List[float], top_k: int, session_id: Optional[str] = None) -> List[Dict]:
+        if self.index is not None and (
+            session_id is None or self.store.session_size(session_id) >= self.min_session_rows
+        ):
+            results = self.index.search(embedding, top_k, session_id)
+            if results is not None:
+                return results
+        return self.store.query(embedding, top_k, session_id=session_id)
+
+    def close(self):
+        self.store.save()
+
+
+def create_backend() -> MemoryBackend:
+    """Pick a backend from MEMORY_BACKEND (``local`` or ``pinecone``).
+
+    Defaults to Pinecone when PINECONE_API_KEY is set, otherwise local.
+    """
+    api_key = os.getenv("PINECONE_API_KEY")
+    kind = os.getenv("MEMORY_BACKEND", "pinecone" if api_key else "local")
+    if kind == "pinecone":
+        return PineconeBackend(api_key)
+    ann = None
+    if os.getenv("MEMORY_INDEX", "ivfpq") == "ivfpq":
+        ann = {
+            "nprobe": int(os.getenv("MEMORY_ANN_NPROBE", 16)),
+            "rerank": int(os.getenv("MEMORY_ANN_RERANK", 100)),
+            "train_threshold": int(os.getenv("MEMORY_ANN_TRAIN_THRESHOLD", 50000)),
+            "rebuild_growth": float(os.getenv("MEMORY_ANN_REBUILD_GROWTH", 2.0)),
+            "m": int(os.getenv("MEMORY_ANN_SUBQUANTIZERS", 48)),
+        }
+    return LocalBackend(
+        path=os.getenv("MEMORY_PATH"),
+        snapshot_every=int(os.getenv("MEMORY_SNAPSHOT_EVERY", 1000)),
+        ann=ann,
+        min_session_rows=int(os.getenv("MEMORY_ANN_MIN_SESSION_ROWS", 5000))
+    )
+
 
 class MemoryManager:
-    def __init__(self):
-        self.api_key = os.getenv("PINECONE_API_KEY")
-        self.index_name = "ai-agent-memory"
-        
-        try:
-            pc = Pinecone(api_key=self.api_key)
-            
-            # Check if index exists, create if not
-            existing_indexes = [index.name for index in pc.list_indexes()]
-            if self.index_name not in existing_indexes:
-                pc.create_index(
-                    name=self.index_name,
-                    dimension=384,  # Sentence transformer dimension
-                    metric="cosine",
-                    spec={"serverless": {"cloud": "aws", "region": "us-east-1"}}
-                )
-            
-            self.index = pc.Index(self.index_name)
-        except Exception as e:
-            print(f"Pinecone initialization failed: {e}")
-            self.index = None
-    
-    async def store_conversation(self, session_id: str, messages: List[Dict], embeddings: List[float]) -> bool:
+    def __init__(self, backend: Optional[MemoryBackend] = None):
+        self._backend = backend
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self) -> MemoryBackend:
+        # Created on first use (on a worker thread) so startup never loads a
+        # snapshot or imports NumPy/Pinecone
+        with self._lock:
+            if self._backend is None:
+                self._backend = create_backend()
+        return self._backend
+
+    async def store_conversation(
+        self, session_id: str, messages: List[Dict], embeddings: List[float], turn: Optional[int] = None
+    ) -> bool:
         try:
-            if not self.index:
-                return False
-                
-            vector_id = f"{session_id}_{len(messages)}"
+            # ``turn`` keeps ids unique when ``messages`` is a window rather than the full history
+            vector_id = f"{session_id}_{len(messages) if turn is None else turn}"
             metadata = {
                 "session_id": session_id,
-                "timestamp": str(pd.Timestamp.now()),
+                "timestamp": str(datetime.now()),
                 "message_count": len(messages),
-                "last_message": messages[-1] if messages else {}
+                "last_message": messages[-1] if messages else {},
+                "text": "\n".join(f"{m['sender']}: {m['text']}" for m in messages)[:MAX_METADATA_TEXT]
             }
-            
-            self.index.upsert([(vector_id, embeddings, metadata)])
+
+            await asyncio.to_thread(lambda: self.backend.upsert(vector_id, embeddings, metadata))
             return True
         except Exception as e:
             print(f"Failed to store conversation: {e}")
             return False
-    
-    async def retrieve_similar_conversations(self, query_embedding: List[float], top_k: int = 5) -> List[Dict]:
+
+    async def retrieve_similar_conversations(
+        self, query_embedding: List[float], top_k: int = 5, session_id: Optional[str] = None
+    ) -> List[Dict]:
         try:
-            if not self.index:
-                return []
-                
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=top_k,
-                include_metadata=True
-            )
-            
-            return [match.metadata for match in results.matches]
+            return await asyncio.to_thread(lambda: self.backend.query(query_embedding, top_k, session_id))
         except Exception as e:
             print(f"Failed to retrieve conversations: {e}")
             return []
+
+    def close(self):
+        if self._backend is None:
+            return
+        try:
+            self._backend.close()
+        except Exception as e:
+            print(f"Failed to close memory backend: {e}")
@@ -0,0 +1,232 @@
+import time
+import asyncio
+from bisect import bisect_left
+from typing import Dict, Any, List, Tuple, Callable, Optional
+
+# Upstream calls range from cache-speed local answers to minute-long image jobs
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            child = self._new_child()
+            self._children[values] = child
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[Tuple[str, Tuple[str, ...], float, str]]:
+        # (name suffix, label values, value, extra label)
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, value, extra in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return lines
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self):
+        return [("_total", values, child.value, "") for values, child in self._children.items()]
+
+
+class Gauge(_Metric):
+    """Gauge set directly, or computed at scrape time by ``collect`` which
+    returns a number (unlabelled) or a ``{label values: number}`` dict."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), collect: Optional[Callable[[], Any]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def _new_child(self):
+        return _Value()
+
+    def samples(self):
+        if self.collect is None:
+            return [("", values, child.value, "") for values, child in self._children.items()]
+        collected = self.collect()
+        if not isinstance(collected, dict):
+            return [("", (), collected, "")]
+        return [("", values if isinstance(values, tuple) else (values,), value, "")
+                for values, value in collected.items()]
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram. ``observe`` is a bisect and three increments;
+    all observations happen on the event loop thread so no lock is taken."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def samples(self):
+        samples = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                samples.append(("_bucket", values, cumulative, f'le="{_format_value(bound)}"'))
+            samples.append(("_sum", values, child.sum, ""))
+            samples.append(("_count", values, child.count, ""))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), collect=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, collect))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} collection failed: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag: how late a ``sleep(interval)`` wakes up."""
+
+    def __init__(self, histogram: Histogram, interval: float = 0.5):
+        self.histogram = histogram
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, time.monotonic() - started - self.interval)
+            self.max = max(self.max, self.last)
+            self.histogram.labels().observe(self.last)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+registry = Registry()
+
+AGENT_LATENCY = registry.histogram(
+    "agent_request_duration_seconds", "Agent call latency by outcome (cache hits excluded)",
+    ("agent", "kind", "status"),
+)
+AGENT_FIRST_DELTA = registry.histogram(
+    "agent_first_delta_seconds", "Time from request to first streamed delta", ("agent",),
+)
+AGENT_IN_FLIGHT = registry.gauge("agent_in_flight", "Agent calls currently awaiting the provider", ("agent",))
+AGENT_CACHE_HITS = registry.counter("agent_cache_hits", "Agent calls answered from the response cache", ("agent",))
+LOOP_LAG = registry.histogram("event_loop_lag_seconds", "Event loop scheduling delay", buckets=LAG_BUCKETS)
+
+loop_monitor = LoopLagMonitor(LOOP_LAG)
+
+
+def agent_summary(agent: str) -> Dict[str, Any]:
+    """Request counts, error/fallback rates and in-flight calls for one agent."""
+    by_status: Dict[str, int] = {}
+    for (name, _, status), child in AGENT_LATENCY._children.items():
+        if name == agent:
+            by_status[status] = by_status.get(status, 0) + child.count
+    total = sum(by_status.values())
+    in_flight = AGENT_IN_FLIGHT._children.get((agent,))
+    return {
+        "requests": total,
+        "by_status": by_status,
+        "error_rate": round(by_status.get("error", 0) / total, 4) if total else 0.0,
+        "fallback_rate": round(by_status.get("fallback", 0) / total, 4) if total else 0.0,
+        "in_flight": in_flight.value if in_flight is not None else 0,
+    }
@@ -1,49 +1,75 @@
 import os
-import requests
-from typing import Dict, Any
+import json
+from typing import Dict, Any, Optional, AsyncIterator
+
+from agents.base import BaseAgent, FallbackResponse
+from agents.http_pool import http_pool
+
+class OllamaAgent(BaseAgent):
+    name = "Ollama"
+    personality_key = "privacy_focused"
+    provider = "ollama"
+    # Runs on local hardware: no per-call price
+    call_cost = 0.0
+    # Leaves room in llama2's 4k window for personality and reply
+    context_token_budget = 1500
+    model = "llama2"  # Default model, can be changed
+    fallback_message = "I'm a local AI running on your machine. Please ensure Ollama is running locally."
+    sampling_params = {
+        "temperature": "temperature",
+        "top_p": "top_p",
+        "top_k": "top_k",
+        "max_tokens": "num_predict",
+        "seed": "seed",
+        "stop": "stop"
+    }
 
-class OllamaAgent:
     def __init__(self):
-        self.base_url = "http://localhost:11434/api/generate"
+        self.base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/") + "/api/generate"
         self.personality = "I am a local, privacy-focused AI that runs on your hardware. I'm reliable, efficient, and provide thoughtful responses while keeping your data secure."
-    
-    async def generate_response(self, prompt: str, context: str = "") -> Dict[str, Any]:
+        self.generation_config = {
+            "temperature": 0.7,
+            "top_p": 0.9,
+            "num_predict": 300
+        }
+
+    def _payload(self, prompt: str, context: str, stream: bool = False, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {
+            "model": self.model,
+            "prompt": f"{self.personality}\n\nContext: {context}\n\nUser: {prompt}\n\nResponse:",
+            "stream": stream,
+            "options": self.generation_config if config is None else config
+        }
+
+    async def _generate_response(self, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         try:
-            payload = {
-                "model": "llama2",  # Default model, can be changed
-                "prompt": f"{self.personality}\n\nContext: {context}\n\nUser: {prompt}\n\nResponse:",
-                "stream": False,
-                "options": {
-                    "temperature": 0.7,
-                    "top_p": 0.9,
-                    "num_predict": 300
-                }
-            }
-            
-            response = requests.post(self.base_url, json=payload, timeout=30)
-            
+            response = await http_pool.post("ollama", self.base_url, json=self._payload(prompt, context, config=config))
+
             if response.status_code == 200:
                 result = response.json()
                 generated_text = result.get("response", "I'm processing locally on your machine...")
-                
-                return {
-                    "agent": "Ollama",
-                    "response": generated_text,
-                    "status": "success",
-                    "personality": "privacy_focused"
-                }
+
+                return self._result(generated_text, "success")
             else:
-                return {
-                    "agent": "Ollama",
-                    "response": "I'm a local AI running on your machine. Please ensure Ollama is running locally.",
-                    "status": "fallback",
-                    "personality": "privacy_focused"
-                }
-                
+                return self._result(self.fallback_message, "fallback")
+
         except Exception as e:
-            return {
-                "agent": "Ollama",
-                "response": f"Local processing unit status: {str(e)}. Please check if Ollama service is running.",
-                "status": "error",
-                "personality": "privacy_focused"
-            }
+            return self._result(f"Local processing unit status: {str(e)}. Please check if Ollama service is running.", "error")
+
+    async def _stream_response(self, prompt: str, context: str) -> AsyncIterator[Dict[str, Any]]:
+        async def deltas():
+            payload = self._payload(prompt, context, stream=True)
+            async with http_pool.stream("ollama", "POST", self.base_url, json=payload) as response:
+                if response.status_code != 200:
+                    raise FallbackResponse()
+                # NDJSON: one object per line, the last one has "done": true
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    yield chunk.get("response", "")
+                    if chunk.get("done"):
+                        break
+
+        async for frame in self._stream_frames(deltas(), "Local processing unit status", self.fallback_message):
+            yield frame
@@ -1,36 +1,94 @@
 import os
-import openai
-from typing import Dict, Any
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, AsyncIterator, TYPE_CHECKING
+
+from agents.base import BaseAgent
+from agents.http_pool import http_pool
+
+if TYPE_CHECKING:
+    import openai
+
+class OpenAIAgent(BaseAgent):
+    name = "OpenAI"
+    personality_key = "logical_analytical"
+    provider = "openai"
+    context_token_budget = 3000
+    model = "gpt-4o-mini"
+
+    sampling_params = {"temperature": "temperature", "top_p": "top_p", "max_tokens": "max_tokens", "seed": "seed", "stop": "stop"}
 
-class OpenAIAgent:
     def __init__(self):
-        self.client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self._client = None
         self.personality = "I am a logical, analytical AI that provides structured and well-reasoned responses. I excel at breaking down complex problems and offering step-by-step solutions."
-    
-    async def generate_response(self, prompt: str, context: str = "") -> Dict[str, Any]:
-        try:
-            full_prompt = f"{self.personality}\n\nContext: {context}\n\nUser: {prompt}\n\nResponse:"
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": self.personality},
-                    {"role": "user", "content": f"{context}\n\n{prompt}"}
-                ],
-                max_tokens=500,
-                temperature=0.7
+        self.generation_config = {"max_tokens": 500, "temperature": 0.7}
+
+    @property
+    def client(self) -> "openai.AsyncOpenAI":
+        # Rebuild the SDK client if the shared pool recycled its connection pool
+        http_client = http_pool.client("openai")
+        if self._client is None or self._client._client is not http_client:
+            # The SDK takes ~0.5s to import; only pay for it once it is used
+            import openai
+
+            self._client = openai.AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                http_client=http_client,
+                timeout=http_pool.timeout("openai"),
+                # Retried by _create within the deadline, like the other providers
+                max_retries=0,
             )
-            
-            return {
-                "agent": "OpenAI",
-                "response": response.choices[0].message.content,
-                "status": "success",
-                "personality": "logical_analytical"
-            }
+        return self._client
+
+    async def warm(self):
+        await asyncio.to_thread(importlib.import_module, "openai")
+        self.client
+
+    @asynccontextmanager
+    async def _completion(self, **kwargs) -> AsyncIterator[Any]:
+        """A chat completion, holding an http_pool slot while it is read.
+        429/503 answers are retried the way http_pool retries them."""
+        import openai
+
+        attempt = 0
+        while True:
+            async with http_pool.slot("openai"):
+                try:
+                    response = await self.client.chat.completions.create(
+                        model=self.model, timeout=http_pool.request_timeout("openai"), **kwargs
+                    )
+                except openai.APIStatusError as e:
+                    delay = http_pool.retry_delay(e.response, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    yield response
+                    return
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _messages(self, prompt: str, context: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.personality},
+            {"role": "user", "content": f"{context}\n\n{prompt}"}
+        ]
+
+    async def _generate_response(self, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        config = self.generation_config if config is None else config
+        try:
+            async with self._completion(messages=self._messages(prompt, context), **config) as response:
+                return self._result(response.choices[0].message.content, "success")
         except Exception as e:
-            return {
-                "agent": "OpenAI",
-                "response": f"I apologize, but I encountered an error: {str(e)}",
-                "status": "error",
-                "personality": "logical_analytical"
-            }
+            return self._result(f"I apologize, but I encountered an error: {str(e)}", "error")
+
+    async def _stream_response(self, prompt: str, context: str) -> AsyncIterator[Dict[str, Any]]:
+        async def deltas():
+            async with self._completion(messages=self._messages(prompt, context), stream=True, **self.generation_config) as stream:
+                async for chunk in stream:
+                    if chunk.choices:
+                        yield chunk.choices[0].delta.content
+
+        async for frame in self._stream_frames(deltas(), "I apologize, but I encountered an error"):
+            yield frame
@@ -0,0 +1,260 @@
+import time
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, AsyncIterator, Awaitable
+
+from agents.http_pool import http_pool, parse_retry_after, _env_float
+from agents.resilience import remaining
+
+# Statuses that mean "slow down" rather than "this request is bad"
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+# The last upstream response of the call being watched; see watch_upstream
+_upstream: contextvars.ContextVar[Optional["UpstreamResponse"]] = contextvars.ContextVar("upstream", default=None)
+
+
+class RateLimited(Exception):
+    """Admission was refused: the wait queue is full or the wait would
+    outlast the caller's deadline."""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"{provider} rate limit: retry in {retry_after:.1f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class UpstreamResponse:
+    """Status and Retry-After of the last upstream response of one call."""
+
+    __slots__ = ("status", "retry_after")
+
+    def __init__(self):
+        self.status: Optional[int] = None
+        self.retry_after: Optional[float] = None
+
+    @property
+    def throttled(self) -> bool:
+        """The provider asked us to slow down (a 429, or a 503 with Retry-After)."""
+        return self.status == 429 or (self.status == 503 and self.retry_after is not None)
+
+
+async def watch_upstream(awaitable: Awaitable, upstream: UpstreamResponse):
+    """Await ``awaitable``, noting its upstream responses in ``upstream``.
+
+    Tasks it spawns (e.g. hedges) see the same object, so the caller can
+    tell a provider that is still throttling after http_pool's retries from
+    one that failed.
+    """
+    token = _upstream.set(upstream)
+    try:
+        return await awaitable
+    finally:
+        _upstream.reset(token)
+
+
+class TokenBucket:
+    """Per-minute budget refilled continuously, with a burst of ``burst_seconds`` worth.
+
+    ``reserve`` always takes the amount, possibly into debt, and returns how
+    long the caller must wait for the debt to be repaid, so queued callers
+    are spaced out instead of all waking at once.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 10.0):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        return max(0.0, -self.tokens / self.rate)
+
+    def available(self) -> float:
+        """Tokens that could be taken now without waiting."""
+        return min(self.capacity, self.tokens + (time.monotonic() - self.updated) * self.rate)
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderLimiter:
+    """Admission control for one provider.
+
+    Requests pass three gates in order: a concurrency limit adjusted by AIMD
+    (additive increase on success, halved on 429/5xx at most once per
+    ``cooldown``), any Retry-After pause the provider asked for, and the
+    requests/min and tokens/min buckets. Callers wait FIFO in a queue of at
+    most ``max_queue`` for at most ``max_wait`` seconds (or their deadline,
+    if sooner) before being refused with RateLimited.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        max_concurrency: int,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_queue: int = 256,
+        max_wait: float = 10.0,
+        cooldown: float = 1.0,
+    ):
+        self.provider = provider
+        self.max_limit = float(max_concurrency)
+        self.limit = float(max_concurrency)
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._waiters: "deque[asyncio.Future]" = deque()
+        self.counters = {"admitted": 0, "queued": 0, "rejected": 0, "throttled": 0}
+
+    @asynccontextmanager
+    async def admit(self, tokens: int = 0) -> AsyncIterator[None]:
+        await self._acquire(tokens)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, tokens: int):
+        if len(self._waiters) >= self.max_queue:
+            self.counters["rejected"] += 1
+            raise RateLimited(self.provider, self.max_wait)
+        left = remaining()
+        budget = self.max_wait if left is None else min(self.max_wait, left)
+        give_up = time.monotonic() + budget
+
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+        else:
+            self.counters["queued"] += 1
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), budget)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done():
+                    # Granted a slot just as we gave up: hand it on
+                    self._release()
+                else:
+                    waiter.cancel()
+                    self._waiters.remove(waiter)
+                if isinstance(e, asyncio.TimeoutError):
+                    self.counters["rejected"] += 1
+                    raise RateLimited(self.provider, budget)
+                raise
+
+        # Holding a slot; now wait out any Retry-After pause and the buckets
+        try:
+            delay = max(0.0, self.blocked_until - time.monotonic())
+            reserved = []
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+                if bucket is not None and amount:
+                    delay = max(delay, bucket.reserve(amount))
+                    reserved.append((bucket, amount))
+            if time.monotonic() + delay > give_up:
+                for bucket, amount in reserved:
+                    bucket.refund(amount)
+                self.counters["rejected"] += 1
+                raise RateLimited(self.provider, delay)
+            if delay:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._release()
+            raise
+        self.counters["admitted"] += 1
+
+    def has_capacity(self, tokens: int = 0) -> bool:
+        """Whether a call would be admitted right now, without queueing or
+        waiting. For optional calls, such as hedges, that should rather not
+        be made than wait."""
+        if self._waiters or self.in_flight >= int(self.limit) or self.blocked_until > time.monotonic():
+            return False
+        return all(
+            bucket is None or not amount or bucket.available() >= amount
+            for bucket, amount in ((self.requests, 1), (self.tokens, tokens))
+        )
+
+    def _release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def observe(self, status: int, retry_after: Optional[float]):
+        """Feed back an upstream response status."""
+        now = time.monotonic()
+        if status in THROTTLE_STATUSES:
+            self.counters["throttled"] += 1
+            if now - self._last_decrease >= self.cooldown:
+                self.limit = max(1.0, self.limit / 2)
+                self._last_decrease = now
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+        elif status < 400:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            self.counters,
+            limit=round(self.limit, 2),
+            in_flight=self.in_flight,
+            waiting=len(self._waiters),
+            paused_for=round(max(0.0, self.blocked_until - time.monotonic()), 1),
+        )
+
+
+class RateLimiter:
+    """Per-provider limiters, created on first use from the environment:
+    ``<PROVIDER>_RPM`` / ``<PROVIDER>_TPM`` (unset = unlimited), with the
+    AIMD ceiling at the provider's HTTP concurrency limit."""
+
+    def __init__(self):
+        self.limiters: Dict[str, ProviderLimiter] = {}
+
+    def limiter(self, provider: str) -> ProviderLimiter:
+        limiter = self.limiters.get(provider)
+        if limiter is None:
+            prefix = provider.upper()
+            limiter = ProviderLimiter(
+                provider,
+                http_pool.concurrency(provider),
+                rpm=_env_float(f"{prefix}_RPM", 0) or None,
+                tpm=_env_float(f"{prefix}_TPM", 0) or None,
+                max_queue=int(_env_float("RATE_LIMIT_MAX_QUEUE", 256)),
+                max_wait=_env_float("RATE_LIMIT_MAX_WAIT", 10.0),
+            )
+            self.limiters[provider] = limiter
+        return limiter
+
+    def admit(self, provider: str, tokens: int = 0):
+        return self.limiter(provider).admit(tokens)
+
+    def observe_response(self, provider: str, response):
+        retry_after = parse_retry_after(response.headers.get("retry-after"))
+        self.limiter(provider).observe(response.status_code, retry_after)
+        upstream = _upstream.get()
+        if upstream is not None:
+            upstream.status, upstream.retry_after = response.status_code, retry_after
+
+
+rate_limiter = RateLimiter()
+# Every upstream response, including those made by the OpenAI SDK over the
+# shared client, feeds the provider's limiter
+http_pool.response_hooks.append(rate_limiter.observe_response)
@@ -0,0 +1,125 @@
+import os
+import asyncio
+import importlib
+import threading
+from typing import Dict, List, Optional
+
+# Built-in agents in reply order: key -> "module:Class". The key names the
+# agent in AGENTS / AGENTS_DISABLED and in the /agent/{key} endpoint.
+DEFAULT_AGENTS = {
+    "openai": "agents.openai_client:OpenAIAgent",
+    "huggingface": "agents.huggingface_client:HuggingFaceAgent",
+    "gemini": "agents.gemini_client:GeminiAgent",
+    "ollama": "agents.ollama_client:OllamaAgent",
+    "stability": "agents.stability_client:StabilityAgent",
+}
+
+
+def _parse_list(value: Optional[str]) -> List[str]:
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def _parse_plugins(value: Optional[str]) -> Dict[str, str]:
+    """``key=module:Class`` pairs, comma-separated."""
+    plugins = {}
+    for item in _parse_list(value):
+        key, _, path = item.partition("=")
+        if ":" not in path:
+            raise ValueError(f"AGENT_PLUGINS entry must be key=module:Class, got {item!r}")
+        plugins[key.strip()] = path.strip()
+    return plugins
+
+
+class AgentRegistry:
+    """Agents declared by config and constructed on first use.
+
+    ``declared`` maps keys to ``module:Class`` paths; the built-ins can be
+    extended with AGENT_PLUGINS. AGENTS picks and orders the enabled agents
+    (default: all declared) and AGENTS_DISABLED removes some. Nothing is
+    imported until an agent is first asked for, or ``warm`` imports them
+    all in the background after startup. An agent that fails to load is
+    reported in ``errors`` and left out rather than failing the app.
+    """
+
+    def __init__(self, declared: Optional[Dict[str, str]] = None, enabled: Optional[List[str]] = None):
+        if declared is None:
+            declared = dict(DEFAULT_AGENTS, **_parse_plugins(os.getenv("AGENT_PLUGINS")))
+        self.declared = declared
+        if enabled is None:
+            enabled = _parse_list(os.getenv("AGENTS")) or list(declared)
+            disabled = set(_parse_list(os.getenv("AGENTS_DISABLED")))
+            enabled = [key for key in enabled if key not in disabled]
+        unknown = [key for key in enabled if key not in declared]
+        if unknown:
+            raise ValueError(f"Unknown agents in AGENTS: {', '.join(unknown)}")
+        self.keys = enabled
+        self.errors: Dict[str, str] = {}
+        self._instances: Dict[str, object] = {}
+        # warm() imports on worker threads while requests may ask on the loop
+        self._lock = threading.Lock()
+
+    def is_enabled(self, key: str) -> bool:
+        return key in self.keys and key not in self.errors
+
+    def get(self, key: str):
+        """The agent for ``key``, constructing it on first use; None if the
+        agent is disabled or failed to load."""
+        agent = self._instances.get(key)
+        if agent is not None or not self.is_enabled(key):
+            return agent
+        with self._lock:
+            agent = self._instances.get(key)
+            if agent is None and key not in self.errors:
+                agent = self._load(key)
+        return agent
+
+    def _load(self, key: str):
+        module_name, _, class_name = self.declared[key].partition(":")
+        try:
+            agent = getattr(importlib.import_module(module_name), class_name)()
+        except Exception as e:
+            self.errors[key] = f"{type(e).__name__}: {e}"
+            print(f"Failed to load agent {key}: {e}")
+            return None
+        self._instances[key] = agent
+        return agent
+
+    def active(self) -> List[object]:
+        """Enabled agents in reply order."""
+        agents = []
+        for key in self.keys:
+            agent = self.get(key)
+            if agent is not None:
+                agents.append(agent)
+        return agents
+
+    def peek(self, key: str):
+        """The agent if it is already loaded; never loads it."""
+        return self._instances.get(key)
+
+    def display_name(self, key: str) -> Optional[str]:
+        """The agent's ``name`` if it is loaded; never loads it."""
+        agent = self.peek(key)
+        return agent.name if agent is not None else None
+
+    @property
+    def loaded(self) -> List[str]:
+        return [key for key in self.keys if key in self._instances]
+
+    async def warm(self):
+        """Load every enabled agent off the event loop, then let each prepare
+        its client (see BaseAgent.warm)."""
+        for key in self.keys:
+            agent = await asyncio.to_thread(self.get, key)
+            if agent is None:
+                continue
+            try:
+                await agent.warm()
+            except Exception as e:
+                print(f"Warming agent {key} failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {"enabled": len(self.keys), "loaded": len(self._instances), "failed": len(self.errors)}
+
+
+agent_registry = AgentRegistry()
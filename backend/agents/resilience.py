@@ -0,0 +1,222 @@
+import os
+import time
+import asyncio
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, Awaitable, Iterator
+
+# Absolute time.monotonic() by which the current turn must finish. Set once per
+# turn/request; copied into every task spawned from it.
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """Bound everything inside the block by ``seconds`` (never extends an outer deadline)."""
+    if seconds is None:
+        yield
+        return
+    current = _deadline.get()
+    new = time.monotonic() + seconds
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None without one."""
+    current = _deadline.get()
+    if current is None:
+        return None
+    return max(0.0, current - time.monotonic())
+
+
+async def within_deadline(awaitable: Awaitable):
+    left = remaining()
+    if left is None:
+        return await awaitable
+    if left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise DeadlineExceeded()
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded()
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies for one provider."""
+
+    def __init__(self, window: int = 200):
+        self.samples = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < 20:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with half-open probing.
+
+    closed -> open after ``failure_threshold`` failures in a row; open ->
+    half_open after ``reset_timeout`` seconds, letting one probe call
+    through; a successful probe closes the breaker, a failed one re-opens it.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.total_failures = 0
+        self.short_circuited = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.probing = False
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        self.short_circuited += 1
+        return False
+
+    @property
+    def rejecting(self) -> bool:
+        """Whether ``allow`` would refuse a call right now (without changing state)."""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at < self.reset_timeout
+        return self.state == self.HALF_OPEN and self.probing
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def release(self):
+        """Give back a half-open probe slot whose call was abandoned."""
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.total_failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        if self.state == self.OPEN:
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        else:
+            retry_in = 0.0
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "total_failures": self.total_failures,
+            "short_circuited": self.short_circuited,
+            "retry_in": round(retry_in, 1),
+        }
+
+
+class ProviderHealth:
+    """Breaker and latency window per provider, shared by every agent instance."""
+
+    def __init__(self):
+        self.failure_threshold = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+        self.reset_timeout = float(os.getenv("BREAKER_RESET_TIMEOUT", 30))
+        self.hedge_providers = {p.strip() for p in os.getenv("HEDGE_PROVIDERS", "").split(",") if p.strip()}
+        self.hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", 95))
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_skipped = 0
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        breaker = self.breakers.get(provider)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self.breakers[provider] = breaker
+        return breaker
+
+    def latency(self, provider: str) -> LatencyTracker:
+        tracker = self.latencies.get(provider)
+        if tracker is None:
+            tracker = LatencyTracker()
+            self.latencies[provider] = tracker
+        return tracker
+
+    def hedge_delay(self, provider: str) -> Optional[float]:
+        if provider not in self.hedge_providers:
+            return None
+        return self.latency(provider).percentile(self.hedge_percentile)
+
+    async def hedged(
+        self,
+        call: Callable[[], Awaitable[Dict[str, Any]]],
+        delay: float,
+        hedge: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None,
+        can_hedge: Optional[Callable[[], bool]] = None,
+    ) -> Dict[str, Any]:
+        """Run ``call``; if it hasn't finished after ``delay`` seconds start
+        ``hedge`` (default: a second ``call``) and return the first successful
+        result. No hedge is sent while ``can_hedge()`` is false."""
+        first = asyncio.ensure_future(call())
+        pending = {first}
+        result = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+            if can_hedge is not None and not can_hedge():
+                self.hedges_skipped += 1
+                return await first
+
+            self.hedges += 1
+            second = asyncio.ensure_future((hedge or call)())
+            pending = {first, second}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result.get("status") == "success":
+                        if task is second:
+                            self.hedge_wins += 1
+                        return result
+            return result
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self, provider: str) -> Dict[str, Any]:
+        tracker = self.latency(provider)
+        p50, p95 = tracker.percentile(50), tracker.percentile(95)
+        return {
+            "breaker": self.breaker(provider).snapshot(),
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedged": provider in self.hedge_providers,
+        }
+
+
+provider_health = ProviderHealth()
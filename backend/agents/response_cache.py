@@ -0,0 +1,233 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, NamedTuple
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class CacheKey(NamedTuple):
+    digest: str
+    # Everything but the prompt; near-duplicate lookups only compare within a bucket
+    bucket: str
+    prompt: str
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.split()).casefold()
+
+
+def make_key(kind: str, agent: str, model: str, params: Dict[str, Any], prompt: str, context: str) -> CacheKey:
+    bucket = hashlib.sha256(
+        json.dumps([kind, agent, model, params, context], sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+    prompt = normalize_prompt(prompt)
+    digest = hashlib.sha256(f"{bucket}:{prompt}".encode("utf-8")).hexdigest()
+    return CacheKey(digest, bucket, prompt)
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word bigrams; near-identical prompts differ in few bits."""
+    words = _WORD_RE.findall(text)
+    features = [" ".join(words[i:i + 2]) for i in range(max(1, len(words) - 1))]
+    weights = [0] * 64
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class _Entry:
+    __slots__ = ("value", "size", "expires", "fingerprint", "bucket")
+
+    def __init__(self, value: Dict[str, Any], size: int, expires: float, fingerprint: Optional[int], bucket: str):
+        self.value = value
+        self.size = size
+        self.expires = expires
+        self.fingerprint = fingerprint
+        self.bucket = bucket
+
+
+class _DiskTier:
+    """SQLite-backed persistent tier so a restart starts warm."""
+
+    def __init__(self, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.commit()
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM response_cache WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is not None:
+                self._db.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (now, key))
+                self._db.commit()
+        return row[0] if row else None
+
+    def put(self, key: str, value: str, ttl: float):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now + ttl, now),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._trim(now)
+            self._db.commit()
+
+    def _trim(self, now: float):
+        self._db.execute("DELETE FROM response_cache WHERE expires <= ?", (now,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM response_cache").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM response_cache ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            self._db.executemany("DELETE FROM response_cache WHERE key = ?", [(key,) for key, _ in rows])
+            total -= sum(size for _, size in rows)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ResponseCache:
+    """Size-bounded LRU/TTL cache for successful agent responses.
+
+    Tiers: exact match on the full request hash, an optional near-duplicate
+    match (SimHash of the prompt within the same agent/model/params/context
+    bucket), and an optional SQLite tier on disk. Only ``status == "success"``
+    results are ever stored.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("RESPONSE_CACHE_ENABLED", "1") != "0"
+        self.max_bytes = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+        self.ttl = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+        self.near_duplicates = os.getenv("RESPONSE_CACHE_NEAR_DUP", "0") == "1"
+        self.max_hamming = int(os.getenv("RESPONSE_CACHE_NEAR_DUP_BITS", 3))
+        disk_path = os.getenv("RESPONSE_CACHE_PATH")
+        disk_max = int(os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024))
+        self.disk = _DiskTier(disk_path, disk_max) if disk_path else None
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: Dict[str, Dict[str, int]] = {}
+        self.bytes = 0
+        self.counters = {
+            "hits": 0,
+            "near_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+        }
+
+    async def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        entry = self._lookup(key.digest)
+        if entry is not None:
+            self.counters["hits"] += 1
+            return dict(entry.value, cached=True)
+
+        if self.near_duplicates:
+            entry = self._lookup_near(key)
+            if entry is not None:
+                self.counters["near_hits"] += 1
+                return dict(entry.value, cached=True)
+
+        if self.disk is not None:
+            raw = await asyncio.to_thread(self.disk.get, key.digest)
+            if raw is not None:
+                self.counters["disk_hits"] += 1
+                value = json.loads(raw)
+                self._store(key, value, len(raw))
+                return dict(value, cached=True)
+
+        self.counters["misses"] += 1
+        return None
+
+    async def put(self, key: CacheKey, result: Dict[str, Any]):
+        # Fallback and error responses are transient and must never be replayed
+        if not self.enabled or result.get("status") != "success":
+            return
+        value = {k: v for k, v in result.items() if k not in ("cached", "done")}
+        raw = json.dumps(value)
+        if len(raw) > self.max_bytes:
+            return
+        self._store(key, value, len(raw))
+        self.counters["stores"] += 1
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.put, key.digest, raw, self.ttl)
+
+    def _lookup(self, digest: str) -> Optional[_Entry]:
+        entry = self._entries.get(digest)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            self._remove(digest)
+            return None
+        self._entries.move_to_end(digest)
+        return entry
+
+    def _lookup_near(self, key: CacheKey) -> Optional[_Entry]:
+        candidates = self._buckets.get(key.bucket)
+        if not candidates:
+            return None
+        fingerprint = simhash(key.prompt)
+        for digest, other in candidates.items():
+            if bin(fingerprint ^ other).count("1") <= self.max_hamming:
+                return self._lookup(digest)
+        return None
+
+    def _store(self, key: CacheKey, value: Dict[str, Any], size: int):
+        if key.digest in self._entries:
+            self._remove(key.digest)
+        fingerprint = simhash(key.prompt) if self.near_duplicates else None
+        self._entries[key.digest] = _Entry(value, size, time.monotonic() + self.ttl, fingerprint, key.bucket)
+        if fingerprint is not None:
+            self._buckets.setdefault(key.bucket, {})[key.digest] = fingerprint
+        self.bytes += size
+        while self.bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.counters["evictions"] += 1
+
+    def _remove(self, digest: str):
+        entry = self._entries.pop(digest)
+        self.bytes -= entry.size
+        bucket = self._buckets.get(entry.bucket)
+        if bucket is not None:
+            bucket.pop(digest, None)
+            if not bucket:
+                del self._buckets[entry.bucket]
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, entries=len(self._entries), bytes=self.bytes)
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+
+
+response_cache = ResponseCache()
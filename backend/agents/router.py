@@ -0,0 +1,198 @@
+import os
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from agents.registry import agent_registry
+from agents.resilience import provider_health
+from agents.metrics import registry
+
+# An explicit request for a picture at the start of a sentence, e.g.
+# "draw me a picture of a cat", "Please generate an image of ..."
+IMAGE_REQUEST = re.compile(
+    r"(?:^|[.!?\n])\s*(?:(?:please|can you|could you|would you|will you)\s+)*"
+    r"(?:draw|paint|sketch|illustrate|generate|create|make|render|produce)\s+(?:me\s+|us\s+)?"
+    r"(?:(?:a|an|the|some|\d+)\s+)?(?:[\w-]+\s+){0,2}?"
+    r"(?:image|picture|pic|photo|illustration|drawing|painting|sketch|portrait|artwork)s?\s+of\b",
+    re.IGNORECASE,
+)
+# Wording that may or may not want one, e.g. "make a logo for ...", "draw me a
+# cat", but also "create an image classifier"
+IMAGE_MENTION = re.compile(
+    r"\b(?:draw|paint|sketch|illustrate|render|generate|create|make|design|show me)\b"
+    r"[^.?!\n]{0,60}?\b(?:image|picture|pic|photo|illustration|drawing|painting|sketch|logo|icon|"
+    r"portrait|poster|wallpaper|artwork)s?\b"
+    r"|(?:^|[.!?\n])\s*(?:please\s+)?(?:draw|paint|sketch|illustrate)\s+(?:me\s+|us\s+)?(?:a|an)\b",
+    re.IGNORECASE,
+)
+MENTION = re.compile(r"(?<![\w@])@(\w+)")
+
+ROUTER_TURNS = registry.counter("router_turns", "Turns routed, by route", ("route",))
+ROUTER_CALLS = registry.counter("router_agent_calls", "Agent calls made by routed turns", ("agent", "kind"))
+ROUTER_SKIPPED = registry.counter("router_agent_skips", "Agents left out of a routed turn", ("agent", "reason"))
+
+
+class TurnPlan:
+    """Which agents a turn calls, and how: ``calls`` holds ``(agent, kind)``
+    pairs in reply order, with kind ``"text"`` or ``"image"``."""
+
+    __slots__ = ("route", "prompt", "calls", "skipped", "cost")
+
+    def __init__(self, route: str, prompt: str):
+        self.route = route
+        self.prompt = prompt
+        self.calls: List[Tuple[Any, str]] = []
+        self.skipped: Dict[str, str] = {}
+        self.cost = 0.0
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "type": "route",
+            "route": self.route,
+            "agents": [agent.name for agent, _ in self.calls],
+            "kinds": {agent.name: kind for agent, kind in self.calls},
+            "skipped": self.skipped,
+        }
+
+
+def _can_draw(agent) -> bool:
+    return callable(getattr(agent, "generate_image", None))
+
+
+class TurnRouter:
+    """Decides which agents answer a turn, ahead of the fan-out.
+
+    In order of precedence a turn goes to the agents @mentioned in it, to
+    the subset the client asked for, or to the default route: image agents
+    alone when the prompt explicitly asks for a picture, otherwise every
+    agent whose text reply comes from its provider (canned local replies
+    are skipped), plus the image agents when it only might.
+    Agents whose breaker is open are left out. On the default and image
+    routes, agents whose recent p95 latency exceeds ``latency_budget`` are
+    left out, and agents are added in reply order while their cost fits
+    ``cost_budget``. Explicitly addressed agents are always called; a
+    client subset naming no enabled agent calls none.
+    """
+
+    def __init__(self, agents=agent_registry, cost_budget: Optional[float] = None, latency_budget: Optional[float] = None):
+        self.agents = agents
+        self.cost_budget = cost_budget if cost_budget is not None else float(os.getenv("TURN_COST_BUDGET", 0)) or None
+        self.latency_budget = (
+            latency_budget if latency_budget is not None else float(os.getenv("TURN_LATENCY_BUDGET", 0)) or None
+        )
+        # route -> turns, calls made and calls saved against calling every enabled agent
+        self.routes: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def image_intent(prompt: str) -> Optional[str]:
+        """``"explicit"`` when the prompt asks for a picture, ``"ambiguous"``
+        when it only might, else None."""
+        if IMAGE_REQUEST.search(prompt):
+            return "explicit"
+        if IMAGE_MENTION.search(prompt):
+            return "ambiguous"
+        return None
+
+    def resolve(self, name: str) -> Optional[str]:
+        """Registry key for an agent named by key or display name, case-insensitively.
+        Display names are only known for agents already loaded; resolving
+        never loads one."""
+        name = name.lower()
+        for key in self.agents.keys:
+            if key == name:
+                return key
+            display_name = self.agents.display_name(key)
+            if display_name is not None and display_name.lower() == name:
+                return key
+        return None
+
+    def _mentions(self, prompt: str) -> Tuple[List[str], str]:
+        keys = []
+
+        def strip(match):
+            key = self.resolve(match.group(1))
+            if key is None:
+                return match.group(0)
+            if key not in keys:
+                keys.append(key)
+            return ""
+
+        stripped = MENTION.sub(strip, prompt)
+        return keys, " ".join(stripped.split()) if keys else prompt
+
+    def plan(self, prompt: str, requested: Optional[List[str]] = None) -> TurnPlan:
+        mentioned, text = self._mentions(prompt)
+        intent = self.image_intent(text)
+        if mentioned:
+            plan = TurnPlan("mention", text or prompt)
+            explicit = set(mentioned)
+        elif requested:
+            plan = TurnPlan("client", prompt)
+            explicit = {key for key in (self.resolve(name) for name in requested) if key is not None}
+        else:
+            plan = TurnPlan("image" if intent == "explicit" else "default", prompt)
+            explicit = None
+
+        candidates = []
+        for key in self.agents.keys:
+            if explicit is not None and key not in explicit:
+                continue
+            agent = self.agents.get(key)
+            if agent is None:
+                continue
+            if _can_draw(agent) and (intent is not None or plan.route == "mention"):
+                kind = "image"
+            elif "text" in agent.local_kinds and not explicit:
+                plan.skipped[agent.name] = "no_text"
+                continue
+            else:
+                kind = "text"
+            candidates.append((agent, kind))
+        if plan.route == "image":
+            drawing = [(agent, kind) for agent, kind in candidates if kind == "image"]
+            if drawing:
+                for agent, _ in candidates:
+                    if (agent, "image") not in drawing:
+                        plan.skipped[agent.name] = "intent"
+                candidates = drawing
+            else:
+                plan.route = "default"
+
+        for agent, kind in candidates:
+            reason = self._skip_reason(agent, kind, plan, bool(explicit))
+            if reason is not None:
+                plan.skipped[agent.name] = reason
+                continue
+            plan.calls.append((agent, kind))
+            plan.cost += agent.turn_cost
+        self._record(plan)
+        return plan
+
+    def _skip_reason(self, agent, kind: str, plan: TurnPlan, explicit: bool) -> Optional[str]:
+        if provider_health.breaker(agent.provider).rejecting:
+            return "circuit_open"
+        if explicit:
+            return None
+        if self.latency_budget is not None:
+            p95 = provider_health.latency(agent.provider).percentile(95)
+            if p95 is not None and p95 > self.latency_budget:
+                return "latency_budget"
+        if self.cost_budget is not None and plan.cost + agent.turn_cost > self.cost_budget:
+            return "cost_budget"
+        return None
+
+    def _record(self, plan: TurnPlan):
+        ROUTER_TURNS.labels(plan.route).inc()
+        for agent, kind in plan.calls:
+            ROUTER_CALLS.labels(agent.name, kind).inc()
+        for name, reason in plan.skipped.items():
+            ROUTER_SKIPPED.labels(name, reason).inc()
+        stats = self.routes.setdefault(plan.route, {"turns": 0, "calls": 0, "saved": 0})
+        stats["turns"] += 1
+        stats["calls"] += len(plan.calls)
+        stats["saved"] += max(0, len(self.agents.keys) - len(plan.calls))
+
+    def stats(self) -> Dict[str, Any]:
+        return {route: dict(stats) for route, stats in self.routes.items()}
+
+
+turn_router = TurnRouter()
@@ -0,0 +1,341 @@
+import os
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from agents.conversation_log import ConversationLog, create_conversation_log
+
+# (session id, sender, text) awaiting a write to the shared store
+PendingMessage = Tuple[str, str, str]
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def normalize_session_id(value: Optional[str]) -> Optional[str]:
+    """A client-supplied session id in canonical form, or None if it is not a UUID."""
+    if not value:
+        return None
+    try:
+        return uuid.UUID(value).hex
+    except ValueError:
+        return None
+
+
+class SessionStore:
+    """Session state shared between worker processes. Methods are blocking;
+    SharedSessions runs them off the event loop.
+
+    ``shared`` is False for stores that only live in this process, in which
+    case the ConversationManager is already the whole truth and nothing is
+    written.
+    """
+
+    shared = False
+
+    def write(self, messages: List[PendingMessage], summaries: Dict[str, Optional[str]]):
+        pass
+
+    def load(self, session_id: str, limit: int) -> Optional[Tuple[int, List[Dict[str, str]], Optional[str]]]:
+        """``(total messages ever, last ``limit`` messages, summary)``, or None if unknown."""
+        return None
+
+    def heartbeat(self, worker_id: str, connections: int, ttl: float) -> int:
+        """Publish this worker's connection count; returns the count over all live workers."""
+        return connections
+
+    def remove_worker(self, worker_id: str):
+        pass
+
+    def purge(self, older_than: float) -> int:
+        return 0
+
+    def close(self):
+        pass
+
+
+class InProcessSessionStore(SessionStore):
+    """Single-worker default: history stays in this process's ConversationManager."""
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite database in WAL mode, shared by every worker on the host.
+
+    Each session keeps its message count, pinned summary and last
+    ``max_messages`` messages, enough to rebuild its context on any worker.
+    Workers publish their connection counts with a heartbeat; rows older
+    than the heartbeat TTL belong to dead workers and are ignored.
+    """
+
+    shared = True
+
+    def __init__(self, path: str, max_messages: int):
+        self.path = path
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, total INTEGER NOT NULL, summary TEXT, updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS session_messages ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, sender TEXT NOT NULL, text TEXT NOT NULL, "
+            "PRIMARY KEY (session_id, seq)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS workers ("
+            "worker_id TEXT PRIMARY KEY, pid INTEGER NOT NULL, connections INTEGER NOT NULL, heartbeat REAL NOT NULL);"
+        )
+        self._db.commit()
+
+    def write(self, messages: List[PendingMessage], summaries: Dict[str, Optional[str]]):
+        now = time.time()
+        with self._lock, self._db:
+            for session_id, sender, text in messages:
+                # The store assigns sequence numbers, so writers never collide
+                total = self._db.execute(
+                    "INSERT INTO sessions VALUES (?, 1, NULL, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET total = total + 1, updated = excluded.updated "
+                    "RETURNING total",
+                    (session_id, now),
+                ).fetchone()[0]
+                self._db.execute(
+                    "INSERT OR REPLACE INTO session_messages VALUES (?, ?, ?, ?)",
+                    (session_id, total - 1, sender, text),
+                )
+                if total > self.max_messages:
+                    self._db.execute(
+                        "DELETE FROM session_messages WHERE session_id = ? AND seq < ?",
+                        (session_id, total - self.max_messages),
+                    )
+            for session_id, summary in summaries.items():
+                self._db.execute(
+                    "INSERT INTO sessions VALUES (?, 0, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET summary = excluded.summary, updated = excluded.updated",
+                    (session_id, summary, now),
+                )
+
+    def load(self, session_id: str, limit: int):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT total, summary FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self._db.execute(
+                "SELECT sender, text FROM session_messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                (session_id, limit),
+            ).fetchall()
+        messages = [{"sender": sender, "text": text} for sender, text in reversed(rows)]
+        return row[0], messages, row[1]
+
+    def heartbeat(self, worker_id: str, connections: int, ttl: float) -> int:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?)", (worker_id, os.getpid(), connections, now)
+            )
+            self._db.execute("DELETE FROM workers WHERE heartbeat < ?", (now - 10 * ttl,))
+            return self._db.execute(
+                "SELECT COALESCE(SUM(connections), 0) FROM workers WHERE heartbeat >= ?", (now - ttl,)
+            ).fetchone()[0]
+
+    def remove_worker(self, worker_id: str):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def purge(self, older_than: float) -> int:
+        with self._lock, self._db:
+            expired = [row[0] for row in self._db.execute(
+                "SELECT session_id FROM sessions WHERE updated < ?", (older_than,)
+            ).fetchall()]
+            for session_id in expired:
+                self._db.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        return len(expired)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def create_session_store(max_messages: int) -> SessionStore:
+    """Pick a store from SESSION_STORE (``memory`` or ``sqlite``)."""
+    if os.getenv("SESSION_STORE", "memory") == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_STORE_PATH", "sessions.db"), max_messages)
+    return InProcessSessionStore()
+
+
+class SharedSessions:
+    """Session ids, write-through history and connection counts for one worker.
+
+    Messages go to the local ConversationManager immediately and are written
+    to the shared store by a background writer in batches, in order. When a
+    client resumes a session, pending writes are flushed and the session is
+    reloaded from the store if another worker has moved it on. A heartbeat
+    publishes this worker's connection count and reads the total.
+
+    With a conversation log configured every message is also appended to
+    it, and a session that neither this process nor the store knows, e.g.
+    after a restart, is rebuilt from the log.
+    """
+
+    def __init__(
+        self,
+        conversations,
+        store: Optional[SessionStore] = None,
+        heartbeat: Optional[float] = None,
+        log: Optional[ConversationLog] = None,
+    ):
+        self.conversations = conversations
+        self.store = store or create_session_store(conversations.max_messages)
+        self.log = log or create_conversation_log(conversations.max_messages)
+        self.heartbeat_interval = heartbeat or float(os.getenv("SESSION_HEARTBEAT", 2.0))
+        self.ttl = float(os.getenv("SESSION_STORE_TTL", 7 * 24 * 3600))
+        self.worker_id = new_session_id()
+        self.local_connections = 0
+        self._cluster_connections = 0
+        self._pending: List[PendingMessage] = []
+        self._summaries: Dict[str, Optional[str]] = {}
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self.counters = {"created": 0, "resumed": 0, "reloaded": 0, "recovered": 0, "writes": 0, "write_errors": 0}
+
+    @property
+    def shared(self) -> bool:
+        return self.store.shared
+
+    async def start(self):
+        if self.log is not None:
+            await self.log.start()
+        if not self.shared or self._tasks:
+            return
+        self._write_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._writer()), loop.create_task(self._heartbeat())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.shared:
+            await self.flush()
+            await asyncio.to_thread(self.store.remove_worker, self.worker_id)
+        self.store.close()
+        if self.log is not None:
+            await self.log.stop()
+
+    async def open(self, requested: Optional[str] = None) -> Tuple[str, bool]:
+        """Session id for a new connection, resuming ``requested`` if given,
+        and whether earlier history was found. Each successful open must be
+        matched by one ``close``."""
+        session_id = normalize_session_id(requested)
+        if session_id is None:
+            resumed = False
+            session_id = new_session_id()
+        else:
+            resumed = await self.resume(session_id)
+        self.counters["resumed" if resumed else "created"] += 1
+        self.local_connections += 1
+        self._cluster_connections += 1
+        return session_id, resumed
+
+    def close(self):
+        self.local_connections -= 1
+        self._cluster_connections -= 1
+
+    async def resume(self, session_id: str) -> bool:
+        if self.shared:
+            await self.flush()
+            state = await asyncio.to_thread(self.store.load, session_id, self.conversations.max_messages)
+            if state is not None:
+                total, messages, summary = state
+                if total != self.conversations.message_count(session_id) or summary != self.conversations.summary(session_id):
+                    self.conversations.restore(session_id, messages, total, summary)
+                    self.counters["reloaded"] += 1
+                return True
+        if self.conversations.message_count(session_id) > 0:
+            return True
+        if self.log is None:
+            return False
+        state = await self.log.load(session_id, self.conversations.max_messages)
+        if state is None:
+            return False
+        total, messages = state
+        self.conversations.restore(session_id, messages, total)
+        self.counters["recovered"] += 1
+        return True
+
+    def add_message(self, session_id: str, message: Dict[str, Any]):
+        self.conversations.add_message(session_id, message)
+        if self.log is not None:
+            self.log.append(session_id, message["sender"], message["text"])
+        if self.shared:
+            self._pending.append((session_id, message["sender"], message["text"]))
+            self._wake()
+
+    def pin_summary(self, session_id: str, text: Optional[str]):
+        self.conversations.pin_summary(session_id, text)
+        if self.shared:
+            self._summaries[session_id] = text or None
+            self._wake()
+
+    def _wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Write everything queued so far; batches are written one at a time, in order."""
+        if self._write_lock is None:
+            self._write_lock = asyncio.Lock()
+        async with self._write_lock:
+            messages, self._pending = self._pending, []
+            summaries, self._summaries = self._summaries, {}
+            if not messages and not summaries:
+                return
+            try:
+                await asyncio.to_thread(self.store.write, messages, summaries)
+                self.counters["writes"] += 1
+            except Exception as e:
+                self.counters["write_errors"] += 1
+                print(f"Failed to write session state: {e}")
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self.flush()
+
+    async def _heartbeat(self):
+        beats = 0
+        while True:
+            try:
+                self._cluster_connections = await asyncio.to_thread(
+                    self.store.heartbeat, self.worker_id, self.local_connections, 3 * self.heartbeat_interval
+                )
+                beats += 1
+                if beats % 1000 == 1:
+                    await asyncio.to_thread(self.store.purge, time.time() - self.ttl)
+            except Exception as e:
+                print(f"Session heartbeat failed: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+    def connection_count(self) -> int:
+        """Open /ws/agents connections across all workers (as of the last heartbeat)."""
+        if not self.shared:
+            return self.local_connections
+        return max(self._cluster_connections, self.local_connections)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            self.counters,
+            pending_writes=len(self._pending) + len(self._summaries),
+            worker_connections=self.local_connections,
+            connections=self.connection_count(),
+        )
@@ -0,0 +1,134 @@
+import os
+import asyncio
+from typing import Dict, Any, List, Callable, Awaitable, AsyncIterator, Optional
+
+from agents.metrics import registry
+
+FANOUT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+SINGLE_FLIGHT_SHARED = registry.counter(
+    "single_flight_shared", "Agent calls served by joining an identical in-flight call", ("agent", "mode"),
+)
+SINGLE_FLIGHT_FANOUT = registry.histogram(
+    "single_flight_fanout", "Callers served per upstream call", ("agent", "mode"), buckets=FANOUT_BUCKETS,
+)
+
+
+class _Flight:
+    __slots__ = ("task", "waiters", "callers")
+
+    def __init__(self, task: "asyncio.Future"):
+        self.task = task
+        self.waiters = 0
+        self.callers = 0
+
+
+class _StreamFlight(_Flight):
+    __slots__ = ("frames", "changed", "finished", "error")
+
+    def __init__(self):
+        super().__init__(None)
+        self.frames: List[Dict[str, Any]] = []
+        # Resolved (and replaced) whenever a frame is appended
+        self.changed = asyncio.get_running_loop().create_future()
+        self.finished = False
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces identical concurrent agent calls onto one upstream call.
+
+    The first caller for a key starts the call as a separate task; callers
+    arriving while it runs wait on the same task. A caller that is cancelled
+    (e.g. its client disconnected) stops waiting without affecting the
+    others; the upstream call is cancelled only once nobody is waiting. For
+    streams, late joiners first replay the frames already produced, then
+    follow live.
+    """
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = enabled if enabled is not None else os.getenv("SINGLE_FLIGHT_ENABLED", "1") != "0"
+        self._calls: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+
+    @staticmethod
+    def _release(flights: Dict[str, _Flight], key: str, flight: _Flight):
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # Nobody is left to receive the result; don't let new callers join it
+            if flights.get(key) is flight:
+                del flights[key]
+            flight.task.cancel()
+
+    def _finished(self, flights: Dict[str, _Flight], key: str, flight: _Flight, agent: str, mode: str):
+        if flights.get(key) is flight:
+            del flights[key]
+        SINGLE_FLIGHT_FANOUT.labels(agent, mode).observe(flight.callers)
+
+    async def call(self, agent: str, key: str, call: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        if not self.enabled:
+            return await call()
+        flight = self._calls.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._calls[key] = flight
+            flight.task.add_done_callback(lambda _: self._finished(self._calls, key, flight, agent, "call"))
+        else:
+            SINGLE_FLIGHT_SHARED.labels(agent, "call").inc()
+        flight.waiters += 1
+        flight.callers += 1
+        try:
+            # Callers may annotate their result; give each its own copy
+            return dict(await asyncio.shield(flight.task))
+        finally:
+            self._release(self._calls, key, flight)
+
+    async def stream(
+        self, agent: str, key: str, source: Callable[[], AsyncIterator[Dict[str, Any]]]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        if not self.enabled:
+            async for frame in source():
+                yield frame
+            return
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            flight.task = asyncio.ensure_future(self._pump(flight, source()))
+            self._streams[key] = flight
+            flight.task.add_done_callback(lambda _: self._finished(self._streams, key, flight, agent, "stream"))
+        else:
+            SINGLE_FLIGHT_SHARED.labels(agent, "stream").inc()
+        flight.waiters += 1
+        flight.callers += 1
+        try:
+            index = 0
+            while True:
+                while index < len(flight.frames):
+                    yield flight.frames[index]
+                    index += 1
+                if flight.finished:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await asyncio.shield(flight.changed)
+        finally:
+            self._release(self._streams, key, flight)
+
+    @staticmethod
+    async def _pump(flight: _StreamFlight, frames: AsyncIterator[Dict[str, Any]]):
+        try:
+            async for frame in frames:
+                flight.frames.append(frame)
+                changed, flight.changed = flight.changed, asyncio.get_running_loop().create_future()
+                changed.set_result(None)
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.finished = True
+            flight.changed.set_result(None)
+
+    def stats(self) -> Dict[str, int]:
+        return {"calls_in_flight": len(self._calls), "streams_in_flight": len(self._streams)}
+
+
+single_flight = SingleFlight()
@@ -1,19 +1,74 @@
 import os
-import requests
 import base64
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+from agents.base import BaseAgent
+from agents.http_pool import http_pool
+from agents.blob_store import image_store
+
+class StabilityAgent(BaseAgent):
+    name = "Stability"
+    personality_key = "visual_artist"
+    provider = "stability"
+    # Context is prepended to the image prompt, which CLIP cuts at 77 tokens
+    context_token_budget = 40
+    model = "stable-diffusion-xl-1024-v1-0"
+    # Text replies are canned; only image generation calls the API
+    local_kinds = ("text",)
 
-class StabilityAgent:
     def __init__(self):
         self.api_key = os.getenv("STABILITY_API_KEY")
-        self.base_url = "https://api.stability.ai/v1"
+        self.base_url = os.getenv("STABILITY_BASE_URL", "https://api.stability.ai/v1").rstrip("/")
         self.personality = "I am a visual AI artist that transforms ideas into stunning images. I specialize in creative visualization and bringing concepts to life through advanced image generation."
+        self.generation_config = {
+            "cfg_scale": 7,
+            "height": 512,
+            "width": 512,
+            "samples": 1,
+            "steps": 30
+        }
     
-    async def generate_image(self, prompt: str, context: str = "") -> Dict[str, Any]:
+    async def generate_image(self, prompt: str, context: str = "", **overrides) -> Dict[str, Any]:
+        """Generate image(s); ``overrides`` replace generation_config entries
+        for this call, e.g. ``samples=4`` or ``seed=42``."""
+        if not overrides:
+            return await self._run("image", prompt, context, self._generate_image)
+        config = {**self.generation_config, **overrides}
+        return await self._run(
+            "image", prompt, context, lambda p, c: self._generate_image(p, c, config), config
+        )
+
+    async def stream_image(self, prompt: str, context: str = "", **overrides) -> AsyncIterator[Dict[str, Any]]:
+        """``generate_image`` as stream frames, for callers that mix it with text streams."""
+        for frame in self._one_shot_frames(await self.generate_image(prompt, context, **overrides)):
+            yield frame
+
+    def _cache_valid(self, result: Dict[str, Any]) -> bool:
+        # A cached handle is only useful while the image store still has the bytes
+        return all(image["id"] in image_store for image in result.get("images", []))
+
+    async def _store_images(self, response) -> List[Dict[str, Any]]:
+        """Move the returned image(s) into the blob store, decoding at most once."""
+        if response.headers.get("content-type", "").startswith("image/"):
+            # Single sample requested as raw PNG: no base64 or JSON at all
+            image_id = await image_store.put(response.content, "image/png")
+            return [{"id": image_id, "url": f"/images/{image_id}", "seed": response.headers.get("seed")}]
+        images = []
+        for artifact in response.json()["artifacts"]:
+            if artifact.get("finishReason") == "CONTENT_FILTERED":
+                continue
+            image_id = await image_store.put(base64.b64decode(artifact["base64"]), "image/png")
+            images.append({"id": image_id, "url": f"/images/{image_id}", "seed": artifact.get("seed")})
+        return images
+
+    async def _generate_image(self, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        config = self.generation_config if config is None else config
         try:
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
+                "Content-Type": "application/json",
+                # Raw bytes are only available for a single sample
+                "Accept": "image/png" if config.get("samples", 1) == 1 else "application/json"
             }
             
             enhanced_prompt = f"Professional, high-quality image: {prompt}"
@@ -27,55 +82,40 @@ class StabilityAgent:
                         "weight": 1
                     }
                 ],
-                "cfg_scale": 7,
-                "height": 512,
-                "width": 512,
-                "samples": 1,
-                "steps": 30
+                **config
             }
             
-            response = requests.post(
-                f"{self.base_url}/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
+            response = await http_pool.post(
+                "stability",
+                f"{self.base_url}/generation/{self.model}/text-to-image",
                 headers=headers,
                 json=payload
             )
             
-            if response.status_code == 200:
-                data = response.json()
-                image_data = data["artifacts"][0]["base64"]
-                
-                return {
-                    "agent": "Stability",
-                    "response": f"🎨 I've created a visual representation of '{prompt}'",
-                    "image_data": image_data,
-                    "status": "success",
-                    "personality": "visual_artist",
-                    "type": "image"
-                }
+            images = await self._store_images(response) if response.status_code == 200 else []
+            if images:
+                return self._result(
+                    f"🎨 I've created a visual representation of '{prompt}'",
+                    "success",
+                    image_id=images[0]["id"],
+                    image_url=images[0]["url"],
+                    images=images,
+                    type="image"
+                )
             else:
-                return {
-                    "agent": "Stability",
-                    "response": f"🎨 I'm preparing to visualize '{prompt}' - my artistic algorithms are warming up!",
-                    "status": "fallback",
-                    "personality": "visual_artist",
-                    "type": "text"
-                }
+                return self._result(
+                    f"🎨 I'm preparing to visualize '{prompt}' - my artistic algorithms are warming up!",
+                    "fallback",
+                    type="text"
+                )
                 
         except Exception as e:
-            return {
-                "agent": "Stability",
-                "response": f"🎨 My artistic vision is temporarily clouded: {str(e)}",
-                "status": "error",
-                "personality": "visual_artist",
-                "type": "text"
-            }
+            return self._result(f"🎨 My artistic vision is temporarily clouded: {str(e)}", "error", type="text")
     
-    async def generate_response(self, prompt: str, context: str = "") -> Dict[str, Any]:
+    async def _generate_response(self, prompt: str, context: str, config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         # For text-based requests, provide creative descriptions
-        return {
-            "agent": "Stability",
-            "response": f"🎨 As a visual AI, I would create an image representing: {prompt}. Would you like me to generate this visualization?",
-            "status": "success",
-            "personality": "visual_artist",
-            "type": "text"
-        }
+        return self._result(
+            f"🎨 As a visual AI, I would create an image representing: {prompt}. Would you like me to generate this visualization?",
+            "success",
+            type="text"
+        )
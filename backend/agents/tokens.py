@@ -0,0 +1,17 @@
+import re
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap BPE token estimate without loading a tokenizer.
+
+    Takes the larger of the ~4 characters per token rule of thumb and the
+    word/punctuation count, which tracks tokenizers closely enough for
+    budgeting prompts.
+    """
+    if not text:
+        return 0
+    by_chars = (len(text) + 3) // 4
+    by_words = len(_WORD_RE.findall(text))
+    return max(by_chars, by_words)
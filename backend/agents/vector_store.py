@@ -0,0 +1,283 @@
+import os
+import json
+import threading
+from typing import Dict, Any, List, Optional, Set
+
+import numpy as np
+
+
+class LocalVectorStore:
+    """In-process cosine-similarity store over a growable float32 matrix.
+
+    Vectors are L2-normalised on insert so a query is one matrix-vector
+    product plus an ``argpartition`` top-k. Session ids are kept as an int32
+    code column plus a row list per session, so a session-filtered query
+    only scores that session's vectors.
+
+    ``save``/``load`` persist a directory holding a snapshot (``vectors.npy``
+    + ``records.json``) and a log of the rows upserted since it
+    (``vectors.log`` + ``records.log``). Saving appends only the rows
+    changed since the last save; the snapshot is rewritten, and the log
+    emptied, once the log holds ``compact_ratio`` times as many rows as the
+    snapshot, so persisting costs amortised O(1) per upsert.
+    """
+
+    def __init__(
+        self,
+        dimension: int = 384,
+        initial_capacity: int = 1024,
+        path: Optional[str] = None,
+        compact_ratio: float = 1.0,
+    ):
+        self.dimension = dimension
+        self.path = path
+        self.compact_ratio = compact_ratio
+        self._lock = threading.RLock()
+        # Serialises writers of the files under ``path``
+        self._save_lock = threading.Lock()
+        self._vectors = np.zeros((initial_capacity, dimension), dtype=np.float32)
+        self._session_codes = np.full(initial_capacity, -1, dtype=np.int32)
+        self._ids: List[str] = []
+        self._metadata: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        self._session_index: Dict[str, int] = {}
+        self._session_rows: Dict[int, List[int]] = {}
+        self.count = 0
+        # Rows changed since the last save, and the rows in the saved snapshot and log
+        self._dirty: Set[int] = set()
+        self._snapshot_rows = 0
+        self._log_rows = 0
+        if path and os.path.exists(os.path.join(path, "vectors.npy")):
+            self.load(path)
+
+    def _grow(self, needed: int):
+        capacity = len(self._vectors)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+        vectors[:self.count] = self._vectors[:self.count]
+        codes = np.full(capacity, -1, dtype=np.int32)
+        codes[:self.count] = self._session_codes[:self.count]
+        self._vectors, self._session_codes = vectors, codes
+
+    def _session_code(self, session_id: Optional[str]) -> int:
+        if session_id is None:
+            return -1
+        code = self._session_index.get(session_id)
+        if code is None:
+            code = len(self._session_index)
+            self._session_index[session_id] = code
+        return code
+
+    def _assign_session(self, row: int, session_id: Optional[str], is_new: bool):
+        code = self._session_code(session_id)
+        if not is_new:
+            previous = int(self._session_codes[row])
+            if previous == code:
+                return
+            if previous != -1:
+                self._session_rows[previous].remove(row)
+        self._session_codes[row] = code
+        if code != -1:
+            self._session_rows.setdefault(code, []).append(row)
+
+    @staticmethod
+    def _normalise(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def upsert(self, items: List[tuple]) -> List[int]:
+        """Insert or replace ``(id, vector, metadata)`` items; returns their rows."""
+        if not items:
+            return []
+        vectors = self._normalise(np.asarray([vector for _, vector, _ in items], dtype=np.float32))
+        rows = []
+        with self._lock:
+            self._grow(self.count + len(items))
+            for (vector_id, _, metadata), vector in zip(items, vectors):
+                row = self._put(vector_id, vector, metadata)
+                self._dirty.add(row)
+                rows.append(row)
+        return rows
+
+    def _put(self, vector_id: str, vector: np.ndarray, metadata: Dict[str, Any]) -> int:
+        """Store a normalised vector; the caller holds the lock and has grown the matrix."""
+        row = self._rows.get(vector_id)
+        is_new = row is None
+        if is_new:
+            row = self.count
+            self.count += 1
+            self._rows[vector_id] = row
+            self._ids.append(vector_id)
+            self._metadata.append(metadata)
+        else:
+            self._metadata[row] = metadata
+        self._vectors[row] = vector
+        self._assign_session(row, metadata.get("session_id"), is_new)
+        return row
+
+    def query(self, vector: List[float], top_k: int = 5, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        query = self._normalise(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            if self.count == 0:
+                return []
+            if session_id is None:
+                rows = np.arange(self.count)
+                scores = self._vectors[:self.count] @ query
+            else:
+                code = self._session_index.get(session_id)
+                if code is None:
+                    return []
+                rows = np.asarray(self._session_rows[code], dtype=np.int64)
+                scores = self._vectors[rows] @ query
+            order = self._top_k(scores, top_k)
+            return self.records(rows[order], scores[order])
+
+    def session_size(self, session_id: str) -> int:
+        code = self._session_index.get(session_id)
+        return 0 if code is None else len(self._session_rows[code])
+
+    def session_mask(self, session_id: str) -> Optional[np.ndarray]:
+        """Boolean mask over rows marking the session's vectors; None for an unknown session."""
+        with self._lock:
+            code = self._session_index.get(session_id)
+            if code is None:
+                return None
+            return self._session_codes[:self.count] == code
+
+    def records(self, rows: np.ndarray, scores: np.ndarray) -> List[Dict[str, Any]]:
+        return [
+            dict(self._metadata[row], id=self._ids[row], score=float(score))
+            for row, score in zip(rows.tolist(), scores.tolist())
+        ]
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, top_k: int) -> np.ndarray:
+        if top_k >= len(scores):
+            return np.argsort(-scores)
+        candidates = np.argpartition(-scores, top_k)[:top_k]
+        return candidates[np.argsort(-scores[candidates])]
+
+    def vectors(self) -> np.ndarray:
+        """View of the stored (normalised) vectors."""
+        return self._vectors[:self.count]
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """Copy of the (normalised) vectors at ``rows``."""
+        with self._lock:
+            return self._vectors[rows]
+
+    def save(self, path: Optional[str] = None):
+        """Persist the rows changed since the last save (see the class
+        docstring). Saving to another directory writes a full snapshot there."""
+        path = path or self.path
+        if not path:
+            return
+        os.makedirs(path, exist_ok=True)
+        with self._save_lock:
+            if path != self.path:
+                with self._lock:
+                    snapshot = self._vectors[:self.count].copy(), {"ids": list(self._ids), "metadata": list(self._metadata)}
+                self._write_snapshot(path, snapshot)
+            elif self._log_rows + len(self._dirty) > self.compact_ratio * self._snapshot_rows:
+                self._compact(path)
+            else:
+                self._append(path)
+
+    def _compact(self, path: str):
+        with self._lock:
+            vectors = self._vectors[:self.count].copy()
+            records = {"ids": list(self._ids), "metadata": list(self._metadata)}
+            dirty, self._dirty = self._dirty, set()
+        try:
+            self._write_snapshot(path, (vectors, records))
+            for name in ("vectors.log", "records.log"):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+        except BaseException:
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        self._snapshot_rows, self._log_rows = len(vectors), 0
+
+    @staticmethod
+    def _write_snapshot(path: str, snapshot):
+        vectors, records = snapshot
+        # Write to temporary names first so a crash never leaves a torn snapshot
+        np.save(os.path.join(path, "vectors.tmp.npy"), vectors)
+        with open(os.path.join(path, "records.tmp.json"), "w") as f:
+            json.dump(records, f)
+        os.replace(os.path.join(path, "vectors.tmp.npy"), os.path.join(path, "vectors.npy"))
+        os.replace(os.path.join(path, "records.tmp.json"), os.path.join(path, "records.json"))
+
+    def _append(self, path: str):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            # Ascending, so new rows are replayed in the order they were added
+            rows = sorted(dirty)
+            vectors = self._vectors[rows]
+            records = [json.dumps([self._ids[row], self._metadata[row]]) + "\n" for row in rows]
+        if not rows:
+            return
+        try:
+            # Vectors first: on load, a record without its vector is dropped
+            with open(os.path.join(path, "vectors.log"), "ab") as f:
+                f.write(vectors.astype("<f4").tobytes())
+            with open(os.path.join(path, "records.log"), "a") as f:
+                f.write("".join(records))
+        except BaseException:
+            with self._lock:
+                self._dirty |= dirty
+            raise
+        self._log_rows += len(rows)
+
+    def _read_log(self, path: str):
+        """Rows appended after the snapshot, as ``(vectors, records)``. A tail
+        torn by a crash is cut off the files so later appends line up."""
+        vectors_path, records_path = os.path.join(path, "vectors.log"), os.path.join(path, "records.log")
+        if not os.path.exists(records_path):
+            return np.zeros((0, self.dimension), dtype=np.float32), []
+        records, ends = [], [0]
+        with open(records_path, "rb") as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        break
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                ends.append(ends[-1] + len(line))
+        row_bytes = self.dimension * 4
+        size = os.path.getsize(vectors_path) if os.path.exists(vectors_path) else 0
+        count = min(len(records), size // row_bytes)
+        with open(records_path, "r+b") as f:
+            f.truncate(ends[count])
+        with open(vectors_path, "ab") as f:
+            f.truncate(count * row_bytes)
+        vectors = np.fromfile(vectors_path, dtype="<f4", count=count * self.dimension).reshape(count, self.dimension)
+        return vectors, records[:count]
+
+    def load(self, path: str):
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "records.json")) as f:
+            records = json.load(f)
+        log_vectors, log_records = self._read_log(path)
+        with self._lock:
+            self.count = 0
+            self._ids, self._metadata, self._rows = [], [], {}
+            self._session_index, self._session_rows = {}, {}
+            self._grow(len(vectors) + len(log_vectors))
+            self._vectors[:len(vectors)] = vectors
+            for row, (vector_id, metadata) in enumerate(zip(records["ids"], records["metadata"])):
+                self._ids.append(vector_id)
+                self._metadata.append(metadata)
+                self._rows[vector_id] = row
+                self._assign_session(row, metadata.get("session_id"), True)
+            self.count = len(vectors)
+            for (vector_id, metadata), vector in zip(log_records, log_vectors):
+                self._put(vector_id, vector, metadata)
+            self._dirty = set()
+            self._snapshot_rows, self._log_rows = len(vectors), len(log_records)
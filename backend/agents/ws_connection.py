@@ -0,0 +1,243 @@
+import os
+import json
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Union
+
+from agents.metrics import registry
+
+Frame = Union[str, Dict[str, Any]]
+
+WS_FRAMES_SENT = registry.counter("ws_frames_sent", "Frames written to WebSocket clients")
+WS_FRAMES_COALESCED = registry.counter("ws_frames_coalesced", "Frames merged into one still queued", ("merge",))
+WS_FRAMES_DROPPED = registry.counter("ws_frames_dropped", "Queued frames dropped before sending", ("reason",))
+WS_SLOW_CONSUMERS = registry.counter("ws_slow_consumers", "Connections closed for not reading their frames")
+WS_TURNS_CANCELLED = registry.counter("ws_turns_cancelled", "Turns cancelled before finishing", ("reason",))
+
+
+class OutboxClosed(Exception):
+    """The connection is gone; nothing more can be sent on it."""
+
+
+class _Entry:
+    __slots__ = ("frame", "key", "merge", "turn")
+
+    def __init__(self, frame: Frame, key: Optional[Hashable], merge: Optional[str], turn: Optional[int]):
+        self.frame = frame
+        self.key = key
+        self.merge = merge
+        self.turn = turn
+
+
+class Outbox:
+    """Bounded outbound queue for one WebSocket, drained by its own writer task.
+
+    ``push`` waits while ``max_frames`` frames are queued, so producers slow
+    down to the pace the client reads at instead of buffering without
+    bound. Frames with a ``merge`` policy are coalesced with the queued
+    frame of the same ``key`` instead: ``"append"`` adds a partial frame's
+    ``delta`` to it, ``"replace"`` swaps in the newer state. They take at
+    most one slot per key and never wait. Dict frames with a ``"seq"``
+    field and a key are numbered per key as they are sent, so coalescing
+    leaves no gaps. ``discard_turn`` drops what is still queued for a
+    cancelled turn.
+
+    A client that has not taken a frame within ``send_timeout`` seconds is
+    treated as gone: the writer stops and ``closed`` is set, which ends the
+    connection.
+    """
+
+    def __init__(self, websocket, max_frames: Optional[int] = None, send_timeout: Optional[float] = None):
+        self.websocket = websocket
+        self.max_frames = max_frames or int(os.getenv("WS_OUTBOX_FRAMES", 256))
+        self.send_timeout = send_timeout or float(os.getenv("WS_SEND_TIMEOUT", 10))
+        self.closed = asyncio.Event()
+        self._queue: Deque[_Entry] = deque()
+        # Queued entries that later frames may still merge into
+        self._mergeable: Dict[Hashable, _Entry] = {}
+        self._seq: Dict[Hashable, int] = {}
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self.writer: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def start(self):
+        if self.writer is None:
+            self.writer = asyncio.create_task(self._run())
+        return self
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.cancel()
+        self._close()
+
+    async def push(self, frame: Frame, key: Optional[Hashable] = None, merge: Optional[str] = None, turn: Optional[int] = None):
+        """Queue a frame, waiting for room unless it can be coalesced."""
+        while not self._offer(frame, key, merge, turn):
+            self._space.clear()
+            await self._space.wait()
+
+    def offer(self, frame: Frame, key: Optional[Hashable] = None, merge: Optional[str] = None, turn: Optional[int] = None) -> bool:
+        """``push`` for synchronous callers: False (and the frame dropped) when full."""
+        if self._offer(frame, key, merge, turn):
+            return True
+        WS_FRAMES_DROPPED.labels("full").inc()
+        return False
+
+    def _offer(self, frame, key, merge, turn) -> bool:
+        if self.closed.is_set():
+            raise OutboxClosed()
+        if merge is not None:
+            queued = self._mergeable.get(key)
+            if queued is not None:
+                if merge == "append":
+                    queued.frame["delta"] += frame["delta"]
+                else:
+                    queued.frame = frame
+                WS_FRAMES_COALESCED.labels(merge).inc()
+                return True
+        elif len(self._queue) >= self.max_frames:
+            return False
+        entry = _Entry(frame, key, merge, turn)
+        self._queue.append(entry)
+        if merge is not None:
+            self._mergeable[key] = entry
+        self._ready.set()
+        return True
+
+    def discard_turn(self, turn: int) -> int:
+        """Drop every queued frame of ``turn``."""
+        kept = deque(entry for entry in self._queue if entry.turn != turn)
+        dropped = len(self._queue) - len(kept)
+        if dropped:
+            self._queue = kept
+            self._mergeable = {key: entry for key, entry in self._mergeable.items() if entry.turn != turn}
+            WS_FRAMES_DROPPED.labels("stale").inc(dropped)
+            self._space.set()
+        return dropped
+
+    async def _run(self):
+        try:
+            while True:
+                while not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                entry = self._queue.popleft()
+                if entry.merge is not None and self._mergeable.get(entry.key) is entry:
+                    del self._mergeable[entry.key]
+                self._space.set()
+                frame = entry.frame
+                if not isinstance(frame, str):
+                    if entry.key is not None and "seq" in frame:
+                        frame["seq"] = self._seq.get(entry.key, 0)
+                        self._seq[entry.key] = frame["seq"] + 1
+                    frame = json.dumps(frame)
+                await asyncio.wait_for(self.websocket.send_text(frame), self.send_timeout)
+                WS_FRAMES_SENT.labels().inc()
+        except asyncio.TimeoutError:
+            WS_SLOW_CONSUMERS.labels().inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The client went away mid-send
+            pass
+        finally:
+            self._close()
+
+    def _close(self):
+        self.closed.set()
+        # Wake producers waiting for room so they see the connection is gone
+        self._space.set()
+        self._queue.clear()
+        self._mergeable.clear()
+
+
+# session id -> (lock, connections using it)
+_session_locks: Dict[str, List] = {}
+
+
+@asynccontextmanager
+async def session_turn(session_id: str):
+    """Hold a session's turn lock, so turns of one session run one at a time
+    even when it is open on several connections of this worker."""
+    entry = _session_locks.setdefault(session_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    try:
+        async with entry[0]:
+            yield
+    finally:
+        entry[1] -= 1
+        if not entry[1]:
+            del _session_locks[session_id]
+
+
+class TurnPipeline:
+    """Runs one connection's turns off its read loop, in arrival order.
+
+    Reading continues while a turn runs, so commands and new messages are
+    seen at once. Each turn starts after the previous one has finished or
+    been cancelled. With ``supersede`` a new message cancels the turns
+    before it, along with their upstream calls, otherwise up to
+    ``max_pending`` turns wait their turn. ``on_cancelled(turn)`` is called
+    for every turn cancelled by a newer one.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        run_turn: Callable[..., Awaitable[None]],
+        on_cancelled: Callable[[int], None],
+        supersede: Optional[bool] = None,
+        max_pending: Optional[int] = None,
+    ):
+        self.session_id = session_id
+        self.run_turn = run_turn
+        self.on_cancelled = on_cancelled
+        self.supersede = supersede if supersede is not None else os.getenv("WS_SUPERSEDE", "1") != "0"
+        self.max_pending = max_pending or int(os.getenv("WS_MAX_PENDING_TURNS", 4))
+        self.turns = 0
+        # Unfinished turns in arrival order, and those already cancelled
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cancelled: Set[int] = set()
+
+    def submit(self, *args) -> Optional[int]:
+        """Schedule ``run_turn(turn, *args)``; the turn number, or None if
+        too many turns are already waiting."""
+        self._tasks = {turn: task for turn, task in self._tasks.items() if not task.done()}
+        if self.supersede:
+            for turn, task in self._tasks.items():
+                if turn not in self._cancelled and task.cancel():
+                    self._cancelled.add(turn)
+                    WS_TURNS_CANCELLED.labels("superseded").inc()
+                    self.on_cancelled(turn)
+        elif len(self._tasks) >= self.max_pending:
+            return None
+        self.turns += 1
+        turn = self.turns
+        task = asyncio.create_task(self._run(turn, list(self._tasks.values()), args))
+        task.add_done_callback(lambda _: self._cancelled.discard(turn))
+        self._tasks[turn] = task
+        return turn
+
+    async def _run(self, turn: int, previous: List[asyncio.Task], args):
+        # Cancelled turns may still be unwinding; start after all of them
+        if previous:
+            await asyncio.wait(previous)
+        async with session_turn(self.session_id):
+            await self.run_turn(turn, *args)
+
+    def cancel_all(self):
+        """Cancel every turn, e.g. on disconnect; their upstream calls are
+        closed as they unwind."""
+        for turn, task in self._tasks.items():
+            if turn not in self._cancelled and task.cancel():
+                WS_TURNS_CANCELLED.labels("disconnect").inc()
+        self._tasks = {}
+        self._cancelled.clear()
+
+    def __len__(self) -> int:
+        return sum(not task.done() for task in self._tasks.values())
@@ -0,0 +1,114 @@
+"""Recall and latency of the IVF-PQ memory index against exact search.
+
+Usage (from backend/):
+    python benchmarks/ann_benchmark.py --vectors 200000 --queries 200
+    python benchmarks/ann_benchmark.py --nprobe 4 8 16 32 --rerank 0 100 --json
+    python benchmarks/ann_benchmark.py --sessions 20   # recall within one session
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.vector_store import LocalVectorStore
+from agents.ann_index import ANNIndex
+
+
+def clustered_vectors(count: int, dimension: int, clusters: int, rng) -> np.ndarray:
+    # Sentence embeddings are far from uniform; clustered data is a fairer test
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)]
+    vectors += 0.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--rerank", type=int, nargs="+", default=[0, 100])
+    parser.add_argument("--subquantizers", type=int, default=48)
+    parser.add_argument("--sessions", type=int, default=0,
+                        help="spread vectors over N sessions and query within one (0 = unfiltered)")
+    parser.add_argument("--json", action="store_true", help="emit one JSON object per configuration")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    store = LocalVectorStore(dimension=args.dimension, initial_capacity=args.vectors)
+    data = clustered_vectors(args.vectors, args.dimension, args.clusters, rng)
+    batch = 50000
+    for start in range(0, args.vectors, batch):
+        store.upsert([
+            (str(i), data[i], {"session_id": f"s{i % args.sessions}"} if args.sessions else {})
+            for i in range(start, min(start + batch, args.vectors))
+        ])
+    queries = clustered_vectors(args.queries, args.dimension, args.clusters, rng)
+    sessions = [f"s{i % args.sessions}" if args.sessions else None for i in range(args.queries)]
+
+    index = ANNIndex(store, m=args.subquantizers, train_threshold=0)
+    started = time.perf_counter()
+    index.rebuild()
+    build_seconds = time.perf_counter() - started
+
+    exact_ids, exact_times = [], []
+    for query, session_id in zip(queries, sessions):
+        started = time.perf_counter()
+        results = store.query(query, args.top_k, session_id=session_id)
+        exact_times.append(time.perf_counter() - started)
+        exact_ids.append({r["id"] for r in results})
+
+    rows = [{
+        "index": "exact",
+        "vectors": args.vectors,
+        "recall": 1.0,
+        "p50_ms": percentile_ms(exact_times, 50),
+        "p99_ms": percentile_ms(exact_times, 99),
+    }]
+    for rerank in args.rerank:
+        for nprobe in args.nprobe:
+            index.nprobe, index.rerank = nprobe, rerank
+            hits, times = 0, []
+            for query, session_id, expected in zip(queries, sessions, exact_ids):
+                started = time.perf_counter()
+                results = index.search(query, args.top_k, session_id)
+                times.append(time.perf_counter() - started)
+                hits += len(expected & {r["id"] for r in results})
+            rows.append({
+                "index": "ivfpq",
+                "vectors": args.vectors,
+                "nprobe": nprobe,
+                "rerank": rerank,
+                "recall": hits / (len(queries) * args.top_k),
+                "p50_ms": percentile_ms(times, 50),
+                "p99_ms": percentile_ms(times, 99),
+                "build_s": build_seconds,
+            })
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row))
+        return
+
+    scope = f", within one of {args.sessions} sessions" if args.sessions else ""
+    print(f"{args.vectors} vectors x {args.dimension} dims, recall@{args.top_k}{scope}, build {build_seconds:.1f}s")
+    print(f"{'index':<8}{'nprobe':>8}{'rerank':>8}{'recall':>9}{'p50 ms':>10}{'p99 ms':>10}")
+    for row in rows:
+        print(f"{row['index']:<8}{row.get('nprobe', '-'):>8}{row.get('rerank', '-'):>8}"
+              f"{row['recall']:>9.3f}{row['p50_ms']:>10.2f}{row['p99_ms']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
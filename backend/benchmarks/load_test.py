@@ -0,0 +1,399 @@
+"""Throughput and tail latency of the backend against mock upstreams.
+
+Starts benchmarks/mock_upstreams.py and the backend (uvicorn) with every
+agent pointed at the mock, then drives it with concurrent /ws/agents
+clients (streaming protocol) and REST clients. Reports turns/sec, time
+to first response and time to last agent (p50/p95/p99), REST latency,
+event-loop lag and backend RSS. ``--out`` saves the JSON result with the
+commit it was measured at; ``--compare`` prints the change against one.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --ws-clients 50 --turns 5 --rest-clients 10 --out before.json
+    python benchmarks/load_test.py --ws-clients 50 --turns 5 --rest-clients 10 --compare before.json
+    python benchmarks/load_test.py --latency openai=800 --error-rate 0.05 --error-status 429 --json
+    python benchmarks/load_test.py --backend-url http://127.0.0.1:8000 --no-mock   # an already running server
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+import httpx
+import websockets
+
+import mock_upstreams
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HOST = "127.0.0.1"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p95/p99 and max, in milliseconds."""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+
+    def rank(q):
+        return round(ordered[min(len(ordered) - 1, max(0, int(q / 100 * len(ordered) + 0.5) - 1))] * 1000, 1)
+
+    return {"p50": rank(50), "p95": rank(95), "p99": rank(99), "max": round(ordered[-1] * 1000, 1)}
+
+
+def rss_bytes(pid: int) -> int:
+    """Resident memory of ``pid`` and its descendants (uvicorn workers), from /proc."""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) * 1024
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return total
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=BACKEND,
+                               capture_output=True, text=True).stdout.strip()
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def mock_argv(args) -> List[str]:
+    argv = [
+        "--default-latency", args.default_latency, "--sigma", str(args.sigma),
+        "--error-rate", str(args.error_rate), "--error-status", str(args.error_status),
+        "--chunks", str(args.chunks), "--chunk-ms", str(args.chunk_ms), "--words", str(args.words),
+    ]
+    for item in args.latency or []:
+        argv += ["--latency", item]
+    return argv
+
+
+async def wait_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+            await asyncio.sleep(0.1)
+
+
+class Results:
+    def __init__(self):
+        self.turns = 0
+        self.turn_errors: Counter = Counter()
+        self.first_response: List[float] = []
+        self.last_agent: List[float] = []
+        self.agent_statuses: Counter = Counter()
+        self.rest_latency: List[float] = []
+        self.rest_statuses: Counter = Counter()
+        self.loop_lag: List[float] = []
+        self.rss: List[int] = []
+
+
+async def ws_client(url: str, index: int, args, results: Results):
+    await asyncio.sleep(args.ramp * index / max(1, args.ws_clients))
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=args.timeout) as ws:
+            json.loads(await ws.recv())  # session frame
+            for turn in range(args.turns):
+                error = await ws_turn(ws, f"client {index} turn {turn}: {args.prompt}", args, results)
+                if error is not None:
+                    results.turn_errors[error] += 1
+                    if error == "timeout":
+                        return
+                if args.think_ms:
+                    await asyncio.sleep(args.think_ms / 1000)
+    except (OSError, websockets.WebSocketException) as e:
+        results.turn_errors[f"connection: {type(e).__name__}"] += 1
+
+
+async def ws_turn(ws, prompt: str, args, results: Results) -> Optional[str]:
+    """One turn; records its timings, or returns why it failed."""
+    started = time.perf_counter()
+    await ws.send(prompt)
+    agents = None
+    done = 0
+    first = None
+    while agents is None or done < len(agents):
+        try:
+            raw = await asyncio.wait_for(ws.recv(), args.timeout)
+        except asyncio.TimeoutError:
+            return "timeout"
+        now = time.perf_counter()
+        try:
+            frame = json.loads(raw)
+        except ValueError:
+            # Plain "System: ..." text: no agents, or the turn failed
+            return "system_message"
+        if frame.get("type") == "route":
+            agents = frame["agents"]
+        elif "agent" in frame:
+            if first is None:
+                first = now - started
+            if frame.get("done"):
+                done += 1
+                results.agent_statuses[frame.get("status")] += 1
+    if not agents:
+        return "no_agents"
+    results.turns += 1
+    results.first_response.append(first)
+    results.last_agent.append(time.perf_counter() - started)
+    return None
+
+
+async def rest_client(base: str, index: int, args, results: Results):
+    await asyncio.sleep(args.ramp * index / max(1, args.rest_clients))
+    async with httpx.AsyncClient(base_url=base, timeout=args.timeout) as client:
+        for request in range(args.rest_requests):
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"/agent/{args.rest_agent}", json={"text": f"rest {index} request {request}: {args.prompt}"}
+                )
+            except httpx.HTTPError as e:
+                results.rest_statuses[type(e).__name__] += 1
+                continue
+            results.rest_latency.append(time.perf_counter() - started)
+            status = response.json().get("status") if response.status_code == 200 else str(response.status_code)
+            results.rest_statuses[status] += 1
+
+
+async def sample(base: str, pid: Optional[int], interval: float, results: Results):
+    """Event-loop lag as the backend reports it, and RSS, every ``interval``."""
+    async with httpx.AsyncClient(base_url=base, timeout=10) as client:
+        while True:
+            try:
+                status = (await client.get("/agents/status")).json()
+                results.loop_lag.append(status["event_loop_lag_ms"]["last"] / 1000)
+            except (httpx.HTTPError, ValueError, KeyError):
+                pass
+            if pid is not None:
+                results.rss.append(rss_bytes(pid))
+            await asyncio.sleep(interval)
+
+
+async def run_load(base: str, pid: Optional[int], args) -> Dict[str, Any]:
+    results = Results()
+    ws_url = base.replace("http", "ws", 1) + "/ws/agents?protocol=stream"
+    if args.agents:
+        ws_url += f"&agents={args.agents}"
+    sampler = asyncio.create_task(sample(base, pid, args.sample_interval, results))
+    rss_start = rss_bytes(pid) if pid is not None else None
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(ws_client(ws_url, i, args, results) for i in range(args.ws_clients)),
+        *(rest_client(base, i, args, results) for i in range(args.rest_clients)),
+    )
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    await asyncio.gather(sampler, return_exceptions=True)
+
+    mb = lambda value: round(value / 2 ** 20, 1) if value is not None else None
+    return {
+        "duration_s": round(elapsed, 3),
+        "turns": results.turns,
+        "turn_errors": dict(results.turn_errors),
+        "turns_per_sec": round(results.turns / elapsed, 2),
+        "time_to_first_response_ms": percentiles(results.first_response),
+        "time_to_last_agent_ms": percentiles(results.last_agent),
+        "agent_statuses": dict(results.agent_statuses),
+        "rest": {
+            "requests": len(results.rest_latency),
+            "requests_per_sec": round(len(results.rest_latency) / elapsed, 2),
+            "latency_ms": percentiles(results.rest_latency),
+            "statuses": dict(results.rest_statuses),
+        },
+        "event_loop_lag_ms": percentiles(results.loop_lag),
+        "rss_mb": {
+            "start": mb(rss_start),
+            "peak": mb(max(results.rss)) if results.rss else None,
+            "end": mb(results.rss[-1]) if results.rss else None,
+        },
+    }
+
+
+def backend_env(args, mock_port: Optional[int]) -> Dict[str, str]:
+    # Defaults measure the request path only; the caller's environment
+    # (e.g. OPENAI_RPM, SESSION_STORE) overrides them
+    env = {
+        "MEMORY_ENABLED": "0",
+        "RESPONSE_CACHE_ENABLED": "0",
+        "AGENT_STARTUP": "eager",
+        **os.environ,
+    }
+    if mock_port is not None:
+        env.update(mock_upstreams.base_urls(HOST, mock_port))
+        # Never send real keys to the mock
+        for name in ("OPENAI_API_KEY", "GEMINI_API_KEY", "HUGGINGFACE_API_KEY", "STABILITY_API_KEY"):
+            env[name] = "mock"
+    return env
+
+
+async def benchmark(args) -> Dict[str, Any]:
+    processes = []
+    mock_port = None
+    try:
+        if not args.no_mock:
+            mock_port = free_port()
+            processes.append(subprocess.Popen(
+                [sys.executable, os.path.join(BACKEND, "benchmarks", "mock_upstreams.py"),
+                 "--host", HOST, "--port", str(mock_port), *mock_argv(args)],
+                cwd=BACKEND,
+            ))
+            await wait_ready(f"http://{HOST}:{mock_port}/mock/stats")
+
+        pid = None
+        base = args.backend_url
+        if base is None:
+            port = free_port()
+            backend = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", HOST, "--port", str(port),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=BACKEND, env=backend_env(args, mock_port),
+            )
+            processes.append(backend)
+            pid = backend.pid
+            base = f"http://{HOST}:{port}"
+        base = base.rstrip("/")
+        await wait_ready(base + "/")
+
+        result = await run_load(base, pid, args)
+        if mock_port is not None:
+            async with httpx.AsyncClient() as client:
+                result["upstream_requests"] = (await client.get(f"http://{HOST}:{mock_port}/mock/stats")).json()
+        return result
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+# Metrics shown by --compare, and whether lower is better
+COMPARED = [
+    ("turns_per_sec", False),
+    ("time_to_first_response_ms.p50", True),
+    ("time_to_first_response_ms.p95", True),
+    ("time_to_first_response_ms.p99", True),
+    ("time_to_last_agent_ms.p50", True),
+    ("time_to_last_agent_ms.p95", True),
+    ("time_to_last_agent_ms.p99", True),
+    ("rest.requests_per_sec", False),
+    ("rest.latency_ms.p99", True),
+    ("event_loop_lag_ms.p99", True),
+    ("event_loop_lag_ms.max", True),
+    ("rss_mb.peak", True),
+]
+
+
+def lookup(result: Dict[str, Any], path: str):
+    for key in path.split("."):
+        result = result.get(key) if isinstance(result, dict) else None
+    return result
+
+
+def compare(baseline: Dict[str, Any], result: Dict[str, Any]):
+    print(f"{'metric':34} {baseline.get('commit') or 'baseline':>14} {result.get('commit') or 'current':>14}   change")
+    for path, lower_is_better in COMPARED:
+        before, after = lookup(baseline, path), lookup(result, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before * 100 if before else 0.0
+        better = (change < 0) == lower_is_better if change else None
+        mark = "" if better is None or abs(change) < 5 else ("  better" if better else "  worse")
+        print(f"{path:34} {before:14} {after:14}   {change:+6.1f}%{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ws-clients", type=int, default=20, help="concurrent /ws/agents connections")
+    parser.add_argument("--turns", type=int, default=5, help="turns per WebSocket client")
+    parser.add_argument("--agents", help="limit WebSocket turns to these agents, e.g. openai,ollama")
+    parser.add_argument("--rest-clients", type=int, default=0, help="concurrent REST clients")
+    parser.add_argument("--rest-requests", type=int, default=10, help="requests per REST client")
+    parser.add_argument("--rest-agent", default="ollama", help="agent called by REST clients")
+    parser.add_argument("--prompt", default="Explain how a hash map handles collisions.")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between a client's turns")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which clients connect")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for a frame or response")
+    parser.add_argument("--sample-interval", type=float, default=0.25, help="seconds between lag/RSS samples")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the backend")
+    parser.add_argument("--backend-url", help="load an already running backend instead of starting one")
+    parser.add_argument("--no-mock", action="store_true", help="do not start the mock upstreams")
+    parser.add_argument("--label", help="free-form name stored with the result")
+    parser.add_argument("--out", help="write the JSON result to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="print changes against a saved result")
+    parser.add_argument("--json", action="store_true", help="emit a single JSON object")
+    mock_upstreams.add_arguments(parser)
+    args = parser.parse_args()
+
+    result = {
+        "commit": git_commit(),
+        "label": args.label,
+        "config": {
+            "ws_clients": args.ws_clients, "turns": args.turns, "agents": args.agents,
+            "rest_clients": args.rest_clients, "rest_requests": args.rest_requests, "rest_agent": args.rest_agent,
+            "workers": args.workers, "mock": None if args.no_mock else mock_argv(args),
+        },
+        **asyncio.run(benchmark(args)),
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        first, last = result["time_to_first_response_ms"], result["time_to_last_agent_ms"]
+        print(f"turns               {result['turns']} in {result['duration_s']}s = {result['turns_per_sec']}/s"
+              f"   errors {result['turn_errors'] or 0}")
+        print(f"first response      p50 {first['p50']} ms   p95 {first['p95']} ms   p99 {first['p99']} ms")
+        print(f"last agent          p50 {last['p50']} ms   p95 {last['p95']} ms   p99 {last['p99']} ms")
+        if result["rest"]["requests"]:
+            rest = result["rest"]
+            print(f"REST                {rest['requests_per_sec']}/s   p50 {rest['latency_ms']['p50']} ms"
+                  f"   p99 {rest['latency_ms']['p99']} ms   {rest['statuses']}")
+        lag = result["event_loop_lag_ms"]
+        print(f"event loop lag      p50 {lag['p50']} ms   p99 {lag['p99']} ms   max {lag['max']} ms")
+        print(f"backend RSS         start {result['rss_mb']['start']} MB   peak {result['rss_mb']['peak']} MB")
+        print(f"agent statuses      {result['agent_statuses']}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+
+if __name__ == "__main__":
+    main()
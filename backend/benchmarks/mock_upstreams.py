@@ -0,0 +1,263 @@
+"""Local stand-ins for the upstream model APIs, for load tests.
+
+One server answers for every provider, at the paths the agents call:
+
+    OpenAI        POST /v1/chat/completions                    (JSON or SSE)
+    Gemini        POST /v1beta/models/{model}:generateContent  (JSON)
+                  POST /v1beta/models/{model}:streamGenerateContent?alt=sse
+    HuggingFace   POST /models/{model}                         (JSON)
+    Ollama        POST /api/generate                           (JSON or NDJSON)
+    Stability     POST /v1/generation/{model}/text-to-image    (PNG or JSON)
+
+Point the backend at it with the base URLs printed by ``base_urls``.
+Replies take a lognormal time to the first token around the provider's
+median latency, then stream ``--chunks`` chunks ``--chunk-ms`` apart; a
+non-streaming reply arrives once all chunks would have been generated.
+A fraction ``--error-rate`` of requests fails with ``--error-status``
+(429s carry ``Retry-After``). GET /mock/stats counts requests and errors.
+
+Usage (from backend/):
+    python benchmarks/mock_upstreams.py --port 9100 --latency openai=400 --latency ollama=150:0.2
+"""
+import sys
+import json
+import math
+import time
+import zlib
+import base64
+import random
+import struct
+import asyncio
+import argparse
+from typing import Dict, Any, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+PROVIDERS = ("openai", "gemini", "huggingface", "ollama", "stability")
+
+
+def _png(width: int = 8, height: int = 8) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + b"\x80\x40\xc0" * width for _ in range(height))
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+PNG = _png()
+
+
+class Latency:
+    """Lognormal time to first token: ``median`` seconds, spread ``sigma``."""
+
+    def __init__(self, median: float, sigma: float):
+        self.median = median
+        self.sigma = sigma
+
+    @classmethod
+    def parse(cls, spec: str, sigma: float) -> "Latency":
+        """``median_ms`` or ``median_ms:sigma``."""
+        median, _, spread = spec.partition(":")
+        return cls(float(median) / 1000, float(spread) if spread else sigma)
+
+    def sample(self) -> float:
+        if self.sigma <= 0:
+            return self.median
+        return self.median * math.exp(random.gauss(0, self.sigma))
+
+
+class MockConfig:
+    def __init__(self, args: argparse.Namespace):
+        default = Latency.parse(args.default_latency, args.sigma)
+        self.latency: Dict[str, Latency] = {provider: default for provider in PROVIDERS}
+        for item in args.latency or []:
+            provider, _, spec = item.partition("=")
+            if provider not in PROVIDERS:
+                raise ValueError(f"Unknown provider in --latency: {provider}")
+            self.latency[provider] = Latency.parse(spec, args.sigma)
+        self.error_rate = args.error_rate
+        self.error_status = args.error_status
+        self.chunks = max(1, args.chunks)
+        self.chunk_delay = args.chunk_ms / 1000
+        self.words = args.words
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    group = parser.add_argument_group("mock upstreams")
+    group.add_argument("--default-latency", default="300", metavar="MS[:SIGMA]",
+                       help="median time to first token for every provider (default 300)")
+    group.add_argument("--latency", action="append", metavar="PROVIDER=MS[:SIGMA]",
+                       help="per-provider median time to first token, repeatable")
+    group.add_argument("--sigma", type=float, default=0.4, help="lognormal spread of latencies (0 = fixed)")
+    group.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    group.add_argument("--error-status", type=int, default=500, help="status of failed requests, e.g. 429 or 503")
+    group.add_argument("--chunks", type=int, default=20, help="chunks per streamed reply")
+    group.add_argument("--chunk-ms", type=float, default=15.0, help="delay between streamed chunks")
+    group.add_argument("--words", type=int, default=60, help="words per reply")
+
+
+def base_urls(host: str, port: int) -> Dict[str, str]:
+    """Backend environment pointing every agent at the mock server."""
+    root = f"http://{host}:{port}"
+    return {
+        "OPENAI_BASE_URL": f"{root}/v1",
+        "GEMINI_BASE_URL": f"{root}/v1beta",
+        "HUGGINGFACE_BASE_URL": f"{root}/models",
+        "OLLAMA_BASE_URL": root,
+        "STABILITY_BASE_URL": f"{root}/v1",
+    }
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI()
+    stats = {provider: {"requests": 0, "streams": 0, "errors": 0} for provider in PROVIDERS}
+
+    def reply_chunks(prompt: str):
+        words = [f"w{i}" for i in range(config.words)]
+        words[0] = f"[{len(prompt)}]"
+        size = math.ceil(len(words) / config.chunks)
+        return [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+
+    async def admit(provider: str, stream: bool) -> Optional[Response]:
+        """Wait out the time to first token; an error response if this request fails."""
+        stats[provider]["requests"] += 1
+        stats[provider]["streams"] += stream
+        await asyncio.sleep(config.latency[provider].sample())
+        if random.random() < config.error_rate:
+            stats[provider]["errors"] += 1
+            headers = {"Retry-After": "1"} if config.error_status == 429 else None
+            return JSONResponse({"error": {"message": "mock failure"}}, status_code=config.error_status, headers=headers)
+        return None
+
+    async def generated(chunks):
+        """Chunks one ``chunk_delay`` apart, the first immediately."""
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(config.chunk_delay)
+            yield chunk
+
+    async def whole(chunks) -> str:
+        await asyncio.sleep(config.chunk_delay * (len(chunks) - 1))
+        return "".join(chunks)
+
+    @app.post("/v1/chat/completions")
+    async def openai(request: Request):
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        failed = await admit("openai", stream)
+        if failed is not None:
+            return failed
+        chunks = reply_chunks(body["messages"][-1]["content"])
+        created = int(time.time())
+
+        def completion(**fields):
+            return {"id": "chatcmpl-mock", "created": created, "model": body.get("model", "mock"), **fields}
+
+        if not stream:
+            message = {"role": "assistant", "content": await whole(chunks)}
+            return completion(
+                object="chat.completion",
+                choices=[{"index": 0, "message": message, "finish_reason": "stop"}],
+                usage={"prompt_tokens": 1, "completion_tokens": len(chunks), "total_tokens": len(chunks) + 1},
+            )
+
+        async def events():
+            async for chunk in generated(chunks):
+                delta = {"index": 0, "delta": {"content": chunk}, "finish_reason": None}
+                yield f"data: {json.dumps(completion(object='chat.completion.chunk', choices=[delta]))}\n\n"
+            done = {"index": 0, "delta": {}, "finish_reason": "stop"}
+            yield f"data: {json.dumps(completion(object='chat.completion.chunk', choices=[done]))}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1beta/models/{model_method}")
+    async def gemini(model_method: str, request: Request):
+        body = await request.json()
+        stream = model_method.endswith(":streamGenerateContent")
+        failed = await admit("gemini", stream)
+        if failed is not None:
+            return failed
+        chunks = reply_chunks(body["contents"][0]["parts"][0]["text"])
+
+        def candidate(text: str) -> Dict[str, Any]:
+            return {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]}
+
+        if not stream:
+            return candidate(await whole(chunks))
+
+        async def events():
+            async for chunk in generated(chunks):
+                yield f"data: {json.dumps(candidate(chunk))}\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/models/{model:path}")
+    async def huggingface(model: str, request: Request):
+        body = await request.json()
+        failed = await admit("huggingface", False)
+        if failed is not None:
+            return failed
+        return [{"generated_text": await whole(reply_chunks(body.get("inputs", "")))}]
+
+    @app.post("/api/generate")
+    async def ollama(request: Request):
+        body = await request.json()
+        stream = bool(body.get("stream", True))
+        failed = await admit("ollama", stream)
+        if failed is not None:
+            return failed
+        chunks = reply_chunks(body.get("prompt", ""))
+        if not stream:
+            return {"model": body.get("model"), "response": await whole(chunks), "done": True}
+
+        async def lines():
+            async for chunk in generated(chunks):
+                yield json.dumps({"model": body.get("model"), "response": chunk, "done": False}) + "\n"
+            yield json.dumps({"model": body.get("model"), "response": "", "done": True}) + "\n"
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.post("/v1/generation/{model}/text-to-image")
+    async def stability(model: str, request: Request):
+        body = await request.json()
+        failed = await admit("stability", False)
+        if failed is not None:
+            return failed
+        # Image generation takes as long as a whole text reply
+        await asyncio.sleep(config.chunk_delay * (config.chunks - 1))
+        if request.headers.get("accept") == "image/png":
+            return Response(PNG, media_type="image/png", headers={"seed": "1"})
+        encoded = base64.b64encode(PNG).decode()
+        artifacts = [{"base64": encoded, "seed": i, "finishReason": "SUCCESS"} for i in range(body.get("samples", 1))]
+        return {"artifacts": artifacts}
+
+    @app.get("/mock/stats")
+    async def mock_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    for name, url in base_urls(args.host, args.port).items():
+        print(f"{name}={url}", file=sys.stderr)
+    uvicorn.run(create_app(MockConfig(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
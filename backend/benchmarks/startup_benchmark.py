@@ -0,0 +1,105 @@
+"""Import time and cold start of the backend, with regression guards.
+
+Each run starts a fresh interpreter that imports ``main`` and serves a first
+request through the app's lifespan. The run fails (exit status 1) if the
+median import exceeds --max-import-ms, or if importing ``main`` pulled in
+any of the heavy modules that must only load on demand.
+
+Usage (from backend/):
+    python benchmarks/startup_benchmark.py
+    python benchmarks/startup_benchmark.py --runs 10 --max-import-ms 800 --json
+    python benchmarks/startup_benchmark.py --importtime 15
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Must not be imported by ``import main``; they load with the agent or
+# backend that needs them
+HEAVY_MODULES = ("openai", "pandas", "numpy", "torch", "transformers", "sentence_transformers", "pinecone")
+
+PROBE = """
+import sys, time, json
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+heavy = [name for name in %r if name in sys.modules]
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    client.get("/")
+    served = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "first_request_ms": (served - started) * 1000, "heavy": heavy}))
+""" % (HEAVY_MODULES,)
+
+
+def probe(env) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env, count: int):
+    """Top ``count`` modules by cumulative import time, from ``-X importtime``."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=BACKEND, env=env, capture_output=True, text=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=1000.0)
+    parser.add_argument("--startup", default="background", choices=["background", "lazy", "eager"],
+                        help="AGENT_STARTUP mode for the cold-start measurement")
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="also list the N slowest imports")
+    parser.add_argument("--json", action="store_true", help="emit a single JSON object")
+    args = parser.parse_args()
+
+    # No keys and no shared state: measure the app, not the network
+    env = dict(os.environ, AGENT_STARTUP=args.startup, MEMORY_ENABLED="0", SESSION_STORE="memory")
+    runs = [probe(env) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "startup": args.startup,
+        "import_ms_p50": round(statistics.median(r["import_ms"] for r in runs), 1),
+        "import_ms_max": round(max(r["import_ms"] for r in runs), 1),
+        "first_request_ms_p50": round(statistics.median(r["first_request_ms"] for r in runs), 1),
+        "heavy_modules": sorted({name for r in runs for name in r["heavy"]}),
+    }
+    if args.importtime:
+        result["slowest_imports"] = [
+            {"module": name, "ms": round(us / 1000, 1)} for us, name in slowest_imports(env, args.importtime)
+        ]
+    failures = []
+    if result["import_ms_p50"] > args.max_import_ms:
+        failures.append(f"median import {result['import_ms_p50']}ms exceeds {args.max_import_ms}ms")
+    if result["heavy_modules"]:
+        failures.append(f"import main loaded {', '.join(result['heavy_modules'])}")
+    result["ok"] = not failures
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"import main         p50 {result['import_ms_p50']:8.1f} ms   max {result['import_ms_max']:8.1f} ms")
+        print(f"first request       p50 {result['first_request_ms_p50']:8.1f} ms   (AGENT_STARTUP={args.startup})")
+        for row in result.get("slowest_imports", []):
+            print(f"  {row['ms']:8.1f} ms  {row['module']}")
+        for failure in failures:
+            print(f"FAIL: {failure}")
+    sys.exit(0 if result["ok"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,57 @@
 import os
 import asyncio
+import functools
 import json
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from contextlib import asynccontextmanager, aclosing
+from typing import Callable
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, FileResponse, JSONResponse
 from dotenv import load_dotenv
 
-from agents.openai_client import OpenAIAgent
-from agents.huggingface_client import HuggingFaceAgent
-from agents.gemini_client import GeminiAgent
-from agents.ollama_client import OllamaAgent
-from agents.stability_client import StabilityAgent
+# Load .env before the agent modules read their settings
+load_dotenv()
+
+from agents.registry import agent_registry
+from agents.router import turn_router
 from agents.memory_manager import MemoryManager
+from agents.conversation_manager import ConversationManager
+from agents.http_pool import http_pool
+from agents.response_cache import response_cache
+from agents.embeddings import embedding_pipeline
+from agents.resilience import provider_health, deadline
+from agents.metrics import registry, loop_monitor, agent_summary
+from agents.blob_store import image_store, parse_range
+from agents.image_jobs import ImageJobQueue, JobQueueFull, expand_variants
+from agents.single_flight import single_flight
+from agents.rate_limit import rate_limiter
+from agents.session_store import SharedSessions
+from agents.ws_connection import Outbox, OutboxClosed, TurnPipeline
+from agents.batch import BatchRun, RequestBody, ndjson_lines, split_header
 
-load_dotenv()
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop_monitor.start()
+    image_jobs.start()
+    await sessions.start()
+    if AGENT_STARTUP == "eager":
+        await agent_registry.warm()
+    elif AGENT_STARTUP == "background":
+        # Serve immediately; agents not yet warm load on first use instead
+        spawn(agent_registry.warm())
+    yield
+    loop_monitor.stop()
+    await image_jobs.stop()
+    await sessions.stop()
+    # Close pooled upstream connections on shutdown
+    await http_pool.aclose()
+    response_cache.close()
+    embedding_pipeline.close()
+    memory_manager.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,167 +61,644 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outbound queues of open /ws/agents connections, sampled for /metrics
+outboxes = set()
+
+def _deadline_setting(name: str, default: float):
+    seconds = float(os.getenv(name, default))
+    return seconds if seconds > 0 else None
+
+# Whole-turn budgets shared by every upstream call made for it (0 disables)
+TURN_DEADLINE = _deadline_setting("TURN_DEADLINE", 30)
+REQUEST_DEADLINE = _deadline_setting("REQUEST_DEADLINE", 120)
+
+@app.middleware("http")
+async def request_deadline(request: Request, call_next):
+    with deadline(REQUEST_DEADLINE):
+        return await call_next(request)
+
 @app.get("/")
 def read_root():
     return {"message": "AI Multi-Agent Collaboration Lab backend is running."}
 
-# Initialize agents
-openai_agent = OpenAIAgent()
-huggingface_agent = HuggingFaceAgent()
-gemini_agent = GeminiAgent()
-ollama_agent = OllamaAgent()
-stability_agent = StabilityAgent()
+# Agents come from agent_registry (see AGENTS); AGENT_STARTUP decides when
+# they are loaded: "background" warms them after startup, "lazy" on first
+# use, "eager" before the first request is served
+AGENT_STARTUP = os.getenv("AGENT_STARTUP", "background")
 memory_manager = MemoryManager()
 
-# Store active connections
-active_connections = []
+# Background image generation (see /image-jobs and the image_job WebSocket command)
+image_jobs = ImageJobQueue(lambda: agent_registry.get("stability"))
 
-class ConversationManager:
-    def __init__(self):
-        self.conversations = {}
-    
-    def add_message(self, session_id: str, message: dict):
-        if session_id not in self.conversations:
-            self.conversations[session_id] = []
-        self.conversations[session_id].append(message)
-    
-    def get_context(self, session_id: str, max_messages: int = 10) -> str:
-        if session_id not in self.conversations:
-            return ""
-        recent_messages = self.conversations[session_id][-max_messages:]
-        return "\n".join([f"{msg['sender']}: {msg['text']}" for msg in recent_messages])
+# Connections open on this worker (see sessions for all workers)
+active_connections = []
 
+# Bounded per-session history (see CONVERSATION_* settings)
 conversation_manager = ConversationManager()
 
-# WebSocket endpoint for multi-agent collaboration
+# Session ids and history shared between workers (see SESSION_STORE)
+sessions = SharedSessions(conversation_manager)
+
+# Long-term memory: every turn is embedded and stored, and related earlier
+# turns are pinned as the session summary for when they fall out of context
+MEMORY_ENABLED = os.getenv("MEMORY_ENABLED", "1") != "0"
+MEMORY_RECALL_TOP_K = 3
+MEMORY_RECALL_MIN_SCORE = 0.3
+background_tasks = set()
+
+def spawn(coro):
+    """Run a coroutine in the background, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+async def remember_turn(session_id: str, prompt: str, turn: int, replies: int):
+    try:
+        embedding = await embedding_pipeline.embed(prompt)
+        memories = await memory_manager.retrieve_similar_conversations(
+            embedding, top_k=MEMORY_RECALL_TOP_K, session_id=session_id
+        )
+        messages = conversation_manager.get_messages(session_id, replies + 1)
+        await memory_manager.store_conversation(session_id, messages, embedding, turn=turn)
+
+        related = [m["text"] for m in memories if m.get("score", 1.0) >= MEMORY_RECALL_MIN_SCORE and m.get("text")]
+        if related:
+            sessions.pin_summary(session_id, "Related earlier discussion:\n" + "\n---\n".join(related))
+    except Exception as e:
+        print(f"Failed to update conversation memory: {e}")
+
+PERSONALITY_EMOJI = {
+    "logical_analytical": "🧠",
+    "creative_innovative": "🎨",
+    "versatile_balanced": "⚖️",
+    "privacy_focused": "🔒",
+    "visual_artist": "🖼️"
+}
+
+def agent_contexts(session_id: str, calls: list) -> dict:
+    """History context for each agent, packed to that agent's token budget."""
+    return {
+        agent.name: conversation_manager.get_context(session_id, max_tokens=agent.context_tokens)
+        for agent, _ in calls
+    }
+
+def agent_call(agent, kind: str, prompt: str, context: str):
+    if kind == "image":
+        return agent.generate_image(prompt, context)
+    return agent.generate_response(prompt, context)
+
+def agent_stream(agent, kind: str, prompt: str, context: str):
+    if kind == "image":
+        return agent.stream_image(prompt, context)
+    return agent.stream_response(prompt, context)
+
+async def send_agent_responses(outbox: Outbox, turn: int, session_id: str, prompt: str, calls: list, contexts: dict):
+    """Compatibility protocol: one plain-text message per agent, in agent order."""
+    tasks = [agent_call(agent, kind, prompt, contexts[agent.name]) for agent, kind in calls]
+    responses = await asyncio.gather(*tasks, return_exceptions=True)
+
+    for index, response in enumerate(responses):
+        if index:
+            # Small delay between agent responses for better UX
+            await asyncio.sleep(0.5)
+        if isinstance(response, Exception):
+            await outbox.push(f"System: Agent error: {str(response)}", turn=turn)
+            continue
+
+        # Add agent response to conversation
+        sessions.add_message(session_id, {
+            "sender": response["agent"], 
+            "text": response["response"]
+        })
+
+        # Format response with personality indicator
+        emoji = PERSONALITY_EMOJI.get(response.get("personality", ""), "🤖")
+        formatted_response = f"{response['agent']} {emoji}: {response['response']}"
+        if response.get("image_url"):
+            formatted_response += f" {response['image_url']}"
+
+        await outbox.push(formatted_response, turn=turn)
+
+async def stream_agent_responses(outbox: Outbox, turn: int, session_id: str, prompt: str, calls: list, contexts: dict):
+    """Streaming protocol: interleave JSON chunk frames from all agents as they arrive.
+
+    Every frame is ``{"agent", "turn", "seq", "delta", "done"}``; the final
+    frame of an agent also carries ``status`` and ``personality``. Partial
+    frames an agent produces faster than the client reads are merged.
+    """
+
+    async def pump(agent, kind):
+        key = (turn, agent.name)
+        final = None
+        try:
+            async for frame in agent_stream(agent, kind, prompt, contexts[agent.name]):
+                if frame.get("done"):
+                    final = frame
+                    break
+                partial = {"agent": agent.name, "turn": turn, "seq": None, "delta": frame.get("delta", ""), "done": False}
+                await outbox.push(partial, key, "append", turn)
+        except OutboxClosed:
+            raise
+        except Exception as e:
+            final = agent._result(f"Agent error: {str(e)}", "error", done=True)
+        frame = final or agent._result("Agent error: the reply ended early", "error", done=True)
+
+        message = {
+            "agent": agent.name,
+            "turn": turn,
+            "seq": None,
+            "delta": frame.get("delta", ""),
+            "done": True,
+            "status": frame.get("status"),
+            "personality": frame.get("personality"),
+        }
+        for field in ("type", "image_url", "images"):
+            if field in frame:
+                message[field] = frame[field]
+        # Commit the full text once the agent's stream completes
+        sessions.add_message(session_id, {
+            "sender": agent.name,
+            "text": frame.get("response", "")
+        })
+        await outbox.push(message, key, turn=turn)
+
+    tasks = [asyncio.create_task(pump(agent, kind)) for agent, kind in calls]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # A superseded turn or a closed connection stops the upstream calls
+        for task in tasks:
+            task.cancel()
+
+# JSON commands accepted on /ws/agents alongside plain-text prompts; a
+# "prompt" command is a prompt with options, e.g. {"type": "prompt",
+# "text": "...", "agents": ["openai", "gemini"]}
+WS_COMMANDS = {"prompt", "image_job", "image_job_subscribe", "image_job_cancel"}
+
+def parse_command(data: str):
+    if not data.lstrip().startswith("{"):
+        return None
+    try:
+        command = json.loads(data)
+    except ValueError:
+        return None
+    if isinstance(command, dict) and command.get("type") in WS_COMMANDS:
+        return command
+    return None
+
+def job_event_sender(outbox: Outbox):
+    """Image job updates for one connection. An update still waiting to be
+    sent is replaced by a newer one for the same job; once the connection
+    is gone sending raises, which unsubscribes it."""
+    def send(event: dict):
+        job_id = event.get("job_id")
+        if job_id is None:
+            outbox.offer(event)
+        else:
+            outbox.offer(event, ("job", job_id), "replace")
+    return send
+
+async def handle_command(command: dict, session_id: str, job_events: Callable[[dict], None]):
+    """Run an image job command; a malformed one is answered with an error
+    event rather than ending the connection."""
+    try:
+        await run_command(command, session_id, job_events)
+    except (ValueError, TypeError) as e:
+        job_events({"type": "image_job", "error": str(e)})
+
+async def run_command(command: dict, session_id: str, job_events: Callable[[dict], None]):
+    kind = command["type"]
+    if kind == "image_job":
+        stability_agent = agent_registry.get("stability")
+        if stability_agent is None:
+            job_events({"type": "image_job", "error": "Image generation is disabled."})
+            return
+        context = command.get("context")
+        if context is None:
+            context = conversation_manager.get_context(session_id, max_tokens=stability_agent.context_tokens)
+        try:
+            job, _ = image_jobs.submit(
+                command.get("prompt", ""), context,
+                command.get("params"), command.get("sweep"), command.get("priority", 0)
+            )
+        except JobQueueFull:
+            job_events({"type": "image_job", "error": "Image queue is full."})
+            return
+        image_jobs.subscribe(job, job_events)
+        return
+
+    job = image_jobs.get(command.get("job_id", ""))
+    if job is None:
+        job_events({"type": "image_job", "job_id": command.get("job_id"), "error": "Unknown job."})
+    elif kind == "image_job_subscribe":
+        image_jobs.subscribe(job, job_events)
+    else:
+        subscribed = job_events in job.subscribers
+        image_jobs.cancel(job.id)
+        if not subscribed:
+            job_events(job.snapshot())
+
+def unknown_agents(names: list) -> list:
+    """Names in a client's agent subset that match no enabled agent."""
+    return [name for name in names if turn_router.resolve(name) is None]
+
+async def run_turn(outbox: Outbox, session_id: str, streaming: bool, turn: int, data: str, requested: list):
+    """Answer one user message on a connection; runs in the connection's TurnPipeline."""
+    try:
+        # Add user message to conversation
+        sessions.add_message(session_id, {"sender": "User", "text": data})
+        try:
+            plan = turn_router.plan(data, requested)
+            contexts = agent_contexts(session_id, plan.calls)
+            if streaming:
+                await outbox.push(dict(plan.describe(), turn=turn), turn=turn)
+            if not plan.calls:
+                await outbox.push("System: No agents are available for this message right now.", turn=turn)
+                return
+
+            with deadline(TURN_DEADLINE):
+                if streaming:
+                    await stream_agent_responses(outbox, turn, session_id, plan.prompt, plan.calls, contexts)
+                else:
+                    await send_agent_responses(outbox, turn, session_id, plan.prompt, plan.calls, contexts)
+
+            if MEMORY_ENABLED:
+                spawn(remember_turn(session_id, data, conversation_manager.message_count(session_id), len(plan.calls)))
+
+        except OutboxClosed:
+            raise
+        except Exception as e:
+            await outbox.push(f"System: Error processing agents: {str(e)}", turn=turn)
+    except OutboxClosed:
+        pass
+
+# WebSocket endpoint for multi-agent collaboration.
+# Connect with ?protocol=stream for interleaved JSON chunk frames; the default
+# is the plain-text one-message-per-agent protocol. Pass ?session=<uuid> to
+# resume a session's history on whichever worker accepts the connection, and
+# ?agents=openai,gemini to limit every turn to those agents.
+#
+# Frames go out through a bounded Outbox drained by its own writer task, and
+# turns run in a TurnPipeline, so reading never waits for a turn: a new
+# message cancels the turn still being answered (see WS_SUPERSEDE).
 @app.websocket("/ws/agents")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     active_connections.append(websocket)
-    session_id = f"session_{len(active_connections)}"
-    
-    try:
+    streaming = websocket.query_params.get("protocol") == "stream"
+    connection_agents = [name for name in websocket.query_params.get("agents", "").split(",") if name]
+    outbox = Outbox(websocket).start()
+    outboxes.add(outbox)
+    job_events = job_event_sender(outbox)
+    pipeline = None
+    opened = False
+
+    def cancelled(turn: int):
+        outbox.discard_turn(turn)
+        if streaming:
+            outbox.offer({"type": "turn_cancelled", "turn": turn})
+        else:
+            outbox.offer("System: Stopped answering the previous message.")
+
+    async def read():
         while True:
             data = await websocket.receive_text()
             if not data or not isinstance(data, str):
-                await websocket.send_text("System: Invalid input.")
+                await outbox.push("System: Invalid input.")
                 continue
-            
-            # Add user message to conversation
-            conversation_manager.add_message(session_id, {"sender": "User", "text": data})
-            context = conversation_manager.get_context(session_id)
-            
-            # Get responses from all agents
-            tasks = [
-                openai_agent.generate_response(data, context),
-                huggingface_agent.generate_response(data, context),
-                gemini_agent.generate_response(data, context),
-                ollama_agent.generate_response(data, context),
-                stability_agent.generate_response(data, context)
-            ]
-            
-            try:
-                responses = await asyncio.gather(*tasks, return_exceptions=True)
-                
-                for response in responses:
-                    if isinstance(response, Exception):
-                        await websocket.send_text(f"System: Agent error: {str(response)}")
-                        continue
-                    
-                    # Add agent response to conversation
-                    conversation_manager.add_message(session_id, {
-                        "sender": response["agent"], 
-                        "text": response["response"]
-                    })
-                    
-                    # Format response with personality indicator
-                    personality_emoji = {
-                        "logical_analytical": "🧠",
-                        "creative_innovative": "🎨",
-                        "versatile_balanced": "⚖️",
-                        "privacy_focused": "🔒",
-                        "visual_artist": "🖼️"
-                    }
-                    
-                    emoji = personality_emoji.get(response.get("personality", ""), "🤖")
-                    formatted_response = f"{response['agent']} {emoji}: {response['response']}"
-                    
-                    await websocket.send_text(formatted_response)
-                    
-                    # Small delay between agent responses for better UX
-                    await asyncio.sleep(0.5)
-                    
-            except Exception as e:
-                await websocket.send_text(f"System: Error processing agents: {str(e)}")
+
+            requested = connection_agents
+            command = parse_command(data)
+            if command is not None and command["type"] == "prompt":
+                data = command.get("text")
+                if not data or not isinstance(data, str):
+                    await outbox.push("System: Invalid input.")
+                    continue
+                requested = command.get("agents")
+                if requested is not None and (
+                    not isinstance(requested, list) or not all(isinstance(name, str) for name in requested)
+                ):
+                    await outbox.push("System: agents must be a list of agent names.")
+                    continue
+                unknown = unknown_agents(requested or [])
+                if unknown:
+                    await outbox.push(f"System: Unknown or disabled agents: {', '.join(unknown)}.")
+                    continue
+                requested = requested or connection_agents
+            elif command is not None:
+                await handle_command(command, session_id, job_events)
                 continue
-                
-    except WebSocketDisconnect:
-        if websocket in active_connections:
-            active_connections.remove(websocket)
+
+            if pipeline.submit(data, requested) is None:
+                await outbox.push("System: Too many messages in flight; wait for the answers before sending more.")
+
+    try:
+        unknown = unknown_agents(connection_agents)
+        if unknown:
+            await outbox.push(f"System: Unknown or disabled agents: {', '.join(unknown)}.")
+        session_id, resumed = await sessions.open(websocket.query_params.get("session"))
+        opened = True
+        pipeline = TurnPipeline(session_id, functools.partial(run_turn, outbox, session_id, streaming), cancelled)
+        if streaming:
+            await outbox.push({"type": "session", "session_id": session_id, "resumed": resumed})
+
+        # Runs until the client disconnects or stops reading its frames
+        reader = asyncio.create_task(read())
+        closed = asyncio.create_task(outbox.closed.wait())
+        try:
+            await asyncio.wait({reader, closed}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            reader.cancel()
+        if reader.done() and not reader.cancelled():
+            # Re-raise why reading stopped
+            reader.result()
+    except (WebSocketDisconnect, OutboxClosed):
+        pass
     except Exception as e:
-        await websocket.send_text(f"System: Unexpected error: {str(e)}")
+        try:
+            await websocket.send_text(f"System: Unexpected error: {str(e)}")
+        except Exception:
+            pass
+    finally:
         if websocket in active_connections:
             active_connections.remove(websocket)
+        if pipeline is not None:
+            # Abandoned turns stop consuming provider capacity
+            pipeline.cancel_all()
+        if opened:
+            sessions.close()
+        outboxes.discard(outbox)
+        outbox.close()
 
-# REST endpoints for each agent (for testing and fallback)
-@app.post("/agent/openai")
-async def openai_endpoint(payload: dict):
-    text = payload.get("text", "")
-    context = payload.get("context", "")
-    if not text:
-        return {"error": "No text provided."}
-    return await openai_agent.generate_response(text, context)
+def agent_reply(result: dict):
+    """An agent result as the REST response; shed requests get a 429."""
+    if result.get("reason") == "rate_limited":
+        retry_after = max(1, round(result.get("retry_after", 1)))
+        return JSONResponse(result, status_code=429, headers={"Retry-After": str(retry_after)})
+    return result
 
-@app.post("/agent/huggingface")
-async def huggingface_endpoint(payload: dict):
+# REST endpoint for each enabled agent (for testing and fallback)
+@app.post("/agent/{agent_key}")
+async def agent_endpoint(agent_key: str, payload: dict):
+    agent = agent_registry.get(agent_key)
+    if agent is None:
+        return JSONResponse({"error": f"Unknown or disabled agent: {agent_key}"}, status_code=404)
     text = payload.get("text", "")
     context = payload.get("context", "")
     if not text:
         return {"error": "No text provided."}
-    return await huggingface_agent.generate_response(text, context)
+    return agent_reply(await agent.generate_response(text, context))
 
-@app.post("/agent/gemini")
-async def gemini_endpoint(payload: dict):
-    text = payload.get("text", "")
-    context = payload.get("context", "")
-    if not text:
-        return {"error": "No text provided."}
-    return await gemini_agent.generate_response(text, context)
+def batch_agents(names) -> dict:
+    """Agents a batch asked for (default: every agent that answers text),
+    by display name. Raises ValueError for names it can't use."""
+    if names is not None and not isinstance(names, list):
+        raise ValueError("agents must be a list")
+    if names is None:
+        return {agent.name: agent for agent in agent_registry.active() if "text" not in agent.local_kinds}
+    agents = {}
+    for name in names:
+        key = turn_router.resolve(str(name))
+        agent = agent_registry.get(key) if key else None
+        if agent is None:
+            raise ValueError(f"Unknown or disabled agent: {name}")
+        if "text" in agent.local_kinds:
+            raise ValueError(f"{agent.name} does not answer text prompts")
+        agents[agent.name] = agent
+    return agents
 
-@app.post("/agent/ollama")
-async def ollama_endpoint(payload: dict):
-    text = payload.get("text", "")
-    context = payload.get("context", "")
-    if not text:
-        return {"error": "No text provided."}
-    return await ollama_agent.generate_response(text, context)
+class BatchEndpoint:
+    """Answer an NDJSON stream of prompts with several agents, streaming
+    NDJSON results back as they complete. An optional first line sets
+    ``agents``, ``sampling``, ``concurrency``, ``batch_id`` and ``replay``;
+    every other line is ``{"id", "prompt", "context"}``.
 
-@app.post("/agent/stability")
-async def stability_endpoint(payload: dict):
-    text = payload.get("text", "")
-    context = payload.get("context", "")
-    if not text:
-        return {"error": "No text provided."}
-    return await stability_agent.generate_response(text, context)
+    A raw ASGI app rather than a route function: it answers while still
+    reading the prompts, so it must be the only reader of ``receive`` (see
+    RequestBody). A client disconnect cancels the batch.
+    """
+
+    async def __call__(self, scope, receive, send):
+        body = RequestBody(receive).start()
+        respond = asyncio.create_task(self.respond(scope, body, send))
+        gone = asyncio.create_task(body.disconnected.wait())
+        try:
+            await asyncio.wait({respond, gone}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            respond.cancel()
+            gone.cancel()
+            body.close()
+        if respond.done() and not respond.cancelled():
+            respond.result()
+
+    async def respond(self, scope, body: RequestBody, send):
+        header, lines = await split_header(ndjson_lines(body.chunks()))
+        try:
+            run = BatchRun(
+                batch_agents(header.get("agents")), header.get("sampling"), header.get("concurrency"),
+                header.get("batch_id"), header.get("replay", False)
+            )
+        except ValueError as e:
+            await JSONResponse({"error": str(e)}, status_code=400)(scope, body.receive, send)
+            return
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson")],
+        })
+        async with aclosing(run.run(lines)) as records:
+            async for record in records:
+                await send({"type": "http.response.body", "body": json.dumps(record).encode() + b"\n", "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+app.router.add_route("/batch", BatchEndpoint(), methods=["POST"])
 
 @app.post("/generate-image")
-async def generate_image_endpoint(payload: dict):
+async def generate_image_endpoint(payload: dict, request: Request):
+    """Generate an image; the JSON result carries a handle to fetch it from
+    /images/{id}. Send ``Accept: image/png`` to get the PNG bytes instead."""
     prompt = payload.get("prompt", "")
     context = payload.get("context", "")
     if not prompt:
         return {"error": "No prompt provided."}
-    return await stability_agent.generate_image(prompt, context)
+    if not isinstance(prompt, str) or not isinstance(context, str):
+        return {"error": "prompt and context must be strings"}
+    try:
+        params = expand_variants(payload.get("params"), None)[0]
+    except (ValueError, TypeError) as e:
+        return {"error": str(e)}
+    stability_agent = agent_registry.get("stability")
+    if stability_agent is None:
+        return JSONResponse({"error": "Image generation is disabled."}, status_code=404)
+    result = await stability_agent.generate_image(prompt, context, **params)
+    if "image/png" in request.headers.get("accept", "") and result.get("image_id"):
+        return await image_response(result["image_id"], request)
+    return agent_reply(result)
+
+@app.post("/image-jobs")
+async def submit_image_job(payload: dict):
+    """Queue a background image job: ``params`` sets generation parameters
+    (samples, steps, cfg_scale, width, height, seed, style_preset) and
+    ``sweep`` maps parameters to lists of values to try."""
+    if not agent_registry.is_enabled("stability"):
+        return JSONResponse({"error": "Image generation is disabled."}, status_code=404)
+    prompt = payload.get("prompt", "")
+    if not prompt:
+        return JSONResponse({"error": "No prompt provided."}, status_code=400)
+    try:
+        job, coalesced = image_jobs.submit(
+            prompt, payload.get("context", ""),
+            payload.get("params"), payload.get("sweep"), payload.get("priority", 0)
+        )
+    except (ValueError, TypeError) as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except JobQueueFull:
+        return JSONResponse({"error": "Image queue is full, try again later."}, status_code=429)
+    return {"job_id": job.id, "status": job.status, "total": len(job.variants), "coalesced": coalesced}
+
+@app.get("/image-jobs/{job_id}")
+async def get_image_job(job_id: str):
+    job = image_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown job."}, status_code=404)
+    return job.snapshot()
+
+@app.delete("/image-jobs/{job_id}")
+async def cancel_image_job(job_id: str):
+    return {"cancelled": image_jobs.cancel(job_id)}
+
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+async def image_response(image_id: str, request: Request):
+    blob = image_store.get(image_id)
+    if blob is None:
+        return JSONResponse({"error": "Image not found."}, status_code=404)
+    headers = {"ETag": blob.etag, "Cache-Control": IMAGE_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if blob.etag in if_none_match or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    if blob.data is None:
+        # Evicted from memory: stream from the disk tier (handles Range itself)
+        return FileResponse(blob.path, media_type=blob.content_type, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == blob.etag):
+        size = len(blob.data)
+        try:
+            span = parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if span is not None:
+            start, end = span
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            return Response(blob.data[start:end + 1], status_code=206, media_type=blob.content_type, headers=headers)
+    return Response(blob.data, media_type=blob.content_type, headers=headers)
+
+@app.get("/images/{image_id}")
+async def get_image(image_id: str, request: Request):
+    """Generated image bytes by handle, with ETag revalidation and byte ranges"""
+    return await image_response(image_id, request)
+
+# Binary image delivery: send an image id as text, receive a JSON header
+# frame ({"id", "content_type", "size"}) followed by one binary frame.
+@app.websocket("/ws/images")
+async def image_websocket(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        while True:
+            image_id = (await websocket.receive_text()).strip()
+            blob = image_store.get(image_id)
+            if blob is None:
+                await websocket.send_text(json.dumps({"id": image_id, "error": "Image not found."}))
+                continue
+            data = blob.data
+            if data is None:
+                data = await asyncio.to_thread(_read_file, blob.path)
+            await websocket.send_text(json.dumps({"id": image_id, "content_type": blob.content_type, "size": len(data)}))
+            await websocket.send_bytes(data)
+    except WebSocketDisconnect:
+        pass
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+# Gauges below are computed when /metrics is scraped
+registry.gauge("websocket_connections", "Open /ws/agents connections on this worker", collect=lambda: len(active_connections))
+registry.gauge("websocket_connections_all_workers", "Open /ws/agents connections across workers",
+               collect=sessions.connection_count)
+registry.gauge("sessions", "Session store counters", ("counter",), collect=sessions.stats)
+if sessions.log is not None:
+    registry.gauge("conversation_log", "Conversation log counters", ("counter",), collect=sessions.log.stats)
+registry.gauge("websocket_send_queue_depth", "Frames waiting to be sent, all connections",
+               collect=lambda: sum(len(outbox) for outbox in outboxes))
+registry.gauge("conversation_sessions", "Sessions held in memory", collect=lambda: len(conversation_manager.sessions))
+registry.gauge("conversation_messages", "Messages held in memory", collect=lambda: conversation_manager.total_messages)
+registry.gauge("conversation_memory_bytes", "Approximate ConversationManager footprint",
+               collect=conversation_manager.memory_footprint)
+registry.gauge("response_cache", "Response cache counters", ("counter",),
+               collect=response_cache.stats)
+registry.gauge("embedding_pipeline", "Embedding pipeline counters", ("counter",),
+               collect=embedding_pipeline.stats)
+registry.gauge("image_store", "Image blob store counters", ("counter",), collect=image_store.stats)
+registry.gauge("image_jobs", "Image job queue counters", ("counter",), collect=image_jobs.stats)
+registry.gauge("single_flight_in_flight", "Distinct upstream calls being shared", ("mode",),
+               collect=lambda: {"call": len(single_flight._calls), "stream": len(single_flight._streams)})
+registry.gauge("breaker_open", "1 while a provider's circuit breaker is open", ("provider",),
+               collect=lambda: {p: int(b.state == "open") for p, b in provider_health.breakers.items()})
+registry.gauge("rate_limiter", "Per-provider admission control state", ("provider", "counter"),
+               collect=lambda: {(p, name): value for p, limiter in rate_limiter.limiters.items()
+                                for name, value in limiter.stats().items()})
+registry.gauge("background_tasks", "Memory updates still running", collect=lambda: len(background_tasks))
+
+# Breaker state as shown on the dashboard
+BREAKER_STATUS = {"closed": "ready", "half_open": "degraded", "open": "error"}
 
 @app.get("/agents/status")
 async def agents_status():
-    """Check status of all agents"""
+    """Check status of all agents. Agents not loaded yet are listed as
+    ``not_loaded`` from the registry alone; asking never loads them."""
+    statuses = []
+    for key in agent_registry.keys:
+        agent = agent_registry.peek(key)
+        if agent is None:
+            if key not in agent_registry.errors:
+                statuses.append({"key": key, "name": key, "status": "not_loaded", "personality": ""})
+            continue
+        health = provider_health.snapshot(agent.provider)
+        health["rate_limit"] = rate_limiter.limiter(agent.provider).stats()
+        summary = agent_summary(agent.name)
+        status = BREAKER_STATUS[health["breaker"]["state"]]
+        if status == "ready" and summary["in_flight"]:
+            status = "working"
+        statuses.append({
+            "key": key,
+            "name": agent.name,
+            "status": status,
+            "personality": agent.personality_key,
+            **summary,
+            **health
+        })
     return {
-        "agents": [
-            {"name": "OpenAI", "status": "ready", "personality": "logical_analytical"},
-            {"name": "HuggingFace", "status": "ready", "personality": "creative_innovative"},
-            {"name": "Gemini", "status": "ready", "personality": "versatile_balanced"},
-            {"name": "Ollama", "status": "ready", "personality": "privacy_focused"},
-            {"name": "Stability", "status": "ready", "personality": "visual_artist"}
-        ],
-        "active_connections": len(active_connections)
+        "agents": statuses,
+        "agent_registry": dict(agent_registry.stats(), loaded=agent_registry.loaded, errors=agent_registry.errors),
+        "routing": turn_router.stats(),
+        "active_connections": sessions.connection_count(),
+        "worker_connections": len(active_connections),
+        "hedges": {"sent": provider_health.hedges, "won": provider_health.hedge_wins, "skipped": provider_health.hedges_skipped},
+        "event_loop_lag_ms": {"last": round(loop_monitor.last * 1000, 2), "max": round(loop_monitor.max * 1000, 2)},
+        "conversations": dict(conversation_manager.stats(), memory_bytes=conversation_manager.memory_footprint())
     }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text exposition of agent, event loop and memory telemetry"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Response cache hit/miss/byte counters"""
+    return response_cache.stats()
@@ -0,0 +1,115 @@
+"""IVF-PQ index behaviour against exact search on the same store."""
+import time
+
+import numpy as np
+import pytest
+
+from agents.ann_index import ANNIndex
+from agents.vector_store import LocalVectorStore
+
+DIMENSION = 32
+COUNT = 5000
+
+
+def _clustered(count: int, seed: int) -> np.ndarray:
+    # Real embeddings cluster; uniform noise would make any ANN look bad
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((50, DIMENSION))
+    return (centres[rng.integers(0, 50, count)] + 0.3 * rng.standard_normal((count, DIMENSION))).astype(np.float32)
+
+
+def _fill(store: LocalVectorStore, vectors: np.ndarray, start: int = 0, sessions: int = 4):
+    return store.upsert([
+        (f"v{start + i}", vector, {"session_id": f"s{(start + i) % sessions}"}) for i, vector in enumerate(vectors)
+    ])
+
+
+@pytest.fixture(scope="module")
+def store():
+    store = LocalVectorStore(dimension=DIMENSION, initial_capacity=COUNT)
+    _fill(store, _clustered(COUNT, 0))
+    return store
+
+
+def _ann(store, **options) -> ANNIndex:
+    ann = ANNIndex(store, m=8, train_threshold=10 ** 9, **options)
+    ann.rebuild()
+    return ann
+
+
+def _recall(ann: ANNIndex, store: LocalVectorStore, queries: np.ndarray, top_k: int = 10, session_id=None) -> float:
+    found = 0
+    for query in queries:
+        exact = {hit["id"] for hit in store.query(query, top_k, session_id=session_id)}
+        approximate = {hit["id"] for hit in ann.search(query, top_k, session_id)}
+        found += len(exact & approximate)
+    return found / (top_k * len(queries))
+
+
+def test_no_index_below_the_training_threshold(store):
+    ann = ANNIndex(store, m=8, train_threshold=COUNT + 1)
+    ann.refresh()
+    assert not ann.ready
+    assert ann.search(np.ones(DIMENSION), 5) is None
+
+
+def test_recall_against_brute_force(store):
+    queries = _clustered(50, 1)
+    reranked = _recall(_ann(store, nprobe=16, rerank=100), store, queries)
+    pq_only = _recall(_ann(store, nprobe=16, rerank=0), store, queries)
+    assert reranked >= 0.9
+    assert pq_only >= 0.5
+    assert reranked >= pq_only
+
+
+def test_reranked_scores_are_exact(store):
+    ann = _ann(store, nprobe=16, rerank=100)
+    query = _clustered(1, 2)[0]
+    exact = {hit["id"]: hit["score"] for hit in store.query(query, 50)}
+    for hit in ann.search(query, 10):
+        if hit["id"] in exact:
+            assert hit["score"] == pytest.approx(exact[hit["id"]], abs=1e-5)
+
+
+def test_session_filtering(store):
+    ann = _ann(store, nprobe=16, rerank=100)
+    queries = _clustered(30, 3)
+    for query in queries[:5]:
+        hits = ann.search(query, 10, "s2")
+        assert hits and all(hit["session_id"] == "s2" for hit in hits)
+    assert _recall(ann, store, queries, session_id="s2") >= 0.85
+    assert ann.search(queries[0], 10, "nobody") == []
+
+
+def test_rows_added_during_a_rebuild_are_indexed(monkeypatch):
+    store = LocalVectorStore(dimension=DIMENSION, initial_capacity=COUNT)
+    _fill(store, _clustered(2000, 4))
+    ann = ANNIndex(store, m=8, nprobe=16, rerank=100, train_threshold=10 ** 9)
+
+    # The rebuild copies the vectors before these rows arrive
+    snapshot = store.vectors().copy()
+    monkeypatch.setattr(store, "vectors", lambda: snapshot)
+    ann._building = True
+    late = _clustered(100, 5)
+    ann.add(_fill(store, late, start=2000))
+    assert not ann.ready
+
+    ann.rebuild()
+    assert ann.stats()["indexed"] == 2100
+    for i in (0, 50, 99):
+        assert ann.search(late[i], 1)[0]["id"] == f"v{2000 + i}"
+
+
+def test_reaching_the_threshold_builds_in_the_background():
+    store = LocalVectorStore(dimension=DIMENSION, initial_capacity=COUNT)
+    ann = ANNIndex(store, m=8, train_threshold=2000)
+    vectors = _clustered(2500, 6)
+    ann.add(_fill(store, vectors[:1500]))
+    assert not ann.ready
+    ann.add(_fill(store, vectors[1500:], start=1500))
+
+    deadline = time.monotonic() + 30
+    while not ann.ready and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert ann.ready
+    assert ann.search(vectors[7], 1)[0]["id"] == "v7"
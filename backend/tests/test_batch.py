@@ -0,0 +1,169 @@
+"""End-to-end tests for POST /batch.
+
+The backend runs under uvicorn against benchmarks/mock_upstreams.py, so
+request bodies arrive in real chunks and disconnects are real: the
+in-process TestClient buffers both sides and would hide the bugs these
+cover.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import subprocess
+
+import httpx
+import pytest
+
+from benchmarks.mock_upstreams import base_urls
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url: str, process: subprocess.Popen):
+    for _ in range(150):
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+@pytest.fixture(scope="module")
+def checkpoints(tmp_path_factory):
+    return tmp_path_factory.mktemp("batches")
+
+
+@pytest.fixture(scope="module")
+def server(checkpoints):
+    mock_port, app_port = _free_port(), _free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "benchmarks/mock_upstreams.py", "--port", str(mock_port),
+         "--default-latency", "5", "--sigma", "0", "--chunks", "1", "--chunk-ms", "0", "--words", "5"],
+        cwd=BACKEND,
+    )
+    env = dict(
+        os.environ,
+        **base_urls("127.0.0.1", mock_port),
+        OPENAI_API_KEY="mock",
+        GEMINI_API_KEY="mock",
+        HUGGINGFACE_API_KEY="mock",
+        OLLAMA_MAX_CONCURRENCY="32",
+        MEMORY_ENABLED="0",
+        RESPONSE_CACHE_ENABLED="0",
+        EMBEDDING_MODEL="hashing",
+        BATCH_CHECKPOINT_DIR=str(checkpoints),
+    )
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=BACKEND, env=env,
+    )
+    try:
+        _wait_until_up(f"http://127.0.0.1:{mock_port}/mock/stats", mock)
+        _wait_until_up(f"http://127.0.0.1:{app_port}/", app)
+        yield f"http://127.0.0.1:{app_port}"
+    finally:
+        for process in (app, mock):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def _lines(header: dict, prompts) -> list:
+    return [json.dumps(header) + "\n"] + [json.dumps({"id": i, "prompt": p}) + "\n" for i, p in prompts]
+
+
+def _post(server: str, body, timeout: float = 60) -> list:
+    with httpx.stream("POST", f"{server}/batch", content=body, timeout=timeout) as response:
+        assert response.status_code == 200
+        return [json.loads(line) for line in response.iter_lines() if line]
+
+
+def _batches_running(server: str) -> float:
+    for line in httpx.get(f"{server}/metrics").text.splitlines():
+        if line.startswith("batches_running"):
+            return float(line.split()[-1])
+    return 0.0
+
+
+def test_slow_chunked_body_is_read_to_the_end(server):
+    lines = _lines({"agents": ["ollama"]}, [(i, f"slow {i}") for i in range(3)])
+
+    def trickle():
+        for line in lines:
+            yield line.encode()
+            time.sleep(0.2)
+
+    records = _post(server, trickle())
+    assert sorted(r["id"] for r in records if r["type"] == "result") == ["0", "1", "2"]
+    assert records[-1]["type"] == "summary"
+    assert records[-1]["prompts"] == 3
+
+
+def test_large_body_completes(server):
+    count = 3000
+    body = "".join(_lines({"agents": ["ollama"], "concurrency": 32}, [(i, f"prompt number {i} " * 8) for i in range(count)]))
+    assert len(body) > 500_000
+
+    records = _post(server, body.encode(), timeout=120)
+    results = [r for r in records if r["type"] == "result"]
+    assert len(results) == count
+    assert {r["id"] for r in results} == {str(i) for i in range(count)}
+    assert records[-1] == {**records[-1], "type": "summary", "prompts": count}
+
+
+def test_bad_lines_are_reported_in_order(server):
+    body = "".join(_lines({"agents": ["ollama"]}, [(0, "fine")])) + "not json\n" + json.dumps({"id": 2}) + "\n"
+    records = _post(server, body.encode())
+    errors = [r for r in records if r["type"] == "error"]
+    assert [e["line"] for e in errors] == [3, 4]
+    assert [r["id"] for r in records if r["type"] == "result"] == ["0"]
+
+
+@pytest.mark.parametrize("header", [
+    {"agents": ["nope"]},
+    {"agents": ["ollama"], "concurrency": 0},
+    {"agents": ["ollama"], "batch_id": "../escape"},
+])
+def test_bad_header_is_rejected(server, header):
+    response = httpx.post(f"{server}/batch", content=json.dumps(header) + "\n", timeout=10)
+    assert response.status_code == 400
+    assert "error" in response.json()
+
+
+def test_disconnect_then_resume(server, checkpoints):
+    count = 200
+    header = {"agents": ["ollama", "openai"], "batch_id": "resume-test", "concurrency": 8}
+    body = "".join(_lines(header, [(i, f"resume {i}") for i in range(count)])).encode()
+
+    first = []
+    with httpx.stream("POST", f"{server}/batch", content=body, timeout=60) as response:
+        for line in response.iter_lines():
+            first.append(json.loads(line))
+            if len(first) == 100:
+                break
+
+    # The abandoned run stops once the client has gone.
+    deadline = time.monotonic() + 10
+    while _batches_running(server) and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert _batches_running(server) == 0
+
+    saved = {(r["id"], r["agent"]) for r in map(json.loads, open(checkpoints / "resume-test.jsonl"))}
+    assert {(r["id"], r["agent"]) for r in first if r["type"] == "result"} <= saved
+
+    second = _post(server, body)
+    summary = second[-1]
+    assert summary["type"] == "summary"
+    assert summary["skipped"] == len(saved)
+    redone = {(r["id"], r["agent"]) for r in second if r["type"] == "result"}
+    assert not redone & saved
+    assert redone | saved == {(str(i), agent) for i in range(count) for agent in ("OpenAI", "Ollama")}
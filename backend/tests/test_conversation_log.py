@@ -0,0 +1,127 @@
+"""Conversation log: group commit, segment index and recovery."""
+import asyncio
+import io
+import json
+import os
+
+from agents.conversation_log import ConversationLog, export_jsonl, iter_records
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def _log(path, **options) -> ConversationLog:
+    options.setdefault("fsync", False)
+    return ConversationLog(str(path), **options)
+
+
+async def _write(log: ConversationLog, messages):
+    await log.start()
+    for session_id, sender, text in messages:
+        log.append(session_id, sender, text)
+    await log.stop()
+
+
+def _messages(session_id: str, count: int, start: int = 0):
+    return [(session_id, "user" if n % 2 == 0 else "Agent", f"{session_id} message {n}") for n in range(start, start + count)]
+
+
+def test_load_returns_the_latest_messages_in_order(tmp_path):
+    async def scenario():
+        log = _log(tmp_path, keep=5)
+        await log.start()
+        for message in _messages("a", 8) + _messages("b", 2):
+            log.append(*message)
+        loaded = await log.load("a", 3)
+        missing = await log.load("nobody", 3)
+        await log.stop()
+        return log, loaded, missing
+
+    log, (count, messages), missing = run(scenario())
+    assert count == 8
+    assert [m["text"] for m in messages] == ["a message 5", "a message 6", "a message 7"]
+    assert messages[0]["sender"] == "Agent"
+    assert missing is None
+    assert log.message_count("b") == 2
+
+
+def test_appends_are_committed_in_batches(tmp_path):
+    async def scenario():
+        log = _log(tmp_path, flush_interval=0.05)
+        await log.start()
+        for message in _messages("a", 50):
+            log.append(*message)
+        await asyncio.sleep(0.02)
+        await log.stop()
+        return log
+
+    counters = run(scenario()).counters
+    assert counters["appended"] == 50
+    assert counters["batches"] < 5
+
+
+def test_the_index_is_rebuilt_from_sealed_segments(tmp_path):
+    # Tiny segments: every batch rolls to a new one
+    log = _log(tmp_path, segment_bytes=1, keep=4)
+
+    async def scenario():
+        await log.start()
+        for message in _messages("a", 6):
+            log.append(*message)
+            await log.flush()
+        await log.stop()
+
+    run(scenario())
+    assert len(log.segments()) == 6
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".idx")]) == 6
+
+    reopened = _log(tmp_path, keep=4)
+    reopened.open()
+    count, messages = run(reopened.load("a", 10))
+    assert count == 6
+    assert [m["text"] for m in messages] == [f"a message {n}" for n in range(2, 6)]
+
+
+def test_an_unsealed_segment_is_scanned_and_a_torn_tail_dropped(tmp_path):
+    async def scenario():
+        log = _log(tmp_path)
+        await log.start()
+        for message in _messages("a", 3):
+            log.append(*message)
+        await log.flush()
+        # Crash: no seal, and half a record at the end of the segment
+        log._task.cancel()
+        log._file.write(b'{"session_id": "a", "te')
+        log._file.close()
+
+    run(scenario())
+    reopened = _log(tmp_path)
+    reopened.open()
+    count, messages = run(reopened.load("a", 10))
+    assert count == 3
+    assert messages[-1]["text"] == "a message 2"
+
+
+def test_a_stale_segment_index_is_ignored(tmp_path):
+    run(_write(_log(tmp_path), _messages("a", 2)))
+    (segment,) = _log(tmp_path).segments()
+    # The segment grew after its index was saved
+    with open(tmp_path / segment, "ab") as f:
+        f.write((json.dumps({"session_id": "a", "ts": 0, "sender": "user", "text": "late"}) + "\n").encode())
+
+    reopened = _log(tmp_path)
+    reopened.open()
+    count, messages = run(reopened.load("a", 1))
+    assert count == 3
+    assert messages == [{"sender": "user", "text": "late"}]
+
+
+def test_export_filters_by_session_and_time(tmp_path):
+    run(_write(_log(tmp_path, segment_bytes=200), _messages("a", 4) + _messages("b", 3)))
+
+    assert [r["text"] for r in iter_records(str(tmp_path), session_id="b")] == [f"b message {n}" for n in range(3)]
+    assert list(iter_records(str(tmp_path), since=2 ** 40)) == []
+    out = io.StringIO()
+    assert export_jsonl(iter_records(str(tmp_path)), out) == 7
+    assert json.loads(out.getvalue().splitlines()[0])["text"] == "a message 0"
@@ -0,0 +1,45 @@
+"""Retry decisions of the shared HTTP pool."""
+import time
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from agents.http_pool import http_pool, parse_retry_after
+
+
+def _response(status: int, retry_after=None) -> httpx.Response:
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    return httpx.Response(status, headers=headers)
+
+
+def test_parse_retry_after_accepts_seconds_and_dates():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert 3 <= parse_retry_after(formatdate(time.time() + 5, usegmt=True)) <= 5
+    assert parse_retry_after(formatdate(time.time() - 60, usegmt=True)) == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+@pytest.fixture(autouse=True)
+def retry_settings(monkeypatch):
+    monkeypatch.setenv("HTTP_MAX_RETRIES", "2")
+    monkeypatch.setenv("HTTP_MAX_RETRY_DELAY", "10")
+
+
+def test_retry_delay_follows_retry_after():
+    assert http_pool.retry_delay(_response(429, "2"), 0) == 2.0
+    delay = http_pool.retry_delay(_response(503, formatdate(time.time() + 4, usegmt=True)), 0)
+    assert 2 <= delay <= 4
+
+
+def test_retry_delay_backs_off_without_retry_after():
+    assert http_pool.retry_delay(_response(429), 0) == 0.5
+    assert http_pool.retry_delay(_response(429, "soon"), 1) == 1.0
+
+
+def test_retry_delay_gives_up():
+    assert http_pool.retry_delay(_response(500), 0) is None
+    assert http_pool.retry_delay(_response(429, "1"), 2) is None
+    assert http_pool.retry_delay(_response(429, "60"), 0) is None
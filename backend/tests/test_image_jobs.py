@@ -0,0 +1,42 @@
+"""Parameter checking for image jobs."""
+import pytest
+
+from agents.image_jobs import ImageJobQueue, expand_variants
+
+
+def test_sweep_expands_on_top_of_params():
+    variants = expand_variants({"steps": 30}, {"seed": [1, 2], "cfg_scale": [5, 7]})
+    assert len(variants) == 4
+    assert all(variant["steps"] == 30 for variant in variants)
+    assert {(v["seed"], v["cfg_scale"]) for v in variants} == {(1, 5), (1, 7), (2, 5), (2, 7)}
+
+
+@pytest.mark.parametrize("params, sweep", [
+    ([1], None),
+    ("steps", None),
+    (3, None),
+    (None, ["seed"]),
+    (None, {"seed": 1}),
+    ({"steps": 5}, None),
+    ({"colour": "red"}, None),
+    (None, {"seed": list(range(17))}),
+])
+def test_bad_parameters_raise_value_error(params, sweep):
+    with pytest.raises(ValueError):
+        expand_variants(params, sweep)
+
+
+@pytest.mark.parametrize("job_id", [{"a": 1}, [1], 5, None])
+def test_job_ids_must_be_strings(job_id):
+    queue = ImageJobQueue(lambda: None)
+    with pytest.raises(ValueError):
+        queue.get(job_id)
+    with pytest.raises(ValueError):
+        queue.cancel(job_id)
+    assert queue.get("unknown") is None
+
+
+@pytest.mark.parametrize("prompt, context, priority", [(["x"], "", 0), ("x", 3, 0), ("x", "", "high"), ("x", "", [1])])
+def test_submit_checks_its_arguments(prompt, context, priority):
+    with pytest.raises(ValueError):
+        ImageJobQueue(lambda: None).submit(prompt, context, priority=priority)
@@ -0,0 +1,155 @@
+"""ProviderLimiter admission: queueing, refusal and AIMD."""
+import asyncio
+import time
+
+import pytest
+
+from agents.rate_limit import ProviderLimiter, RateLimited
+from agents.resilience import deadline
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _hold(limiter: ProviderLimiter, release: asyncio.Event, tokens: int = 0):
+    async with limiter.admit(tokens):
+        await release.wait()
+
+
+def test_callers_queue_in_order_for_a_free_slot():
+    async def scenario():
+        limiter = ProviderLimiter("test", max_concurrency=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0)
+        order = []
+
+        async def waiter(n):
+            async with limiter.admit():
+                order.append(n)
+
+        waiters = [asyncio.create_task(waiter(n)) for n in range(3)]
+        await asyncio.sleep(0.01)
+        assert order == [] and limiter.stats()["waiting"] == 3
+        release.set()
+        await asyncio.gather(holder, *waiters)
+        return order, limiter
+
+    order, limiter = run(scenario())
+    assert order == [0, 1, 2]
+    assert limiter.in_flight == 0
+    assert limiter.counters["queued"] == 3
+
+
+def test_a_full_queue_refuses_at_once():
+    async def scenario():
+        limiter = ProviderLimiter("test", max_concurrency=1, max_queue=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        with pytest.raises(RateLimited):
+            async with limiter.admit():
+                pass
+        refused_in = time.monotonic() - started
+        release.set()
+        await asyncio.gather(holder, queued)
+        return limiter, refused_in
+
+    limiter, refused_in = run(scenario())
+    assert refused_in < 0.05
+    assert limiter.counters["rejected"] == 1
+    assert limiter.in_flight == 0
+
+
+def test_waiting_gives_up_at_max_wait():
+    async def scenario():
+        limiter = ProviderLimiter("test", max_concurrency=1, max_wait=0.1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        with pytest.raises(RateLimited) as refused:
+            async with limiter.admit():
+                pass
+        waited = time.monotonic() - started
+        release.set()
+        await holder
+        return limiter, waited, refused.value
+
+    limiter, waited, error = run(scenario())
+    assert 0.08 <= waited < 0.5
+    assert error.retry_after == pytest.approx(0.1)
+    assert limiter.stats()["waiting"] == 0
+    assert limiter.in_flight == 0
+
+
+def test_waiting_gives_up_at_the_deadline():
+    async def scenario():
+        limiter = ProviderLimiter("test", max_concurrency=1, max_wait=10)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        with deadline(0.1):
+            with pytest.raises(RateLimited):
+                async with limiter.admit():
+                    pass
+        waited = time.monotonic() - started
+        release.set()
+        await holder
+        return waited
+
+    assert run(scenario()) < 0.5
+
+
+def test_a_request_budget_that_cannot_be_met_in_time_is_refused():
+    async def scenario():
+        limiter = ProviderLimiter("test", max_concurrency=4, rpm=60, max_wait=0.5)
+        limiter.requests.tokens = 0.0
+        # The next request is due in a second: too long to wait
+        with pytest.raises(RateLimited) as refused:
+            async with limiter.admit():
+                pass
+        return limiter, refused.value
+
+    limiter, error = run(scenario())
+    assert error.retry_after == pytest.approx(1.0, abs=0.1)
+    assert limiter.in_flight == 0
+    # The refused request did not spend budget
+    assert limiter.requests.available() == pytest.approx(0.0, abs=0.1)
+
+
+def test_a_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        limiter = ProviderLimiter("test", max_concurrency=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.stats()["waiting"] == 0
+        release.set()
+        await holder
+        return limiter
+
+    assert run(scenario()).in_flight == 0
+
+
+def test_throttling_halves_the_limit_and_success_restores_it():
+    limiter = ProviderLimiter("test", max_concurrency=8, cooldown=0)
+    limiter.observe(429, None)
+    assert limiter.limit == 4
+    limiter.observe(503, 2.0)
+    assert limiter.limit == 2
+    assert limiter.stats()["paused_for"] == pytest.approx(2.0, abs=0.1)
+    for _ in range(100):
+        limiter.observe(200, None)
+    assert limiter.limit == 8
+    # Still inside the provider's Retry-After pause
+    assert not limiter.has_capacity()
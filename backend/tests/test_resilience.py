@@ -0,0 +1,173 @@
+"""Circuit breaker and request hedging."""
+import asyncio
+
+import pytest
+
+from agents.base import BaseAgent
+from agents.rate_limit import ProviderLimiter, rate_limiter
+from agents.resilience import CircuitBreaker, provider_health
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controls time.monotonic as seen by the breaker."""
+    now = [1000.0]
+    monkeypatch.setattr("agents.resilience.time.monotonic", lambda: now[0])
+    return now
+
+
+def _open(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.rejecting
+    assert not breaker.allow()
+    assert breaker.snapshot()["short_circuited"] == 1
+
+
+def test_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 29
+    assert not breaker.allow()
+    clock[0] += 1
+    assert not breaker.rejecting
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Everyone else waits for the probe's verdict
+    assert breaker.rejecting
+    assert not breaker.allow()
+
+
+def test_a_successful_probe_closes_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_a_failed_probe_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.snapshot()["retry_in"] == 30
+    assert not breaker.allow()
+
+
+def test_an_abandoned_probe_frees_the_slot(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    _open(breaker)
+    clock[0] += 30
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+class SlowAgent(BaseAgent):
+    """Answers after ``latency`` seconds, counting the calls it gets."""
+
+    name = "Slow"
+
+    def __init__(self, provider: str, latency: float):
+        self.provider = provider
+        self.latency = latency
+        self.calls = 0
+        self.most_in_flight = 0
+        self.in_flight = 0
+
+    async def _generate_response(self, prompt, context, config=None):
+        self.calls += 1
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        return self._result("ok", "success")
+
+
+@pytest.fixture
+def hedged_provider(monkeypatch, request):
+    provider = f"hedge-test-{request.node.name}"
+    monkeypatch.setattr(provider_health, "hedge_providers", {provider})
+    # p95 of 10ms: a call still running after that gets a hedge
+    for _ in range(20):
+        provider_health.latency(provider).record(0.01)
+    yield provider
+    rate_limiter.limiters.pop(provider, None)
+
+
+def _guarded(agent: SlowAgent):
+    return agent._guarded(agent._generate_response, "prompt", "")
+
+
+def test_hedge_is_sent_when_the_limiter_has_room(hedged_provider):
+    rate_limiter.limiters[hedged_provider] = ProviderLimiter(hedged_provider, max_concurrency=2)
+    agent = SlowAgent(hedged_provider, 0.1)
+    sent = provider_health.hedges
+
+    assert asyncio.run(_guarded(agent))["status"] == "success"
+    assert agent.calls == 2
+    assert provider_health.hedges == sent + 1
+    # Both copies were admitted by the limiter
+    assert rate_limiter.limiters[hedged_provider].counters["admitted"] == 2
+    assert rate_limiter.limiters[hedged_provider].in_flight == 0
+
+
+def test_hedge_is_skipped_at_the_concurrency_limit(hedged_provider):
+    rate_limiter.limiters[hedged_provider] = ProviderLimiter(hedged_provider, max_concurrency=1)
+    agent = SlowAgent(hedged_provider, 0.1)
+    skipped = provider_health.hedges_skipped
+
+    assert asyncio.run(_guarded(agent))["status"] == "success"
+    assert agent.calls == 1
+    assert provider_health.hedges_skipped == skipped + 1
+
+
+def test_hedge_is_skipped_without_request_budget(hedged_provider):
+    # One request per minute: the first call spends it
+    rate_limiter.limiters[hedged_provider] = ProviderLimiter(hedged_provider, max_concurrency=4, rpm=1)
+    limiter = rate_limiter.limiters[hedged_provider]
+    limiter.requests.tokens = 1.0
+    agent = SlowAgent(hedged_provider, 0.1)
+
+    assert asyncio.run(_guarded(agent))["status"] == "success"
+    assert agent.calls == 1
+    assert agent.most_in_flight == 1
+
+
+class FailingAgent(SlowAgent):
+    async def _generate_response(self, prompt, context, config=None):
+        self.calls += 1
+        return self._result("broken", "error")
+
+
+def test_an_open_breaker_stops_calls_to_the_provider(monkeypatch, request):
+    provider = f"breaker-test-{request.node.name}"
+    monkeypatch.setitem(provider_health.breakers, provider, CircuitBreaker(failure_threshold=2, reset_timeout=30))
+    agent = FailingAgent(provider, 0)
+
+    results = [asyncio.run(_guarded(agent)) for _ in range(4)]
+    assert [r["status"] for r in results] == ["error", "error", "unavailable", "unavailable"]
+    assert results[-1]["reason"] == "circuit_open"
+    assert agent.calls == 2
+    rate_limiter.limiters.pop(provider, None)
@@ -0,0 +1,95 @@
+"""TurnRouter.plan with stand-in agents: which agents a prompt reaches."""
+import pytest
+
+from agents.router import TurnRouter
+
+
+class Agent:
+    local_kinds = ()
+    turn_cost = 1.0
+
+    def __init__(self, name: str):
+        self.name = name
+        self.provider = f"router-test-{name.lower()}"
+
+
+class Painter(Agent):
+    # Draws; its text reply is canned
+    local_kinds = ("text",)
+
+    async def generate_image(self, prompt: str):
+        return {}
+
+
+class Agents:
+    def __init__(self, **agents):
+        self.agents = agents
+        self.keys = list(agents)
+
+    def get(self, key: str):
+        return self.agents.get(key)
+
+    def display_name(self, key: str):
+        return self.agents[key].name
+
+
+@pytest.fixture
+def router():
+    return TurnRouter(Agents(writer=Agent("Writer"), critic=Agent("Critic"), painter=Painter("Painter")))
+
+
+def _calls(plan):
+    return {agent.name: kind for agent, kind in plan.calls}
+
+
+@pytest.mark.parametrize("prompt", [
+    "Draw me a picture of a lighthouse at dusk",
+    "Please generate an image of a red fox",
+    "I like cats. Can you make a watercolor painting of one?",
+])
+def test_explicit_requests_go_to_the_image_agent(router, prompt):
+    plan = router.plan(prompt)
+    assert plan.route == "image"
+    assert _calls(plan) == {"Painter": "image"}
+    assert plan.skipped == {"Writer": "intent", "Critic": "intent"}
+
+
+@pytest.mark.parametrize("prompt", [
+    "How do I create an image classifier in PyTorch?",
+    "Can you design a logo strategy for my startup?",
+    "draw conclusions from this data",
+    "show me the pictures of the proof",
+    "Explain how to render a portrait mode photo in CSS",
+    "What is the capital of France?",
+])
+def test_text_questions_reach_the_text_agents(router, prompt):
+    plan = router.plan(prompt)
+    assert plan.route == "default"
+    calls = _calls(plan)
+    assert calls["Writer"] == calls["Critic"] == "text"
+    assert "intent" not in plan.skipped.values()
+
+
+def test_ambiguous_prompts_add_the_image_agent(router):
+    plan = router.plan("Can you design a logo strategy for my startup?")
+    assert _calls(plan) == {"Writer": "text", "Critic": "text", "Painter": "image"}
+
+
+@pytest.mark.parametrize("prompt", ["draw conclusions from this data", "What is the capital of France?"])
+def test_plain_text_prompts_skip_the_image_agent(router, prompt):
+    plan = router.plan(prompt)
+    assert _calls(plan) == {"Writer": "text", "Critic": "text"}
+    assert plan.skipped == {"Painter": "no_text"}
+
+
+def test_mentions_and_client_subsets(router):
+    plan = router.plan("@critic what do you think?")
+    assert plan.route == "mention"
+    assert plan.prompt == "what do you think?"
+    assert _calls(plan) == {"Critic": "text"}
+
+    plan = router.plan("hello", requested=["Writer"])
+    assert plan.route == "client"
+    assert _calls(plan) == {"Writer": "text"}
+
+    assert router.plan("hello", requested=["nobody"]).calls == []
@@ -0,0 +1,160 @@
+"""Coalescing of identical concurrent calls and streams."""
+import asyncio
+
+import pytest
+
+from agents.single_flight import SingleFlight
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class Upstream:
+    """A fake provider call that waits for ``release`` before answering."""
+
+    def __init__(self):
+        self.calls = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def call(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return {"response": "hello", "status": "success"}
+
+    async def stream(self, frames: int = 4, fail: bool = False):
+        self.calls += 1
+        for n in range(frames):
+            yield {"type": "chunk", "n": n}
+            await self.release.wait()
+            self.release.clear()
+        if fail:
+            raise RuntimeError("upstream broke")
+        yield {"type": "done"}
+
+
+def test_identical_calls_share_one_upstream_call():
+    async def scenario():
+        flights, upstream = SingleFlight(enabled=True), Upstream()
+        callers = [asyncio.create_task(flights.call("A", "k", upstream.call)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        assert flights.stats()["calls_in_flight"] == 1
+        upstream.release.set()
+        results = await asyncio.gather(*callers)
+        return flights, upstream, results
+
+    flights, upstream, results = run(scenario())
+    assert upstream.calls == 1
+    assert all(result["response"] == "hello" for result in results)
+    # Each caller gets its own copy to annotate
+    results[0]["agent"] = "mine"
+    assert "agent" not in results[1]
+    assert flights.stats()["calls_in_flight"] == 0
+
+
+def test_a_cancelled_caller_leaves_the_others_waiting():
+    async def scenario():
+        flights, upstream = SingleFlight(enabled=True), Upstream()
+        first = asyncio.create_task(flights.call("A", "k", upstream.call))
+        second = asyncio.create_task(flights.call("A", "k", upstream.call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        upstream.release.set()
+        return upstream, await second
+
+    upstream, result = run(scenario())
+    assert result["status"] == "success"
+    assert upstream.calls == 1 and upstream.cancelled == 0
+
+
+def test_the_upstream_call_is_cancelled_once_nobody_waits():
+    async def scenario():
+        flights, upstream = SingleFlight(enabled=True), Upstream()
+        callers = [asyncio.create_task(flights.call("A", "k", upstream.call)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        # A new caller starts afresh instead of joining the abandoned call
+        upstream.release.set()
+        result = await flights.call("A", "k", upstream.call)
+        return upstream, result
+
+    upstream, result = run(scenario())
+    assert upstream.cancelled == 1
+    assert upstream.calls == 2
+    assert result["status"] == "success"
+
+
+def test_a_late_stream_joiner_replays_then_follows_live():
+    async def collect(flights, upstream, received):
+        async for frame in flights.stream("A", "k", upstream.stream):
+            received.append(frame)
+
+    async def scenario():
+        flights, upstream = SingleFlight(enabled=True), Upstream()
+        early, late = [], []
+        first = asyncio.create_task(collect(flights, upstream, early))
+        await asyncio.sleep(0.01)
+        upstream.release.set()
+        await asyncio.sleep(0.01)
+        assert len(early) == 2
+        second = asyncio.create_task(collect(flights, upstream, late))
+        await asyncio.sleep(0.01)
+        # The joiner has caught up on what was already streamed
+        assert late == early
+        while not first.done():
+            upstream.release.set()
+            await asyncio.sleep(0.01)
+        await asyncio.gather(first, second)
+        return flights, upstream, early, late
+
+    flights, upstream, early, late = run(scenario())
+    assert upstream.calls == 1
+    assert [frame.get("n") for frame in early] == [0, 1, 2, 3, None]
+    assert late == early
+    assert flights.stats()["streams_in_flight"] == 0
+
+
+def test_a_stream_error_reaches_every_follower():
+    async def collect(flights, upstream):
+        received = []
+        async for frame in flights.stream("A", "k", lambda: upstream.stream(frames=2, fail=True)):
+            received.append(frame)
+        return received
+
+    async def scenario():
+        flights, upstream = SingleFlight(enabled=True), Upstream()
+        followers = [asyncio.create_task(collect(flights, upstream)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        while not all(follower.done() for follower in followers):
+            upstream.release.set()
+            await asyncio.sleep(0.01)
+        return upstream, await asyncio.gather(*followers, return_exceptions=True)
+
+    upstream, outcomes = run(scenario())
+    assert upstream.calls == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+
+
+@pytest.mark.parametrize("mode", ["call", "stream"])
+def test_disabled_single_flight_calls_upstream_every_time(mode):
+    async def once(flights, upstream):
+        if mode == "call":
+            return await flights.call("A", "k", upstream.call)
+        return [frame async for frame in flights.stream("A", "k", lambda: upstream.stream(frames=0))]
+
+    async def scenario():
+        flights, upstream = SingleFlight(enabled=False), Upstream()
+        upstream.release.set()
+        await asyncio.gather(once(flights, upstream), once(flights, upstream))
+        return upstream
+
+    assert run(scenario()).calls == 2
@@ -0,0 +1,102 @@
+"""LocalVectorStore queries and persistence."""
+import os
+
+import numpy as np
+import pytest
+
+from agents.vector_store import LocalVectorStore
+
+DIMENSION = 16
+
+
+def _items(start: int, count: int, session: str = "s1", seed: int = 0):
+    rng = np.random.default_rng(seed + start)
+    return [
+        (f"v{i}", rng.standard_normal(DIMENSION).tolist(), {"session_id": session, "n": i})
+        for i in range(start, start + count)
+    ]
+
+
+def _same(a: LocalVectorStore, b: LocalVectorStore):
+    assert a.count == b.count
+    np.testing.assert_allclose(a.vectors(), b.vectors())
+    for vector_id, row in a._rows.items():
+        assert b._rows[vector_id] == row
+        assert b._metadata[row] == a._metadata[row]
+
+
+def test_query_finds_the_nearest_vector_within_a_session():
+    store = LocalVectorStore(dimension=DIMENSION, initial_capacity=4)
+    store.upsert(_items(0, 50, "a") + _items(50, 50, "b"))
+    target = np.asarray(store.take(np.asarray([70]))[0])
+
+    assert store.query(target, top_k=1)[0]["id"] == "v70"
+    assert store.query(target, top_k=1, session_id="b")[0]["id"] == "v70"
+    assert all(hit["session_id"] == "a" for hit in store.query(target, top_k=5, session_id="a"))
+    assert store.query(target, session_id="nobody") == []
+    assert store.session_size("a") == 50
+
+
+def test_save_and_load_round_trip(tmp_path):
+    store = LocalVectorStore(dimension=DIMENSION, path=str(tmp_path))
+    store.upsert(_items(0, 20))
+    store.save()
+    store.upsert(_items(20, 5) + [("v3", np.ones(DIMENSION).tolist(), {"session_id": "s2"})])
+    store.save()
+
+    loaded = LocalVectorStore(dimension=DIMENSION, path=str(tmp_path))
+    _same(store, loaded)
+    assert loaded.session_size("s2") == 1
+    assert loaded.query(np.ones(DIMENSION), top_k=1, session_id="s2")[0]["id"] == "v3"
+
+
+def test_saves_append_until_the_log_outgrows_the_snapshot(tmp_path):
+    store = LocalVectorStore(dimension=DIMENSION, path=str(tmp_path), compact_ratio=1.0)
+    store.upsert(_items(0, 100))
+    store.save()
+    snapshot = os.stat(tmp_path / "vectors.npy").st_mtime_ns
+
+    for start in range(100, 200, 10):
+        store.upsert(_items(start, 10))
+        store.save()
+    # 100 logged rows against a 100-row snapshot: still appending
+    assert os.stat(tmp_path / "vectors.npy").st_mtime_ns == snapshot
+    assert os.path.getsize(tmp_path / "vectors.log") == 100 * DIMENSION * 4
+
+    store.upsert(_items(200, 1))
+    store.save()
+    assert not os.path.exists(tmp_path / "vectors.log")
+    _same(store, LocalVectorStore(dimension=DIMENSION, path=str(tmp_path)))
+
+
+def test_a_torn_log_tail_is_dropped(tmp_path):
+    store = LocalVectorStore(dimension=DIMENSION, path=str(tmp_path))
+    store.upsert(_items(0, 10))
+    store.save()
+    store.upsert(_items(10, 3))
+    store.save()
+    # A crash mid-append: half a vector and half a record line
+    with open(tmp_path / "vectors.log", "ab") as f:
+        f.write(b"\0" * (DIMENSION * 2))
+    with open(tmp_path / "records.log", "a") as f:
+        f.write('["v99", {"sess')
+
+    loaded = LocalVectorStore(dimension=DIMENSION, path=str(tmp_path))
+    _same(store, loaded)
+    loaded.upsert(_items(13, 2))
+    loaded.save()
+    reloaded = LocalVectorStore(dimension=DIMENSION, path=str(tmp_path))
+    _same(loaded, reloaded)
+    assert reloaded.count == 15
+
+
+@pytest.mark.parametrize("compact_ratio", [0.0, 1.0])
+def test_saving_elsewhere_keeps_pending_rows(tmp_path, compact_ratio):
+    store = LocalVectorStore(dimension=DIMENSION, path=str(tmp_path / "main"), compact_ratio=compact_ratio)
+    store.upsert(_items(0, 10))
+    store.save()
+    store.upsert(_items(10, 5))
+    store.save(str(tmp_path / "copy"))
+    store.save()
+    _same(store, LocalVectorStore(dimension=DIMENSION, path=str(tmp_path / "main")))
+    assert LocalVectorStore(dimension=DIMENSION, path=str(tmp_path / "copy")).count == 15
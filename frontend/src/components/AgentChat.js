@@ -23,6 +23,16 @@ const PERSONALITY_EMOJIS = {
   'visual_artist': '🖼️'
 };
 
+// One conversation per browser tab; reconnects resume it on any backend worker
+const sessionId = () => {
+  let id = sessionStorage.getItem('agentSessionId');
+  if (!id) {
+    id = crypto.randomUUID();
+    sessionStorage.setItem('agentSessionId', id);
+  }
+  return id;
+};
+
 export default function AgentChat({ onLoadingChange }) {
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState('');
@@ -60,7 +70,7 @@ export default function AgentChat({ onLoadingChange }) {
   const connectWebSocket = () => {
     try {
       setConnectionStatus('connecting');
-      ws.current = new WebSocket('ws://localhost:8000/ws/agents');
+      ws.current = new WebSocket(`ws://localhost:8000/ws/agents?session=${sessionId()}`);
       
       ws.current.onopen = () => {
         setConnectionStatus('connected');
@@ -79,10 +89,14 @@ export default function AgentChat({ onLoadingChange }) {
         const match = messageText.match(/^(\w+)\s*([🧠🎨⚖️🔒🖼️🤖]*): (.*)$/);
         
         if (match) {
-          const [, agentName, emoji, response] = match;
+          const [, agentName, emoji, reply] = match;
+          // Generated images arrive as a trailing /images/{id} handle
+          const image = reply.match(/^(.*) (\/images\/\w+)$/);
+          const response = image ? image[1] : reply;
           setMessages((msgs) => [...msgs, { 
             sender: agentName, 
             text: response,
+            image_url: image ? image[2] : undefined,
             emoji: emoji,
             timestamp: new Date()
           }]);
@@ -297,16 +311,16 @@ export default function AgentChat({ onLoadingChange }) {
                     {msg.text}
                   </Text>
                   
-                  {msg.image_data && (
+                  {(msg.image_url || msg.image_data) && (
                     <Image 
-                      src={`data:image/png;base64,${msg.image_data}`}
+                      src={msg.image_url ? `http://localhost:8000${msg.image_url}` : `data:image/png;base64,${msg.image_data}`}
                       alt="Generated image"
                       maxW="200px"
                       mt={2}
                       borderRadius="md"
                       cursor="pointer"
                       onClick={() => {
-                        setSelectedImage(`data:image/png;base64,${msg.image_data}`);
+                        setSelectedImage(msg.image_url ? `http://localhost:8000${msg.image_url}` : `data:image/png;base64,${msg.image_data}`);
                         onOpen();
                       }}
                     />
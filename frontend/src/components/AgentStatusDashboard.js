@@ -13,6 +13,7 @@ const AgentStatusDashboard = ({ agents, activeConnections, isLoading }) => {
     switch(status) {
       case 'ready': return 'green';
       case 'working': return 'blue';
+      case 'degraded': return 'yellow';
       case 'error': return 'red';
       default: return 'gray';
     }